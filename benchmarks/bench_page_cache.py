@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import Page_Cache as page_cache  # noqa: E402
+
+""" Benchmark of the page cache left to a hot working set, and taken by the backup, in each read mode"""
+
+
+def write_file(path, size_mb):
+    with open(path, "wb") as fo:
+        for _ in range(size_mb):
+            fo.write(os.urandom(1024 * 1024))
+        fo.flush()
+        os.fsync(fo.fileno())
+
+
+def drop_file(path):
+    """ Push a file out of the page cache, it has been fsynced so its pages are clean """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        page_cache.fadvise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+    finally:
+        os.close(fd)
+
+
+def warm_file(path):
+    with open(path, "rb") as fi:
+        while fi.read(1024 * 1024):
+            pass
+
+
+def residency(paths):
+    """ Return the percentage of the pages of the files held in the page cache """
+    resident_total = 0
+    page_total = 0
+    for path in paths:
+        page_counts = page_cache.path_residency(path)
+        if page_counts is None:
+            raise SystemExit("mincore is not available on this platform")
+        resident_total += page_counts[0]
+        page_total += page_counts[1]
+    return 100.0 * resident_total / max(page_total, 1)
+
+
+def archive_tree(tree_paths, read_mode):
+    """ Tar the files the way write_tar_file reads them, into /dev/null so only the reads touch the cache """
+    start = time.perf_counter()
+    with open(os.devnull, "wb") as null_out, tarfile.open(fileobj=null_out, mode="w") as tar_out:
+        for path in tree_paths:
+            with page_cache.open_member(path, read_mode) as fi:
+                tar_out.addfile(tar_out.gettarinfo(path), fi)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the page cache residency of a hot working set "
+                                                 "and of the backed up files before and after a backup")
+    parser.add_argument("-hot_mb", type=int, default=64, help="size of the hot working set")
+    parser.add_argument("-tree_mb", type=int, default=512, help="total size of the backed up tree")
+    parser.add_argument("-file_mb", type=int, default=128, help="size of each backed up file")
+    parser.add_argument("-modes", nargs="+", choices=page_cache.READ_MODES, default=list(page_cache.READ_MODES))
+    parser.add_argument("-work_dir", help="directory on the filesystem to measure, tmpfs keeps every page")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        hot_path = os.path.join(work_dir, "hot.dat")
+        write_file(hot_path, args.hot_mb)
+        tree_paths = []
+        for file_index in range(max(1, args.tree_mb // args.file_mb)):
+            tree_paths.append(os.path.join(work_dir, f"file_{file_index:04d}.dat"))
+            write_file(tree_paths[-1], args.file_mb)
+        tree_mb = len(tree_paths) * args.file_mb
+
+        print(f"{'mode':10s} {'hot before':>10s} {'hot after':>10s} {'tree after':>10s} {'MB/s':>8s}")
+        for read_mode in args.modes:
+            for path in tree_paths:
+                drop_file(path)
+            warm_file(hot_path)
+            hot_before = residency([hot_path])
+            elapsed = archive_tree(tree_paths, read_mode)
+            print(f"{read_mode:10s} {hot_before:9.1f}% {residency([hot_path]):9.1f}% "
+                  f"{residency(tree_paths):9.1f}% {tree_mb / elapsed:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
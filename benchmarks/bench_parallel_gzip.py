@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import Parallel_Gzip as pgz  # noqa: E402
+
+""" Benchmark of the single threaded tarfile w:gz path against the block parallel gzip writer"""
+
+
+def build_source_tree(source_dir, total_mb, file_mb):
+    """
+    This function writes a tree of half compressible files, text like data mixed with random bytes
+    """
+    words = [b"backup", b"storage", b"fileset", b"include", b"archive", b"version", b"daily", b"weekly"]
+    rng = random.Random(1234)
+    file_count = max(1, total_mb // file_mb)
+    for file_index in range(file_count):
+        with open(os.path.join(source_dir, f"file_{file_index:04d}.dat"), "wb") as fo:
+            for _ in range(file_mb * 16):
+                text = b" ".join(rng.choice(words) for _ in range(4096))[:32 * 1024]
+                fo.write(text + os.urandom(32 * 1024))
+    return file_count * file_mb
+
+
+def time_single_threaded(source_dir, target, compresslevel):
+    start = time.perf_counter()
+    with tarfile.open(target, "w:gz", compresslevel=compresslevel) as tar_out:
+        tar_out.add(source_dir, recursive=True)
+    return time.perf_counter() - start
+
+
+def time_parallel(source_dir, target, workers, block_size, compresslevel):
+    start = time.perf_counter()
+    with pgz.ParallelGzipWriter(target, compresslevel=compresslevel, workers=workers,
+                                block_size=block_size) as gz_out:
+        with tarfile.open(fileobj=gz_out, mode="w") as tar_out:
+            tar_out.add(source_dir, recursive=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare tarfile w:gz against ParallelGzipWriter throughput")
+    parser.add_argument("-size_mb", type=int, default=256, help="total size of the synthetic source tree")
+    parser.add_argument("-file_mb", type=int, default=16, help="size of each synthetic file")
+    parser.add_argument("-workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("-block_mb", type=int, default=1, help="block size in MB of the parallel writer")
+    parser.add_argument("-level", type=int, default=9, choices=range(1, 10),
+                        help="gzip level of both writers, 9 as the GZIP codec and tarfile w:gz default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_dir = os.path.join(work_dir, "source")
+        os.makedirs(source_dir)
+        size_mb = build_source_tree(source_dir, args.size_mb, args.file_mb)
+        target = os.path.join(work_dir, "bench.tgz")
+
+        elapsed = time_single_threaded(source_dir, target, args.level)
+        print(f"tarfile w:gz level {args.level}     {size_mb / elapsed:8.1f} MB/s  "
+              f"{os.path.getsize(target) / (1024 * 1024):8.1f} MB out")
+
+        for workers in sorted(set(args.workers)):
+            elapsed = time_parallel(source_dir, target, workers, args.block_mb * 1024 * 1024, args.level)
+            print(f"parallel {workers:3d} workers     {size_mb / elapsed:8.1f} MB/s  "
+                  f"{os.path.getsize(target) / (1024 * 1024):8.1f} MB out")
+            with tarfile.open(target, "r:gz") as tar_in:
+                assert len(tar_in.getmembers()) > 1
+
+
+if __name__ == '__main__':
+    main()
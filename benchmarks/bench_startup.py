@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+""" Benchmark of the python -X importtime cost paid by each PythonBackup mode over a run"""
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# command line of each mode, run against the sandbox built by build_sandbox
+MODE_ARGUMENTS = {
+    "run_frequency": ["-run_frequency", "DAILY"],
+    "restore": ["-restore", "StartupSet", "-restore_to", "{sandbox}/restored"],
+    "report": ["-report"],
+    "upd_general": ["-upd_general"],
+    "reload": ["-reload"],
+    "refresh_sizes": ["-refresh_sizes"],
+}
+
+
+def build_sandbox(sandbox_dir):
+    """
+    This function copies the scripts next to a resource directory of their own, with a workbook whose
+    sets, RootPaths and GeneralList point at a small tree in the sandbox, so every mode can be run
+    for real without touching the resource directory, the home directory or the configured file systems
+    """
+    import openpyxl
+    shutil.copytree(SRC_PATH, os.path.join(sandbox_dir, "src"), ignore=shutil.ignore_patterns("__pycache__"))
+    for folder in ("resource", "home", "storage", "general", "restored"):
+        os.makedirs(os.path.join(sandbox_dir, folder))
+    tree_dir = os.path.join(sandbox_dir, "tree")
+    for folder_index in range(3):
+        os.makedirs(os.path.join(tree_dir, f'folder_{folder_index}'))
+        for file_index in range(10):
+            with open(os.path.join(tree_dir, f'folder_{folder_index}', f'file_{file_index}.txt'), "w") as fo:
+                fo.write(f'{folder_index} {file_index}\n' * 100)
+
+    wb = openpyxl.Workbook(write_only=True)
+    app_config = wb.create_sheet("AppConfig")
+    app_config.append(["ConfigKey", "Value1", "Value2", "Value3", "Value4", "Value5"])
+    app_config.append(["Backup_Frequencies", "DAILY", "WEEKLY", "MONTHLY", "YEARLY", "ARCHIVE"])
+    app_config.append(["Storage_Device_Types", "DISK", "USB-STICK", "FILE", "CDROM", "EXTERNALDISK"])
+    app_config.append(["Log_Level", "INFO"])
+    root_paths = wb.create_sheet("RootPaths")
+    root_paths.append(["Index", "RootPath", "MaxDepth", "FilesFolders"])
+    root_paths.append([0, tree_dir, tree_dir.count(os.sep) + 1, "Folders"])
+    backup_sets = wb.create_sheet("BackupSets")
+    backup_sets.append(["Index", "BackupSetName", "StorageSetName", "FileSetName", "Versions", "Frequency"])
+    backup_sets.append([0, "StartupSet", "StartupStorage", "StartupFiles", 2, "Daily"])
+    storage_sets = wb.create_sheet("StorageSets")
+    storage_sets.append(["Index", "StorageSetName", "StoragePath", "DeviceType", "StorageFormat"])
+    storage_sets.append([0, "StartupStorage", os.path.join(sandbox_dir, "storage"), "Disk", None])
+    file_sets = wb.create_sheet("FileSets")
+    file_sets.append(["Index", "FileSetName", "Includes", "Excludes", "Compress", "Recurse"])
+    file_sets.append([0, "StartupFiles", tree_dir, "NA", "YES", "YES"])
+    general_list = wb.create_sheet("GeneralList")
+    general_list.append(["Index", "SourceFile_FolderName", "TargetFolder", "Estimated Size"])
+    general_list.append([0, os.path.join(tree_dir, "folder_0"), os.path.join(sandbox_dir, "general"), 0])
+    fs_size = wb.create_sheet("FS_SIZE")
+    fs_size.append(["Index", "Path", "Size"])
+    wb.save(os.path.join(sandbox_dir, "resource", "BackupList.xlsx"))
+
+
+def mode_import_time_us(sandbox_dir, mode_arguments):
+    """
+    This function runs one PythonBackup mode in a fresh interpreter, with the sandbox as its home directory
+    :return: total import time in microseconds as reported by -X importtime, the modes' return code
+    """
+    command = [sys.executable, "-X", "importtime", os.path.join(sandbox_dir, "src", "PythonBackup.py")]
+    command += [argument.format(sandbox=sandbox_dir) for argument in mode_arguments]
+    completed = subprocess.run(command, cwd=sandbox_dir, env=dict(os.environ, HOME=os.path.join(sandbox_dir, "home")),
+                               capture_output=True, text=True)
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:"):
+            self_us = line.split("|")[0].split(":")[1].strip()
+            if self_us.isdigit():
+                total_us += int(self_us)
+    return total_us, completed.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the import time of every PythonBackup mode")
+    parser.add_argument("-runs", type=int, default=5, help="runs per mode, the fastest run is kept")
+    parser.add_argument("-output", help="write the results to this JSON file")
+    parser.add_argument("-baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("-threshold", type=float, default=1.25,
+                        help="fail when a mode is slower than the baseline by this factor")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as sandbox_dir:
+        build_sandbox(sandbox_dir)
+        # one untimed run of every mode compiles the scripts and the workbook cache and writes the
+        # archive restored by -restore
+        for mode, mode_arguments in MODE_ARGUMENTS.items():
+            _, mode_rc = mode_import_time_us(sandbox_dir, mode_arguments)
+            if mode_rc != 0:
+                print(f"{mode} returned {mode_rc}, its import time may not cover the whole mode")
+        for mode, mode_arguments in MODE_ARGUMENTS.items():
+            results[mode] = min(mode_import_time_us(sandbox_dir, mode_arguments)[0]
+                                for _ in range(max(args.runs, 1)))
+            print(f"{mode:15s} {results[mode] / 1000:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as fo:
+            json.dump(results, fo, indent=2)
+
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline) as fi:
+            baseline = json.load(fi)
+        for mode, total_us in results.items():
+            if mode in baseline and total_us > baseline[mode] * args.threshold:
+                print(f"{mode} regressed: {total_us / 1000:.1f} ms against {baseline[mode] / 1000:.1f} ms")
+                regressions += 1
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import Chunk_Repository as chunk_repo  # noqa: E402
+import Config_Backend as cb  # noqa: E402
+import Config_Cache as config_cache  # noqa: E402
+import PythonBackup as pb  # noqa: E402
+
+""" Benchmark suite timing each subsystem end to end on synthetic trees and workbooks, against a stored baseline"""
+
+SUBSYSTEMS = ("write_tar_file", "write_snapshot", "walklevel", "getFolderSize", "excelSetsConvert",
+              "chunk_boundary")
+TREES = ("tiny_files", "huge_files", "deep_nesting", "sparse", "incompressible")
+WORKBOOK_ROWS = (10, 1000, 100000)
+MB = 1024 * 1024
+
+
+def half_compressible(rng, size):
+    """ Return text like data mixed with random bytes, as most backed up files are """
+    words = [b"backup", b"storage", b"fileset", b"include", b"archive", b"version", b"daily", b"weekly"]
+    text = b" ".join(rng.choice(words) for _ in range(size // 14 + 1))[:size // 2]
+    return text + rng.randbytes(size - len(text))
+
+
+def build_tiny_files(tree_dir, rng, scale):
+    """ Many files of a few hundred bytes spread over 100 folders """
+    for file_index in range(int(20000 * scale)):
+        folder = os.path.join(tree_dir, f'dir_{file_index % 100:03d}')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'file_{file_index:06d}.txt'), "wb") as fo:
+            fo.write(half_compressible(rng, rng.randint(0, 2048)))
+
+
+def build_huge_files(tree_dir, rng, scale):
+    """ A few files of hundreds of MB """
+    for file_index in range(3):
+        with open(os.path.join(tree_dir, f'huge_{file_index}.dat'), "wb") as fo:
+            for _ in range(max(1, int(128 * scale))):
+                fo.write(half_compressible(rng, MB))
+
+
+def build_deep_nesting(tree_dir, rng, scale):
+    """ Folders nested 64 deep in two branches, with a few small files at every level """
+    for branch in range(max(1, int(2 * scale))):
+        folder = os.path.join(tree_dir, f'branch_{branch}')
+        for depth in range(64):
+            folder = os.path.join(folder, f'level_{depth:02d}')
+            os.makedirs(folder, exist_ok=True)
+            for file_index in range(8):
+                with open(os.path.join(folder, f'file_{file_index}.txt'), "wb") as fo:
+                    fo.write(half_compressible(rng, rng.randint(512, 8192)))
+
+
+def build_sparse(tree_dir, rng, scale):
+    """ Files of 256 MB holding 1 MB of data every 32 MB, the rest holes """
+    for file_index in range(4):
+        file_size = max(32, int(256 * scale)) * MB
+        with open(os.path.join(tree_dir, f'sparse_{file_index}.img'), "wb") as fo:
+            fo.truncate(file_size)
+            for offset in range(0, file_size, 32 * MB):
+                fo.seek(offset)
+                fo.write(rng.randbytes(MB))
+
+
+def build_incompressible(tree_dir, rng, scale):
+    """ Random data, as media and already compressed files are """
+    for file_index in range(16):
+        with open(os.path.join(tree_dir, f'random_{file_index:02d}.bin'), "wb") as fo:
+            for _ in range(max(1, int(16 * scale))):
+                fo.write(rng.randbytes(MB))
+
+
+TREE_BUILDERS = {"tiny_files": build_tiny_files, "huge_files": build_huge_files,
+                 "deep_nesting": build_deep_nesting, "sparse": build_sparse, "incompressible": build_incompressible}
+
+
+def tree_totals(tree_dir):
+    """ Return the number of files and folders of a tree and the apparent size of its files """
+    entries = 0
+    total_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(tree_dir):
+        entries += len(dirnames) + len(filenames)
+        total_bytes += sum(os.lstat(os.path.join(dirpath, name)).st_size for name in filenames)
+    return entries, total_bytes
+
+
+def build_workbook(workbook_path, row_count):
+    """ Write a BackupList workbook with row_count BackupSets, StorageSets and FileSets rows """
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    backup_sets = wb.create_sheet("BackupSets")
+    backup_sets.append(["Index", "BackupSetName", "StorageSetName", "FileSetName", "Versions", "Frequency"])
+    storage_sets = wb.create_sheet("StorageSets")
+    storage_sets.append(["Index", "StorageSetName", "StoragePath", "DeviceType", "StorageFormat"])
+    file_sets = wb.create_sheet("FileSets")
+    file_sets.append(["Index", "FileSetName", "Includes", "Excludes", "Compress", "Recurse"])
+    for row_index in range(row_count):
+        backup_sets.append([row_index, f'Set_{row_index}', f'Storage_{row_index}', f'FileSet_{row_index}', 7,
+                            ("DAILY", "WEEKLY", "MONTHLY")[row_index % 3]])
+        storage_sets.append([row_index, f'Storage_{row_index}', f'/Backups/Storage_{row_index}', "File", None])
+        file_sets.append([row_index, f'FileSet_{row_index}', f'/home/user/folder_{row_index}', "NA", "YES", "YES"])
+    wb.save(workbook_path)
+
+
+class WorkbookBackup(pb.PythonBackup):
+    """ PythonBackup reading its sheets from a synthetic workbook instead of the resource directory """
+
+    def __init__(self, workbook_path):
+        super().__init__()
+        self.workbook_backend = cb.XlsxBackend(workbook_path)
+
+    def config_sheet_titles(self):
+        return self.workbook_backend.sheet_titles()
+
+    def config_sheet_rows(self, sheet_title, max_col):
+        return self.workbook_backend.sheet_rows(sheet_title, max_col)
+
+
+def best_time(runs, setup, timed):
+    """ Return the fastest of runs timings of timed, setup being called untimed before each """
+    timings = []
+    for _ in range(max(runs, 1)):
+        setup()
+        start = time.perf_counter()
+        timed()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def result(seconds, amount, unit):
+    return {"seconds": round(seconds, 4), "throughput": round(amount / seconds, 2) if seconds > 0 else None,
+            "unit": unit}
+
+
+def bench_trees(args, work_dir, results):
+    backup = pb.PythonBackup()
+    backup.args = argparse.Namespace(no_catalog=True, resume=False, compress_threads=None, compress_block_size=None)
+    for tree_name in args.trees:
+        tree_dir = os.path.join(work_dir, tree_name)
+        os.makedirs(tree_dir)
+        TREE_BUILDERS[tree_name](tree_dir, random.Random(f'{args.seed}-{tree_name}'), args.scale)
+        entries, total_bytes = tree_totals(tree_dir)
+        # files, and MB for the trees whose cost is their size
+        by_files = tree_name in ("tiny_files", "deep_nesting")
+
+        if "write_tar_file" in args.subsystems:
+            target = os.path.join(work_dir, f'{tree_name}.tgz')
+            archive_codec = backup.archive_codec_getter("GZIP")
+            seconds = best_time(args.runs, lambda: None,
+                                lambda: backup.write_tar_file(target, [tree_dir], True, archive_codec))
+            results[f'write_tar_file/{tree_name}'] = result(seconds, entries if by_files else total_bytes / MB,
+                                                            "files/s" if by_files else "MB/s")
+            for archive_file in os.listdir(work_dir):
+                if archive_file.startswith(f'{tree_name}.tgz'):
+                    os.remove(os.path.join(work_dir, archive_file))
+        if "write_snapshot" in args.subsystems:
+            repository_path = os.path.join(work_dir, f'{tree_name}_repository')
+
+            def empty_repository():
+                shutil.rmtree(repository_path, ignore_errors=True)
+
+            def snapshot():
+                chunk_repo.ChunkRepository(repository_path).write_snapshot(
+                    tree_name, backup.archive_members([tree_dir], True), 1, previous_files={})
+
+            seconds = best_time(args.runs, empty_repository, snapshot)
+            results[f'write_snapshot/{tree_name}'] = result(seconds, entries if by_files else total_bytes / MB,
+                                                            "files/s" if by_files else "MB/s")
+            empty_repository()
+        if "walklevel" in args.subsystems:
+            seconds = best_time(args.runs, lambda: None,
+                                lambda: sum(1 for _ in backup.walklevel(tree_dir, -1)))
+            results[f'walklevel/{tree_name}'] = result(seconds, entries, "entries/s")
+        if "getFolderSize" in args.subsystems:
+            seconds = best_time(args.runs, lambda: None, lambda: backup.getFolderSize(tree_dir, "YES"))
+            results[f'getFolderSize/{tree_name}'] = result(seconds, entries, "entries/s")
+
+
+def bench_workbooks(args, work_dir, results):
+    for row_count in args.workbook_rows:
+        workbook_path = os.path.join(work_dir, f'BackupList_{row_count}.xlsx')
+        build_workbook(workbook_path, row_count)
+        backup = WorkbookBackup(workbook_path)
+
+        def parse():
+            backup.BackupSet_AoD, backup.StorageSet_AoD, backup.FileSet_AoD = [], [], []
+            backup.excelSetsConvert()
+
+        def cold():
+            config_cache.loaded_workbooks.clear()
+            if os.path.exists(config_cache.cache_file(workbook_path)):
+                os.remove(config_cache.cache_file(workbook_path))
+
+        seconds = best_time(args.runs, cold, parse)
+        results[f'excelSetsConvert/{row_count}_rows_cold'] = result(seconds, row_count * 3, "rows/s")
+        seconds = best_time(args.runs, config_cache.loaded_workbooks.clear, parse)
+        results[f'excelSetsConvert/{row_count}_rows_cached'] = result(seconds, row_count * 3, "rows/s")
+
+
+def bench_chunk_boundary(args, results):
+    """ Cut random data into content defined chunks, the REPOSITORY format does it to every file stored """
+    data = random.Random(f'{args.seed}-chunks').randbytes(max(1, int(64 * args.scale)) * MB)
+
+    def cut_all():
+        offset = 0
+        while offset < len(data):
+            offset += chunk_repo.chunk_boundary(data[offset:offset + chunk_repo.MAX_CHUNK_SIZE])
+
+    seconds = best_time(args.runs, lambda: None, cut_all)
+    results['chunk_boundary/random'] = result(seconds, len(data) / MB, "MB/s")
+
+
+def compare(results, baseline, threshold):
+    """
+    This function compares the results with a baseline
+    :return: number of benchmarks whose throughput fell below the baseline divided by threshold
+    """
+    regressions = 0
+    for bench_name, bench_result in results.items():
+        baseline_result = baseline.get(bench_name)
+        if baseline_result is None or not baseline_result.get("throughput") or bench_result["throughput"] is None:
+            continue
+        if bench_result["throughput"] < baseline_result["throughput"] / threshold:
+            print(f"{bench_name} regressed: {bench_result['throughput']:.1f} {bench_result['unit']} against "
+                  f"{baseline_result['throughput']:.1f} {baseline_result['unit']}")
+            regressions += 1
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time write_tar_file, write_snapshot, walklevel, getFolderSize, "
+                                                 "excelSetsConvert and chunk_boundary on synthetic trees and "
+                                                 "workbooks")
+    parser.add_argument("-subsystems", nargs="+", choices=SUBSYSTEMS, default=list(SUBSYSTEMS))
+    parser.add_argument("-trees", nargs="+", choices=TREES, default=list(TREES))
+    parser.add_argument("-workbook_rows", type=int, nargs="+", default=list(WORKBOOK_ROWS),
+                        help="rows of each synthetic BackupList workbook")
+    parser.add_argument("-scale", type=float, default=1.0, help="multiplies the number or size of the tree files")
+    parser.add_argument("-runs", type=int, default=3, help="runs per benchmark, the fastest run is kept")
+    parser.add_argument("-seed", type=int, default=1234, help="seed of the synthetic data")
+    parser.add_argument("-work_dir", help="directory the synthetic trees are built in, on the disk to measure")
+    parser.add_argument("-output", help="write the results to this JSON file")
+    parser.add_argument("-baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("-threshold", type=float, default=1.25,
+                        help="fail when a throughput is below the baseline divided by this factor")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        if set(args.subsystems) & {"write_tar_file", "write_snapshot", "walklevel", "getFolderSize"}:
+            bench_trees(args, work_dir, results)
+        if "chunk_boundary" in args.subsystems:
+            bench_chunk_boundary(args, results)
+        if "excelSetsConvert" in args.subsystems:
+            bench_workbooks(args, work_dir, results)
+    for bench_name, bench_result in results.items():
+        print(f"{bench_name:40s} {bench_result['seconds']:9.3f} s {bench_result['throughput'] or 0:12.1f} "
+              f"{bench_result['unit']}")
+
+    if args.output:
+        with open(args.output, "w") as fo:
+            json.dump({"meta": {"host": socket.gethostname(), "python": platform.python_version(),
+                                "scale": args.scale, "seed": args.seed, "runs": args.runs,
+                                "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+                       "results": results}, fo, indent=2)
+
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline) as fi:
+            baseline = json.load(fi)
+        if baseline["meta"].get("scale") != args.scale:
+            print(f"baseline was run at scale {baseline['meta'].get('scale')}, throughputs may not compare")
+        regressions = compare(results, baseline["results"], args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
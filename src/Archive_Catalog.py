@@ -0,0 +1,126 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+""" This package contains the SQLite catalog of the archives written by successful backups, read by -report"""
+
+CATALOG_FILE = "archives.sqlite"
+CHECKSUM_ALGORITHM = "sha256"
+# bytes read at a time when the kept part of a resumed archive is hashed
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+CATALOG_COLUMNS = ("archive_path", "backup_set", "created", "size", "members", "codec", "level",
+                   "duration_seconds", "checksum", "host", "run_id")
+
+
+class ChecksumWriter:
+    """ A binary file whose written bytes are hashed on their way to it, the rest is passed through """
+
+    def __init__(self, fileobj, kept_bytes=0):
+        self.fileobj = fileobj
+        self.archive_hash = hashlib.new(CHECKSUM_ALGORITHM)
+        if kept_bytes:
+            # a resumed archive keeps the bytes written before its checkpoint, they are read back once
+            fileobj.seek(0)
+            while fileobj.tell() < kept_bytes:
+                data = fileobj.read(min(HASH_CHUNK_BYTES, kept_bytes - fileobj.tell()))
+                if not data:
+                    break
+                self.archive_hash.update(data)
+            fileobj.seek(kept_bytes)
+
+    def write(self, data):
+        self.archive_hash.update(data)
+        return self.fileobj.write(data)
+
+    def checksum(self):
+        """ Return the checksum of the bytes written so far, as algorithm:hexdigest """
+        return f'{CHECKSUM_ALGORITHM}:{self.archive_hash.hexdigest()}'
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.fileobj.close()
+
+
+class ArchiveCatalog:
+    """
+        This class keeps one row per archive written by a successful backup, with its BackupSet,
+        path, date, size, member count, codec, level, duration and checksum, in a SQLite database.
+        Expired archives are dropped from it when they are pruned, so it lists the versions on the
+        storage without the storage or the sources being read. -report is answered from it.
+
+    Args
+        Required: catalog file
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, catalog_file):
+        self.catalog_file = catalog_file
+        self.connection = sqlite3.connect(catalog_file, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS archives (archive_path TEXT PRIMARY KEY, "
+                                "backup_set TEXT, created REAL, size INTEGER, members INTEGER, codec TEXT, "
+                                "level TEXT, duration_seconds REAL, checksum TEXT, host TEXT, run_id TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS archives_by_set ON archives (backup_set, created)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        try:
+            self.connection.commit()
+        except sqlite3.Error:
+            pass
+        finally:
+            self.connection.close()
+
+    def register(self, backup_set, archive_path, size, members, codec, level, duration_seconds, checksum,
+                 run_id=None):
+        """
+        This method records an archive once it is complete under its final name. An archive written
+        again under the same name, by a second run the same day, replaces its previous row.
+        """
+        self.connection.execute("INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (archive_path, backup_set, time.time(), size, members, codec, level,
+                                 duration_seconds, checksum, socket.gethostname(), run_id))
+        self.connection.commit()
+
+    def forget(self, archive_paths):
+        """
+        This method drops pruned archives from the catalog
+        :return: number of archives dropped
+        """
+        forgotten = self.connection.executemany("DELETE FROM archives WHERE archive_path = ?",
+                                                [(archive_path,) for archive_path in archive_paths]).rowcount
+        self.connection.commit()
+        return forgotten
+
+    def versions(self):
+        """
+        This method returns every cataloged archive with a single query
+        :return: dictionary of BackupSet name to its archives, each a dictionary of CATALOG_COLUMNS, oldest first
+        """
+        set_versions = {}
+        for archive_row in self.connection.execute(f'SELECT {", ".join(CATALOG_COLUMNS)} FROM archives '
+                                                   f'ORDER BY backup_set, created'):
+            archive_record = dict(zip(CATALOG_COLUMNS, archive_row))
+            set_versions.setdefault(archive_record["backup_set"], []).append(archive_record)
+        return set_versions
@@ -0,0 +1,184 @@
+import itertools
+import json
+import os
+import time
+
+import Backup_Manifest as bm
+import Seekable_Archive as sa
+
+""" This package contains the crash safe writing of archives: partial files, checkpoints and the final rename"""
+
+PART_EXTENSION = "part"
+JOURNAL_EXTENSION = "journal"
+# time between two checkpoints of an archive being written
+CHECKPOINT_SECONDS = 60
+
+
+def part_file(archive_file):
+    """ Return the path an archive is written to until it is complete """
+    return f'{archive_file}.{PART_EXTENSION}'
+
+
+def journal_file(archive_file):
+    """ Return the checkpoint journal path of an archive being written """
+    return f'{part_file(archive_file)}.{JOURNAL_EXTENSION}'
+
+
+def fsync_path(path):
+    """ Flush a file or directory to the device """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_writer(archive_out):
+    """
+    This function makes everything written so far durable at a point the archive can be resumed from
+    :return: tuple of the uncompressed size, the size of the file and the block offsets
+    """
+    if hasattr(archive_out, "sync"):
+        return archive_out.sync()
+    archive_out.flush()
+    os.fsync(archive_out.fileno())
+    return archive_out.tell(), archive_out.tell(), []
+
+
+def commit_archive(archive_file):
+    """
+    This function gives a complete archive its final name. The partial file and the manifest and index
+    written next to it are flushed to the device, the sidecars are renamed first and the archive last,
+    so an archive under its final name is always whole and has its manifest.
+    """
+    archive_part = part_file(archive_file)
+    for part_sidecar, archive_sidecar in ((bm.manifest_file(archive_part), bm.manifest_file(archive_file)),
+                                          (sa.index_file(archive_part), sa.index_file(archive_file))):
+        if os.path.isfile(part_sidecar):
+            fsync_path(part_sidecar)
+            os.replace(part_sidecar, archive_sidecar)
+    fsync_path(archive_part)
+    os.replace(archive_part, archive_file)
+    fsync_path(os.path.dirname(os.path.abspath(archive_file)))
+    if os.path.isfile(journal_file(archive_file)):
+        os.remove(journal_file(archive_file))
+
+
+def discard_archive(archive_file):
+    """ Remove the partial file of an archive with its sidecars and journal """
+    archive_part = part_file(archive_file)
+    for leftover in (archive_part, bm.manifest_file(archive_part), sa.index_file(archive_part),
+                     journal_file(archive_file)):
+        if os.path.isfile(leftover):
+            os.remove(leftover)
+
+
+class ArchiveJournal:
+    """
+        This class appends the checkpoints of an archive being written to a journal next to its
+        partial file. A checkpoint records the manifest entries and index members added since the
+        previous one, then the point the partial file is complete up to. A run resumed from the
+        journal truncates the partial file there and skips the members already recorded.
+
+    Args
+        Required: archive file
+        Optional: journal header
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, archive_file, journal_header=None):
+        self.archive_file = archive_file
+        self.journal_header = journal_header or {}
+        self.manifest_entries = {}
+        self.index_members = []
+        self.last_checkpoint = None
+        self.journal_size = 0
+        self.journaled_entries = 0
+        self.journaled_members = 0
+        self.checkpoint_time = time.monotonic()
+        self.journal_out = None
+
+    def start(self, resumed=False):
+        """ Open the journal, a new one starts with its header and a resumed one is appended to """
+        if resumed:
+            # whatever follows the last checkpoint is dropped before appending
+            os.truncate(journal_file(self.archive_file), self.journal_size)
+            self.journal_out = open(journal_file(self.archive_file), "a", encoding="utf-8")
+            self.journaled_entries = len(self.manifest_entries)
+            self.journaled_members = len(self.index_members)
+        else:
+            self.journal_out = open(journal_file(self.archive_file), "w", encoding="utf-8")
+            self.journal_out.write(json.dumps({"header": self.journal_header}) + "\n")
+        return self
+
+    def close(self):
+        if self.journal_out is not None:
+            self.journal_out.close()
+            self.journal_out = None
+
+    def checkpoint_due(self):
+        return time.monotonic() - self.checkpoint_time >= CHECKPOINT_SECONDS
+
+    def checkpoint(self, archive_out, backup_manifest, archive_index):
+        """
+        This method makes the archive durable up to its last complete member and records it
+        :param archive_out: archive writer, positioned right after a complete tar member
+        :param backup_manifest: BackupManifest of the run, its entries are journaled
+        :param archive_index: ArchiveIndex of the run, its members are journaled
+        """
+        tar_offset, file_offset, block_offsets = sync_writer(archive_out)
+        for path, manifest_entry in itertools.islice(backup_manifest.entries.items(), self.journaled_entries, None):
+            self.journal_out.write(json.dumps({"entry": dict(manifest_entry, path=path)}) + "\n")
+        for index_member in archive_index.members[self.journaled_members:]:
+            self.journal_out.write(json.dumps({"member": list(index_member)}) + "\n")
+        self.journal_out.write(json.dumps({"checkpoint": {"tar_offset": tar_offset, "file_offset": file_offset,
+                                                          "blocks": [list(block) for block in block_offsets]}}) + "\n")
+        self.journal_out.flush()
+        os.fsync(self.journal_out.fileno())
+        self.journaled_entries = len(backup_manifest.entries)
+        self.journaled_members = len(archive_index.members)
+        self.checkpoint_time = time.monotonic()
+
+    @classmethod
+    def load(cls, archive_file):
+        """
+        Read the journal of an interrupted archive up to its last checkpoint. Entries written after
+        the last checkpoint, or cut short by the interruption, are left out.
+        :return: ArchiveJournal object, or None when there is no journal or it has no checkpoint
+        """
+        if not os.path.isfile(journal_file(archive_file)) or not os.path.isfile(part_file(archive_file)):
+            return None
+        archive_journal = cls(archive_file)
+        pending_entries = {}
+        pending_members = []
+        line_end = 0
+        with open(journal_file(archive_file), "rb") as fi:
+            for line in fi:
+                line_end += len(line)
+                try:
+                    journal_line = json.loads(line)
+                except ValueError:
+                    break
+                if "header" in journal_line:
+                    archive_journal.journal_header = journal_line["header"]
+                elif "entry" in journal_line:
+                    manifest_entry = journal_line["entry"]
+                    pending_entries[manifest_entry.pop("path")] = manifest_entry
+                elif "member" in journal_line:
+                    pending_members.append(tuple(journal_line["member"]))
+                elif "checkpoint" in journal_line:
+                    archive_journal.manifest_entries.update(pending_entries)
+                    archive_journal.index_members.extend(pending_members)
+                    archive_journal.last_checkpoint = journal_line["checkpoint"]
+                    archive_journal.journal_size = line_end
+                    pending_entries = {}
+                    pending_members = []
+        if archive_journal.last_checkpoint is None:
+            return None
+        return archive_journal
@@ -1,8 +1,6 @@
 import os
 import sys
 
-import pandas as pd
-from openpyxl import *
 from CommonOs import OsServices as os_services
 
 
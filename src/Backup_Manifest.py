@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+
+""" This package contains the manifest written next to each archive, used by incremental backups"""
+
+MANIFEST_EXTENSION = "manifest"
+LEVEL_FULL = "0"
+LEVEL_INCREMENTAL = "1"
+LEVEL_DIFFERENTIAL = "diff"
+
+
+def manifest_file(archive_file):
+    """ Return the manifest path of an archive """
+    return f'{archive_file}.{MANIFEST_EXTENSION}'
+
+
+class BackupManifest:
+    """
+        This class holds the state of every file seen by a backup run: path, size, mtime, inode and mode,
+        whether the file was stored in the archive, and the paths deleted since the reference backup.
+        A manifest is saved as gzipped JSON lines next to its archive.
+
+    Args
+        Required: none
+        Optional: level, reference archive name
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, level=LEVEL_FULL, reference=None):
+        self.level = level
+        self.reference = reference
+        self.archive_file = None
+        self.entries = {}
+        self.deleted = []
+
+    @staticmethod
+    def stat_entry(stat_result):
+        """ Return the recorded state of a file from its lstat result """
+        return {"size": stat_result.st_size, "mtime": stat_result.st_mtime_ns,
+                "inode": stat_result.st_ino, "mode": stat_result.st_mode}
+
+    def add_entry(self, path, stat_result, archived):
+        """ Record a file seen by the backup run """
+        manifest_entry = self.stat_entry(stat_result)
+        manifest_entry["archived"] = archived
+        self.entries[path] = manifest_entry
+        return manifest_entry
+
+    def is_changed(self, path, stat_result):
+        """ Return True when a path is new or its size, mtime, inode or mode differ from this manifest """
+        manifest_entry = self.entries.get(path)
+        if manifest_entry is None:
+            return True
+        return manifest_entry["size"] != stat_result.st_size or manifest_entry["mtime"] != stat_result.st_mtime_ns \
+            or manifest_entry["inode"] != stat_result.st_ino or manifest_entry["mode"] != stat_result.st_mode
+
+    def record_deletions(self, reference_manifest):
+        """ Record every path of the reference manifest no longer present in this run """
+        if reference_manifest is not None:
+            self.deleted = sorted(path for path in reference_manifest.entries if path not in self.entries)
+        return self.deleted
+
+    def archived_count(self):
+        return sum(1 for manifest_entry in self.entries.values() if manifest_entry["archived"])
+
+    def save(self, archive_file):
+        """ Write the manifest next to the archive """
+        with gzip.open(manifest_file(archive_file), "wt", encoding="utf-8") as fo:
+            fo.write(json.dumps({"level": self.level, "reference": self.reference,
+                                 "files": len(self.entries), "deleted": len(self.deleted)}) + "\n")
+            for path, manifest_entry in self.entries.items():
+                fo.write(json.dumps(dict(manifest_entry, path=path)) + "\n")
+            for path in self.deleted:
+                fo.write(json.dumps({"path": path, "deleted": True}) + "\n")
+        return manifest_file(archive_file)
+
+    @classmethod
+    def load(cls, archive_file):
+        """
+        Read the manifest of an archive
+        :param archive_file: archive the manifest was written for
+        :return: BackupManifest object, or None when the archive has no manifest
+        """
+        if not os.path.isfile(manifest_file(archive_file)):
+            return None
+        with gzip.open(manifest_file(archive_file), "rt", encoding="utf-8") as fi:
+            manifest_header = json.loads(fi.readline())
+            backup_manifest = cls(manifest_header["level"], manifest_header.get("reference"))
+            backup_manifest.archive_file = archive_file
+            for line in fi:
+                manifest_entry = json.loads(line)
+                path = manifest_entry.pop("path")
+                if manifest_entry.get("deleted"):
+                    backup_manifest.deleted.append(path)
+                else:
+                    backup_manifest.entries[path] = manifest_entry
+        return backup_manifest
@@ -0,0 +1,308 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import Backup_Manifest as bm
+import Config_Model as cm
+from CommonOs import OsServices as os_services
+
+# selected members further apart than this are read by separate workers rather than streamed through
+SEGMENT_GAP = 4 * 1024 * 1024
+
+
+class RestoreProgress:
+    """
+    This class counts the bytes restored by the worker threads and reports
+    the throughput and ETA of the restore every report_seconds
+    """
+
+    def __init__(self, owner, total_bytes, report_seconds=5):
+        self.owner = owner
+        self.total_bytes = total_bytes
+        self.report_seconds = report_seconds
+        self.restored_bytes = 0
+        self.restored_files = 0
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.lock = threading.Lock()
+
+    def __call__(self, byte_count):
+        with self.lock:
+            self.restored_bytes += byte_count
+            self.restored_files += 1
+            if time.time() - self.last_report >= self.report_seconds:
+                self.last_report = time.time()
+                self.report()
+
+    def report(self):
+        elapsed = max(time.time() - self.start_time, 0.001)
+        rate = self.restored_bytes / elapsed
+        msg = f' Restored {self.restored_files} files, {self.restored_bytes / 1048576:.1f}'
+        if self.total_bytes > 0:
+            eta = max(self.total_bytes - self.restored_bytes, 0) / rate if rate > 0 else 0
+            msg = f'{msg} of {self.total_bytes / 1048576:.1f} MB, {rate / 1048576:.1f} MB/s, ETA {eta:.0f}s'
+        else:
+            msg = f'{msg} MB, {rate / 1048576:.1f} MB/s'
+        os_services.info(self.owner, msg)
+        print(f'{os_services.date()}: {msg}')
+
+
+class BackupRestore(os_services):
+    """
+        This class contains the methods to restore a BackupSet version, optionally only the paths
+        matching a list of globs. Indexed archives are extracted by a pool of worker threads, each
+        seeking to its own segment of the archive. Incremental and differential versions are
+        restored by replaying their chain from the full backup, including the recorded deletions.
+
+    Args
+        Required: none
+        Optional: none
+
+    Logging: INFO | WARN | ERROR
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def restore_start(self, backup_set_name, version=None, path_globs=None, target_dir=None, workers=1):
+        """
+        This method restores a BackupSet version under target_dir
+        :param backup_set_name: BackupSet to restore
+        :param version: YYYYMMDD date of the version, the latest version when None
+        :param path_globs: optional list of fnmatch patterns of the paths to restore
+        :param target_dir: directory the backed up absolute paths are recreated under
+        :param workers: number of parallel extraction threads
+        :return: number of files restored, -1 when the version could not be found
+        """
+        if target_dir is None:
+            target_dir = os.path.join(str(Path.home()), 'restore', backup_set_name)
+        workers = max(int(workers or 1), 1)
+        backup_set = self.config_model_getter().backup_set(backup_set_name)
+        if backup_set is None:
+            os_services.error(self, f'BackupSet {backup_set_name} is not in the BackupSets sheet.')
+            return -1
+        storage_set_name = backup_set.StorageSetName
+        storage_path = self.storage_path_getter(storage_set_name)
+        os.makedirs(target_dir, exist_ok=True)
+        os_services.info(self, f'Restoring BackupSet {backup_set_name} version {version or "latest"} '
+                               f'into {target_dir} with {workers} workers')
+
+        if self.storage_format_getter(storage_set_name) == cm.STORAGE_FORMAT_REPOSITORY:
+            return self.restore_snapshot_version(os.path.join(storage_path, "repository"), backup_set_name,
+                                                 version, path_globs, target_dir, workers)
+
+        restore_chain = self.restore_chain(os.path.join(storage_path, backup_set_name), backup_set_name, version)
+        if len(restore_chain) == 0:
+            return -1
+
+        restore_progress = RestoreProgress(self, self.restore_total_bytes(restore_chain, path_globs))
+        restored_count = 0
+        for archive_file in restore_chain:
+            os_services.info(self, f' Restoring from {archive_file}')
+            restored_count += self.restore_archive(archive_file, path_globs, target_dir, workers, restore_progress)
+            self.restore_deletions(archive_file, path_globs, target_dir)
+        restore_progress.report()
+        return restored_count
+
+    def restore_snapshot_version(self, repository_path, backup_set_name, version, path_globs, target_dir, workers):
+        """ Restore a snapshot of a BackupSet kept in a chunk repository """
+        import Chunk_Repository as chunk_repo
+        repository = chunk_repo.ChunkRepository(repository_path)
+        snapshots = [snapshot for snapshot in repository.snapshot_list(backup_set_name)
+                     if version is None or os.path.basename(snapshot).startswith(f'{backup_set_name}_{version}')]
+        if len(snapshots) == 0:
+            os_services.error(self, f'No snapshot of {backup_set_name} for version {version} in {repository_path}')
+            return -1
+        restore_progress = RestoreProgress(self, 0)
+        restored_count = repository.restore_snapshot(snapshots[-1], target_dir, path_globs, workers, restore_progress)
+        restore_progress.report()
+        return restored_count
+
+    def restore_chain(self, archive_dir, backup_set_name, version):
+        """
+        This method finds the archive of a version and the archives it depends on
+        :return: list of archive paths, the full backup first
+        """
+        import Compression_Codecs as codecs
+        import Retention as retention
+        if not os.path.isdir(archive_dir):
+            os_services.error(self, f'{archive_dir} does not exist.')
+            return []
+        archives = [archive.name for archive in retention.scan_archives(archive_dir, backup_set_name,
+                                                                        codecs.archive_extensions())]
+        if version is not None:
+            archives = [atf for atf in archives if atf.startswith(f'{backup_set_name}_{version}')]
+        if len(archives) == 0:
+            os_services.error(self, f'No archive of {backup_set_name} for version {version} in {archive_dir}')
+            return []
+
+        restore_chain = [os.path.join(archive_dir, archives[-1])]
+        backup_manifest = bm.BackupManifest.load(restore_chain[0])
+        while backup_manifest is not None and backup_manifest.reference:
+            reference_archive = os.path.join(archive_dir, backup_manifest.reference)
+            if not os.path.isfile(reference_archive):
+                os_services.error(self, f'{reference_archive} needed by {restore_chain[0]} is missing.')
+                return []
+            restore_chain.insert(0, reference_archive)
+            backup_manifest = bm.BackupManifest.load(reference_archive)
+        return restore_chain
+
+    @staticmethod
+    def restore_selected(member_name, path_globs):
+        """ Return True when a member matches one of the globs, or no globs were given """
+        import Seekable_Archive as sa
+        return sa.member_selected(member_name, path_globs)
+
+    def restore_total_bytes(self, restore_chain, path_globs):
+        """ Sum the sizes of the files to restore from the manifests of the chain, for the ETA """
+        import Seekable_Archive as sa
+        total_bytes = 0
+        for archive_file in restore_chain:
+            backup_manifest = bm.BackupManifest.load(archive_file)
+            if backup_manifest is None:
+                continue
+            for path, manifest_entry in backup_manifest.entries.items():
+                if manifest_entry["archived"] and self.restore_selected(sa.SeekableArchive.member_name(path),
+                                                                        path_globs):
+                    total_bytes += manifest_entry["size"]
+        return total_bytes
+
+    def restore_archive(self, archive_file, path_globs, target_dir, workers, restore_progress):
+        """
+        This method extracts the selected members of one archive. Indexed archives are split into
+        segments read by parallel workers, other archives are streamed through once. The hard links of
+        an indexed archive are extracted once every segment is done, as the file a link points to may
+        be in a segment still being extracted.
+        :return: number of members restored
+        """
+        import tarfile
+        from concurrent.futures import ThreadPoolExecutor
+
+        import Compression_Codecs as codecs
+        import Seekable_Archive as sa
+        restored_dirs = []
+        if sa.SeekableArchive.has_index(archive_file):
+            seekable_archive = sa.SeekableArchive(archive_file)
+            selected_members = sorted((member_offset, member_name, member_size)
+                                      for member_name, (member_offset, member_size)
+                                      in seekable_archive.members.items()
+                                      if self.restore_selected(member_name, path_globs))
+            # parents are created up front so the workers never race to create the same directory
+            for member_dir in {os.path.dirname(member_name) for _, member_name, _ in selected_members}:
+                os.makedirs(os.path.join(target_dir, member_dir), exist_ok=True)
+            restore_segments = self.restore_segments(selected_members, workers)
+            deferred_links = []
+            with ThreadPoolExecutor(max_workers=workers) as restore_pool:
+                restored_count = sum(restore_pool.map(
+                    lambda restore_segment: self.restore_segment(seekable_archive, restore_segment, target_dir,
+                                                                 restore_progress, restored_dirs, deferred_links),
+                    restore_segments))
+                if len(deferred_links) > 0:
+                    link_names = set(deferred_links)
+                    link_segments = self.restore_segments([selected_member for selected_member in selected_members
+                                                           if selected_member[1] in link_names], workers)
+                    restored_count += sum(restore_pool.map(
+                        lambda link_segment: self.restore_segment(seekable_archive, link_segment, target_dir,
+                                                                  restore_progress, restored_dirs),
+                        link_segments))
+        else:
+            archive_codec = codecs.codec_for_archive(archive_file)
+            restored_count = 0
+            with archive_codec.open_reader(archive_file) as archive_in:
+                with tarfile.open(fileobj=archive_in, mode='r|') as tar_in:
+                    for tarinfo in tar_in:
+                        if self.restore_selected(tarinfo.name, path_globs):
+                            self.restore_member(tar_in, tarinfo, target_dir, restore_progress, restored_dirs)
+                            restored_count += 1
+
+        # directory times last, restoring their contents changed them
+        for tarinfo in sorted(restored_dirs, key=lambda ti: ti.name, reverse=True):
+            restore_path = os.path.join(target_dir, tarinfo.name)
+            os.chmod(restore_path, tarinfo.mode)
+            os.utime(restore_path, (tarinfo.mtime, tarinfo.mtime))
+        return restored_count
+
+    @staticmethod
+    def restore_segments(selected_members, workers):
+        """
+        This method groups the selected members, in archive order, into segments read by one worker.
+        A segment ends when the next member is far away or the segment holds its share of the bytes.
+        :param selected_members: sorted list of (offset, name, size)
+        :return: list of segments, each a list of (offset, name, size)
+        """
+        total_bytes = sum(member_size for _, _, member_size in selected_members)
+        segment_bytes = max(total_bytes // (workers * 4), 1)
+        restore_segments = []
+        segment_size = 0
+        previous_end = None
+        for member_offset, member_name, member_size in selected_members:
+            if previous_end is None or member_offset - previous_end > SEGMENT_GAP or segment_size >= segment_bytes:
+                restore_segments.append([])
+                segment_size = 0
+            restore_segments[-1].append((member_offset, member_name, member_size))
+            segment_size += member_size
+            previous_end = member_offset + member_size
+        return restore_segments
+
+    def restore_segment(self, seekable_archive, restore_segment, target_dir, restore_progress, restored_dirs,
+                        deferred_links=None):
+        """
+        Stream through one segment of an indexed archive, extracting its selected members. Hard links
+        are only added to deferred_links when one is given, to be extracted after the other segments.
+        """
+        import tarfile
+        wanted_members = {member_name for _, member_name, _ in restore_segment}
+        restored_count = 0
+        archive_in, member_stream = seekable_archive.open_member(restore_segment[0][1])
+        try:
+            with tarfile.open(fileobj=member_stream, mode='r|') as tar_in:
+                for tarinfo in tar_in:
+                    if tarinfo.name in wanted_members:
+                        if deferred_links is not None and tarinfo.islnk():
+                            deferred_links.append(tarinfo.name)
+                        else:
+                            self.restore_member(tar_in, tarinfo, target_dir, restore_progress, restored_dirs)
+                            restored_count += 1
+                        wanted_members.discard(tarinfo.name)
+                        if len(wanted_members) == 0:
+                            break
+        finally:
+            archive_in.close()
+        return restored_count
+
+    @staticmethod
+    def restore_member(tar_in, tarinfo, target_dir, restore_progress, restored_dirs):
+        """ Extract one member, keeping its mtime and permissions """
+        import Seekable_Archive as sa
+        restore_path = os.path.join(target_dir, tarinfo.name)
+        if (tarinfo.issym() or tarinfo.islnk()) and os.path.lexists(restore_path):
+            os.remove(restore_path)
+        sa.tar_extract(tar_in, tarinfo, target_dir)
+        if tarinfo.isdir():
+            restored_dirs.append(tarinfo)
+        restore_progress(tarinfo.size)
+
+    def restore_deletions(self, archive_file, path_globs, target_dir):
+        """ Remove the paths an incremental or differential recorded as deleted """
+        import shutil
+
+        import Seekable_Archive as sa
+        backup_manifest = bm.BackupManifest.load(archive_file)
+        if backup_manifest is None:
+            return 0
+        deleted_count = 0
+        for path in backup_manifest.deleted:
+            member_name = sa.SeekableArchive.member_name(path)
+            restore_path = os.path.join(target_dir, member_name)
+            if not self.restore_selected(member_name, path_globs) or not os.path.lexists(restore_path):
+                continue
+            if os.path.isdir(restore_path) and not os.path.islink(restore_path):
+                shutil.rmtree(restore_path)
+            else:
+                os.remove(restore_path)
+            deleted_count += 1
+        os_services.debug(self, f'  Removed {deleted_count} paths deleted before {archive_file}')
+        return deleted_count
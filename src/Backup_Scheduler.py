@@ -0,0 +1,108 @@
+import os
+from collections import deque
+
+from CommonOs import OsServices as os_services
+
+
+def backup_job_runner(backup_obj, backup_job):
+    """
+    This function runs a single BackupSet in a worker process. The log lines written
+    while archiving are captured and returned with the archive return code so the
+    parent can write them into the script run log.
+    :param backup_obj: the PythonBackup object the job was planned with
+    :param backup_job: dictionary describing the BackupSet to archive
+    :return: tuple of BackupSetName, archive return code and the captured log records
+    """
+    import Throttle as throttle
+    log_capture = backup_obj.start_log_capture()
+    throttle.install_signal_handlers()
+    try:
+        archive_rc = backup_obj.backup_set_archive(backup_job)
+    except Exception as ex:
+        os_services.error(backup_obj, f'Exception with BackupSet {backup_job["BackupSetName"]}. {ex}')
+        archive_rc = 1
+    finally:
+        with backup_obj.profile_phase("retention"):
+            backup_obj.pruning_wait()
+    return backup_job["BackupSetName"], archive_rc, log_capture.log_records
+
+
+class BackupScheduler(os_services):
+    """
+    This class contains the methods to dispatch the scheduled BackupSets to a pool of
+    worker processes, while limiting the number of sets written to the same storage device
+
+    Args
+        Required: none
+        Optional: none
+
+    Logging: INFO | WARN | ERROR
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    @staticmethod
+    def storage_device_key(storage_path):
+        """
+        This method returns the key used to group BackupSets sharing the same storage device
+        :param storage_path: StoragePath of the BackupSet
+        :return: device id of the StoragePath, or its real path if it cannot be read
+        """
+        try:
+            return os.stat(storage_path).st_dev
+        except OSError:
+            return os.path.realpath(storage_path)
+
+    def backup_jobs_dispatch(self, backup_jobs, max_jobs, jobs_per_storage=1):
+        """
+        This method archives the BackupSets in a process pool of max_jobs workers. No more than
+        jobs_per_storage BackupSets are written to the same storage device at any time.
+        :param backup_jobs: list of BackupSet job dictionaries from backup_jobs_getter
+        :param max_jobs: number of worker processes
+        :param jobs_per_storage: maximum concurrent BackupSets per storage device
+        :return: dictionary of BackupSetName to archive return code
+        """
+        # multiprocessing is only imported when the BackupSets run in parallel
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        pending_jobs = {}
+        for backup_job in backup_jobs:
+            storage_key = self.storage_device_key(backup_job["StoragePath"])
+            pending_jobs.setdefault(storage_key, deque()).append(backup_job)
+
+        active_jobs = dict.fromkeys(pending_jobs, 0)
+        running_jobs = {}
+        archive_rcs = {}
+        os_services.info(self, f'Dispatching {len(backup_jobs)} BackupSets to {max_jobs} workers, '
+                               f'{jobs_per_storage} per storage device')
+
+        with ProcessPoolExecutor(max_workers=max_jobs) as backup_pool:
+            while pending_jobs or running_jobs:
+                for storage_key in list(pending_jobs):
+                    while pending_jobs[storage_key] and active_jobs[storage_key] < jobs_per_storage \
+                            and len(running_jobs) < max_jobs:
+                        backup_job = pending_jobs[storage_key].popleft()
+                        os_services.debug(self, f'Starting BackupSet {backup_job["BackupSetName"]}')
+                        future = backup_pool.submit(backup_job_runner, self, backup_job)
+                        running_jobs[future] = (storage_key, backup_job)
+                        active_jobs[storage_key] += 1
+                    if not pending_jobs[storage_key]:
+                        del pending_jobs[storage_key]
+
+                done_jobs, _ = wait(running_jobs, return_when=FIRST_COMPLETED)
+                for future in done_jobs:
+                    storage_key, backup_job = running_jobs.pop(future)
+                    active_jobs[storage_key] -= 1
+                    try:
+                        backup_set_name, archive_rc, log_records = future.result()
+                    except Exception as ex:
+                        os_services.error(self, f'Worker for BackupSet {backup_job["BackupSetName"]} failed. {ex}')
+                        archive_rcs[backup_job["BackupSetName"]] = 1
+                        continue
+                    self.replay_log_records(log_records)
+                    archive_rcs[backup_set_name] = archive_rc
+
+        return archive_rcs
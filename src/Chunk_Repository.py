@@ -0,0 +1,413 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import random
+import stat
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import Retention as retention
+import Seekable_Archive as sa
+from CommonLogger import LoggerServices as logger_services
+from CommonOs import OsServices as os_services
+
+""" This package contains a deduplicating chunk repository, an alternative to keeping whole archive versions"""
+
+MIN_CHUNK_SIZE = 256 * 1024
+AVG_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+HASH_MASK = (1 << 64) - 1
+# gear table and normalized chunking masks, the masks test the high bits which depend on the last 64 bytes read
+GEAR_RANDOM = random.Random(0x5EED)
+GEAR_TABLE = tuple(GEAR_RANDOM.getrandbits(64) for _ in range(256))
+MASK_SMALL = ((1 << 22) - 1) << 42
+MASK_LARGE = ((1 << 18) - 1) << 46
+# chunks younger than this are never collected, they may belong to a snapshot still being written
+GC_GRACE_SECONDS = 6 * 3600
+# held shared while a snapshot is written and exclusive while garbage is collected
+LOCK_FILE = "repository.lock"
+# gear table as a NumPy array, built on first use when NumPy is installed
+gear_array = None
+# bytes hashed at a time by gear_cut, which stops at the first block holding a boundary
+SCAN_BLOCK_BYTES = 128 * 1024
+
+
+def gear_hashes(window):
+    """
+    This function returns the gear hash after every byte of window, computed with NumPy. The hash
+    after byte i is the sum of gear[window[i - k]] << k for k below 64, so it is built by doubling
+    the number of bytes summed six times instead of rolling through the bytes one at a time.
+    :return: uint64 array as long as window, the hash starting from 0 at the first byte
+    """
+    global gear_array
+    import numpy as np
+    if gear_array is None:
+        gear_array = np.array(GEAR_TABLE, dtype=np.uint64)
+    hashes = gear_array[np.frombuffer(window, dtype=np.uint8)]
+    shifted = np.empty_like(hashes)
+    summed_bytes = 1
+    while summed_bytes < 64:
+        np.left_shift(hashes[:-summed_bytes], np.uint64(summed_bytes), out=shifted[summed_bytes:])
+        np.add(hashes[summed_bytes:], shifted[summed_bytes:], out=hashes[summed_bytes:])
+        summed_bytes *= 2
+    return hashes
+
+
+def gear_cut(data, hash_start, scan_start, scan_end, mask):
+    """
+    This function finds the first byte of data[scan_start:scan_end] whose gear hash, rolled from 0 at
+    hash_start, has none of the mask bits set. The hash only depends on the last 64 bytes, so the
+    range is hashed a block at a time, each block starting 63 bytes early.
+    :return: length of data up to and including that byte, None when there is none
+    """
+    import numpy as np
+    data_view = memoryview(data)
+    for block_start in range(scan_start, scan_end, SCAN_BLOCK_BYTES):
+        window_start = max(hash_start, block_start - 63)
+        block_hashes = gear_hashes(data_view[window_start:min(block_start + SCAN_BLOCK_BYTES, scan_end)])
+        block_cuts = np.flatnonzero((block_hashes[block_start - window_start:] & np.uint64(mask)) == 0)
+        if len(block_cuts) > 0:
+            return block_start + int(block_cuts[0]) + 1
+    return None
+
+
+def chunk_boundary(data, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """
+    This function finds the end of the first content defined chunk of data with a gear rolling hash.
+    Before the average size a stricter mask is used and after it a looser one, which keeps
+    chunk sizes close to the average (FastCDC normalized chunking). The hashes are computed with
+    NumPy when it is installed, byte by byte otherwise, and both cut at the same boundaries.
+    :param data: bytes to cut, at least max_size long unless it is the end of the file
+    :return: length of the first chunk
+    """
+    data_len = len(data)
+    if data_len <= min_size:
+        return data_len
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        normal_size = min(avg_size, data_len)
+        limit_size = min(max_size, data_len)
+        return gear_cut(data, min_size, min_size, normal_size, MASK_SMALL) or \
+            gear_cut(data, min_size, normal_size, limit_size, MASK_LARGE) or limit_size
+    gear = GEAR_TABLE
+    rolling_hash = 0
+    index = min_size
+    normal_size = min(avg_size, data_len)
+    limit_size = min(max_size, data_len)
+    while index < normal_size:
+        rolling_hash = ((rolling_hash << 1) + gear[data[index]]) & HASH_MASK
+        if not rolling_hash & MASK_SMALL:
+            return index + 1
+        index += 1
+    while index < limit_size:
+        rolling_hash = ((rolling_hash << 1) + gear[data[index]]) & HASH_MASK
+        if not rolling_hash & MASK_LARGE:
+            return index + 1
+        index += 1
+    return limit_size
+
+
+class ChunkRepository(os_services):
+    """
+        This class contains the methods to store BackupSets in a deduplicating repository. Files are split
+        into content defined chunks, each chunk is stored once under its sha256 and every backup
+        is a small snapshot index listing the chunks of each file. Pruning a snapshot garbage
+        collects the chunks no other snapshot references.
+
+        repository/chunks/<2 hex>/<sha256>          zlib compressed chunk
+        repository/snapshots/<BackupSet>/<BackupSet>_YYYYMMDD.json.gz
+
+    Args
+        Required: repository path
+        Optional: compress
+
+    Logging: INFO | WARN | ERROR
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, repository_path, compress=True):
+        # super().__init__()
+        self.repository_path = repository_path
+        self.chunks_path = os.path.join(repository_path, "chunks")
+        self.snapshots_path = os.path.join(repository_path, "snapshots")
+        self.compress = compress
+        self.chunk_stats = {"files": 0, "chunks": 0, "new_chunks": 0, "bytes": 0, "new_bytes": 0, "reused_files": 0}
+        os.makedirs(self.chunks_path, exist_ok=True)
+        os.makedirs(self.snapshots_path, exist_ok=True)
+
+    def chunk_file(self, chunk_hash):
+        return os.path.join(self.chunks_path, chunk_hash[:2], chunk_hash)
+
+    def store_chunk(self, chunk):
+        """
+        This method stores a chunk unless the repository already holds it
+        :return: sha256 of the chunk
+        """
+        chunk_hash = hashlib.sha256(chunk).hexdigest()
+        chunk_path = self.chunk_file(chunk_hash)
+        self.chunk_stats["chunks"] += 1
+        self.chunk_stats["bytes"] += len(chunk)
+        if os.path.exists(chunk_path):
+            try:
+                # a reused chunk is made young again, a collection of another BackupSet running meanwhile keeps it
+                os.utime(chunk_path)
+                return chunk_hash
+            except FileNotFoundError:
+                pass
+
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        chunk_tmp = f'{chunk_path}.{os.getpid()}.tmp'
+        with open(chunk_tmp, "wb") as fo:
+            fo.write(zlib.compress(chunk, 6) if self.compress else b"\x00" + chunk)
+        os.replace(chunk_tmp, chunk_path)
+        self.chunk_stats["new_chunks"] += 1
+        self.chunk_stats["new_bytes"] += len(chunk)
+        return chunk_hash
+
+    def lock_repository(self, exclusive=False, wait=True):
+        """
+        This method takes the lock file of the repository, shared by the BackupSets writing a snapshot
+        and exclusive for a garbage collection, so no chunk is collected while a snapshot being written
+        may reference it. Platforms without flock rely on the chunk mtimes refreshed by store_chunk.
+        :return: the open lock file, closing it releases the lock, None when it is held and wait is False
+        """
+        lock_fo = open(os.path.join(self.repository_path, LOCK_FILE), "a+b")
+        try:
+            import fcntl
+        except ImportError:
+            return lock_fo
+        try:
+            fcntl.flock(lock_fo, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_fo.close()
+            return None
+        return lock_fo
+
+    def load_chunk(self, chunk_hash):
+        with open(self.chunk_file(chunk_hash), "rb") as fi:
+            chunk = fi.read()
+        # a zlib stream never starts with a zero byte, which marks a chunk stored uncompressed
+        return chunk[1:] if chunk[:1] == b"\x00" else zlib.decompress(chunk)
+
+    def store_file(self, file_path):
+        """
+        This method splits a file into content defined chunks and stores them
+        :return: list of chunk hashes in file order
+        """
+        chunk_hashes = []
+        buffer = b""
+        with open(file_path, "rb") as fi:
+            while True:
+                data = fi.read(MAX_CHUNK_SIZE)
+                buffer += data
+                while len(buffer) >= MAX_CHUNK_SIZE or (not data and buffer):
+                    chunk_len = chunk_boundary(buffer)
+                    chunk_hashes.append(self.store_chunk(buffer[:chunk_len]))
+                    buffer = buffer[chunk_len:]
+                if not data:
+                    break
+        return chunk_hashes
+
+    def write_snapshot(self, backup_set_name, members, versions, previous_files=None):
+        """
+        This method stores the members of a BackupSet and writes its snapshot index, then prunes
+        the BackupSet down to versions snapshots and collects unreferenced chunks
+        :param backup_set_name: name of the BackupSet
+        :param members: iterable of (path, lstat result)
+        :param versions: number of snapshots to keep
+        :param previous_files: files of the previous snapshot, unchanged files reuse their chunk lists
+        :return: path of the snapshot written
+        """
+        # no garbage is collected while the chunks of this snapshot are stored and it is written
+        snapshot_lock = self.lock_repository()
+        try:
+            if previous_files is None:
+                previous_files = self.latest_snapshot_files(backup_set_name)
+            snapshot_files = []
+            for member_path, member_stat in members:
+                snapshot_entry = {"path": member_path, "mode": member_stat.st_mode, "mtime": member_stat.st_mtime_ns,
+                                  "size": member_stat.st_size, "inode": member_stat.st_ino}
+                try:
+                    if stat.S_ISLNK(member_stat.st_mode):
+                        snapshot_entry["target"] = os.readlink(member_path)
+                    elif stat.S_ISREG(member_stat.st_mode):
+                        previous_entry = previous_files.get(member_path)
+                        if previous_entry is not None and all(previous_entry.get(key) == snapshot_entry[key]
+                                                              for key in ("mtime", "size", "inode")):
+                            snapshot_entry["chunks"] = previous_entry["chunks"]
+                            self.chunk_stats["reused_files"] += 1
+                        else:
+                            snapshot_entry["chunks"] = self.store_file(member_path)
+                        self.chunk_stats["files"] += 1
+                    elif not stat.S_ISDIR(member_stat.st_mode):
+                        continue
+                except OSError as oserr:
+                    logger_services.warn(self, f'  {member_path} could not be read. {oserr}')
+                    continue
+                snapshot_files.append(snapshot_entry)
+
+            snapshot_dir = os.path.join(self.snapshots_path, backup_set_name)
+            os.makedirs(snapshot_dir, exist_ok=True)
+            snapshot_file = os.path.join(snapshot_dir, f'{backup_set_name}_{self.file_date()}.json.gz')
+            snapshot_tmp = f'{snapshot_file}.tmp'
+            with gzip.open(snapshot_tmp, "wt", encoding="utf-8") as fo:
+                json.dump({"backup_set": backup_set_name, "created": self.date(), "files": snapshot_files}, fo)
+            os.replace(snapshot_tmp, snapshot_file)
+            logger_services.info(self, f'  Snapshot {snapshot_file}: {self.chunk_stats["files"]} files, '
+                                       f'{self.chunk_stats["reused_files"]} unchanged, '
+                                       f'{self.chunk_stats["new_chunks"]} of {self.chunk_stats["chunks"]} chunks new, '
+                                       f'{self.chunk_stats["new_bytes"]} of {self.chunk_stats["bytes"]} bytes stored')
+        finally:
+            snapshot_lock.close()
+
+        if self.prune_snapshots(backup_set_name, versions) > 0:
+            self.collect_garbage()
+        return snapshot_file
+
+    def snapshot_list(self, backup_set_name):
+        """ Return the snapshot paths of a BackupSet, oldest first """
+        snapshot_dir = os.path.join(self.snapshots_path, backup_set_name)
+        if not os.path.isdir(snapshot_dir):
+            return []
+        return [os.path.join(snapshot_dir, snapshot) for snapshot in sorted(os.listdir(snapshot_dir))
+                if snapshot.endswith(".json.gz")]
+
+    @staticmethod
+    def load_snapshot(snapshot_file):
+        with gzip.open(snapshot_file, "rt", encoding="utf-8") as fi:
+            return json.load(fi)
+
+    def latest_snapshot_files(self, backup_set_name):
+        """ Return the files of the latest snapshot of a BackupSet keyed by path """
+        snapshots = self.snapshot_list(backup_set_name)
+        if len(snapshots) == 0:
+            return {}
+        return {snapshot_entry["path"]: snapshot_entry
+                for snapshot_entry in self.load_snapshot(snapshots[-1])["files"] if "chunks" in snapshot_entry}
+
+    def prune_snapshots(self, backup_set_name, versions):
+        """
+        This method deletes the snapshots of a BackupSet its Versions retention policy does not keep,
+        the latest snapshot is always kept
+        :return: number of snapshots deleted
+        """
+        try:
+            retention_policy = retention.RetentionPolicy.from_versions(versions)
+        except ValueError as ve:
+            logger_services.warn(self, f'{ve}, no snapshot is deleted.')
+            return 0
+        snapshots = self.snapshot_list(backup_set_name)[::-1]
+        kept_snapshots = retention_policy.kept([self.snapshot_date(snapshot) for snapshot in snapshots]) | {0}
+        pruned_count = 0
+        for position, snapshot in enumerate(snapshots):
+            if position not in kept_snapshots:
+                logger_services.debug(self, f'Deleting {snapshot}')
+                os.remove(snapshot)
+                pruned_count += 1
+        return pruned_count
+
+    @staticmethod
+    def snapshot_date(snapshot_file):
+        """ Return the date of a snapshot file, named BackupSetName_YYYYMMDD.json.gz """
+        return datetime.datetime.strptime(os.path.basename(snapshot_file)[-16:-8], "%Y%m%d").date()
+
+    def collect_garbage(self):
+        """
+        This method deletes every chunk no snapshot of the repository references. It is skipped while
+        another BackupSet writes a snapshot, the chunks are then collected by a later pruning.
+        :return: number of chunks deleted
+        """
+        gc_lock = self.lock_repository(exclusive=True, wait=False)
+        if gc_lock is None:
+            logger_services.info(self, f'  Garbage collection of {self.repository_path} skipped, '
+                                       f'a snapshot is being written')
+            return 0
+        with gc_lock:
+            return self.collect_unreferenced()
+
+    def collect_unreferenced(self):
+        """ Delete the chunks no snapshot references, the caller holds the repository lock exclusively """
+        gc_start = time.time()
+        referenced_chunks = set()
+        for backup_set_name in os.listdir(self.snapshots_path):
+            for snapshot_file in self.snapshot_list(backup_set_name):
+                for snapshot_entry in self.load_snapshot(snapshot_file)["files"]:
+                    referenced_chunks.update(snapshot_entry.get("chunks", ()))
+
+        collected_count = 0
+        collected_bytes = 0
+        for chunk_dir in os.listdir(self.chunks_path):
+            with os.scandir(os.path.join(self.chunks_path, chunk_dir)) as chunk_scan:
+                for entry in chunk_scan:
+                    if entry.name in referenced_chunks:
+                        continue
+                    chunk_stat = entry.stat()
+                    if gc_start - chunk_stat.st_mtime < GC_GRACE_SECONDS:
+                        continue
+                    os.remove(entry.path)
+                    collected_count += 1
+                    collected_bytes += chunk_stat.st_size
+        logger_services.info(self, f'  Garbage collected {collected_count} chunks, {collected_bytes} bytes '
+                                   f'from {self.repository_path}')
+        return collected_count
+
+    def restore_snapshot(self, snapshot_file, target_dir, path_globs=None, workers=1, restore_progress=None):
+        """
+        This method restores the files of a snapshot under target_dir, preserving modes and mtimes.
+        Files are restored by a pool of worker threads.
+        :param snapshot_file: snapshot to restore
+        :param target_dir: directory the absolute snapshot paths are recreated under
+        :param path_globs: optional list of fnmatch patterns selecting the paths to restore, with or without
+            their leading /
+        :param workers: number of files restored in parallel
+        :param restore_progress: optional callable taking the byte count of each restored file
+        :return: number of files restored
+        """
+        snapshot_dirs = []
+        snapshot_files = []
+        for snapshot_entry in self.load_snapshot(snapshot_file)["files"]:
+            # matched as the tar member names are, so a glob selects the same paths as from an archive
+            if not sa.member_selected(sa.SeekableArchive.member_name(snapshot_entry["path"]), path_globs):
+                continue
+            restore_path = os.path.join(target_dir, snapshot_entry["path"].lstrip("/\\"))
+            if stat.S_ISDIR(snapshot_entry["mode"]):
+                os.makedirs(restore_path, exist_ok=True)
+                snapshot_dirs.append((restore_path, snapshot_entry))
+            else:
+                snapshot_files.append((restore_path, snapshot_entry))
+
+        def restore_file(snapshot_file_entry):
+            restore_path, snapshot_entry = snapshot_file_entry
+            os.makedirs(os.path.dirname(restore_path), exist_ok=True)
+            if "target" in snapshot_entry:
+                if os.path.lexists(restore_path):
+                    os.remove(restore_path)
+                os.symlink(snapshot_entry["target"], restore_path)
+                return 0
+            with open(restore_path, "wb") as fo:
+                for chunk_hash in snapshot_entry["chunks"]:
+                    fo.write(self.load_chunk(chunk_hash))
+            os.chmod(restore_path, stat.S_IMODE(snapshot_entry["mode"]))
+            os.utime(restore_path, ns=(snapshot_entry["mtime"], snapshot_entry["mtime"]))
+            if restore_progress is not None:
+                restore_progress(snapshot_entry["size"])
+            return 1
+
+        with ThreadPoolExecutor(max_workers=max(int(workers), 1)) as restore_pool:
+            restored_count = sum(restore_pool.map(restore_file, snapshot_files))
+
+        # directory times last, restoring their files changed them
+        for restore_path, snapshot_entry in reversed(snapshot_dirs):
+            os.chmod(restore_path, stat.S_IMODE(snapshot_entry["mode"]))
+            os.utime(restore_path, ns=(snapshot_entry["mtime"], snapshot_entry["mtime"]))
+        return restored_count
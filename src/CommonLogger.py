@@ -1,10 +1,34 @@
+import atexit
 import datetime
 import logging
+import logging.handlers
 import os
+import queue
 import sys
 from pathlib import Path
 
-from openpyxl import load_workbook
+import Config_Backend as config_backend
+import Run_Metrics as run_metrics
+
+LOG_FORMAT = ' %(asctime)s %(levelname)s: %(message)s'
+LOG_DATE_FORMAT = '%Y/%m/%d %H:%M:%S'
+# logger of the per-file debug lines, written into their own FILE_LOG_EXTENSION file with -file_log
+FILE_LOGGER_NAME = "PythonBackup.files"
+FILE_LOG_EXTENSION = "files.log"
+
+
+class LogCaptureHandler(logging.Handler):
+    """
+    This class holds the log records of a worker process in memory so they
+    can be handed back to the parent and written into the single script run log
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.log_records = []
+
+    def emit(self, record):
+        self.log_records.append((record.levelno, record.getMessage(), record.name))
 
 
 class LoggerServices:
@@ -28,6 +52,11 @@ class LoggerServices:
 
     log_file = ""
     log_level = ""
+    metrics_file = ""
+    metrics_run_id = None
+    file_log_file = ""
+    # background writers of this process, as (logger, queue handler, listener)
+    log_listeners = []
 
     @staticmethod
     def date():
@@ -50,6 +79,46 @@ class LoggerServices:
         return os.path.join(self.getLogDir(),
                             f'{str(os.path.basename(sys.argv[0])).replace(".py", "")}.{self.file_date()}.log')
 
+    def getMetricsFile(self):
+        """
+        This method returns the JSON lines file the performance metrics of the script run are appended to,
+        next to its log file. It is set once, so worker processes and a run going past midnight share it.
+        """
+        if not self.metrics_file:
+            script_name = str(os.path.basename(sys.argv[0])).replace(".py", "")
+            self.metrics_file = os.path.join(self.getLogDir(),
+                                             f'{script_name}.{self.file_date()}.{run_metrics.METRICS_EXTENSION}')
+        return self.metrics_file
+
+    def record_metric(self, run_metric):
+        """
+        This method appends a finished metric to the metrics file of the script run and logs its summary
+        """
+        if run_metric.run_id is None:
+            run_metric.run_id = self.metrics_run_id
+        try:
+            run_metrics.append_metric(self.getMetricsFile(), run_metric)
+        except OSError as ose:
+            logging.warning(f'Metrics of {run_metric.operation} {run_metric.name} were not recorded. {ose}')
+        logging.info(f'Metrics {run_metric}')
+        return run_metric
+
+    def run_metrics_getter(self):
+        """
+        This method returns the metrics recorded so far by the script run, its worker processes included
+        """
+        return run_metrics.read_metrics(self.getMetricsFile(), self.metrics_run_id)
+
+    def export_metrics(self, textfile_path):
+        """
+        This method writes the metrics of the script run into a Prometheus node-exporter textfile
+        """
+        try:
+            return run_metrics.write_textfile(textfile_path, self.run_metrics_getter())
+        except OSError as ose:
+            logging.error(f'Metrics textfile {textfile_path} write error. {ose}')
+            return 0
+
     def getLogDir(self):
         """
         This method sets the logs directory
@@ -69,16 +138,93 @@ class LoggerServices:
 
     def getLogger(self, name):
         """
-        This method creates and returns a object used to log each script run
+        This method creates and returns a object used to log each script run. The log records are queued
+        and written to the log file by a background thread, so logging does not wait on the disk.
+        With -file_log the per-file debug lines go to their own log file, whatever the log level.
         """
         log_file = self.openlogfile()
         self.log_level = self.set_log_level()
         logger = logging.getLogger(name)
-        logging.basicConfig(filename=log_file, level=self.log_level,
-                            format=' %(asctime)s %(levelname)s: %(message)s', datefmt='%Y/%m/%d %H:%M:%S')
+        self.stop_log_listeners()
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        self.start_log_listener(root_logger, log_file)
+        if self.log_level:
+            root_logger.setLevel(self.log_level)
+        if getattr(getattr(self, "args", None), "file_log", False):
+            self.file_log_file = f'{os.path.splitext(log_file)[0]}.{FILE_LOG_EXTENSION}'
+            files_logger = logging.getLogger(FILE_LOGGER_NAME)
+            files_logger.setLevel(logging.DEBUG)
+            files_logger.propagate = False
+            self.start_log_listener(files_logger, self.file_log_file)
 
         return logger
 
+    @staticmethod
+    def start_log_listener(logger, log_file):
+        """
+        This method makes a logger queue its records for a background thread writing them into log_file
+        """
+        log_queue = queue.SimpleQueue()
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+        listener = logging.handlers.QueueListener(log_queue, file_handler)
+        listener.start()
+        if not LoggerServices.log_listeners:
+            atexit.register(LoggerServices.stop_log_listeners)
+        LoggerServices.log_listeners.append((logger, queue_handler, listener))
+        return queue_handler
+
+    @staticmethod
+    def stop_log_listeners():
+        """
+        This method stops the background writers once the records queued have been written, and hands
+        their log files back to the loggers so lines logged afterwards are written directly
+        """
+        while LoggerServices.log_listeners:
+            logger, queue_handler, listener = LoggerServices.log_listeners.pop()
+            listener.stop()
+            logger.removeHandler(queue_handler)
+            for handler in listener.handlers:
+                handler.flush()
+                logger.addHandler(handler)
+        return None
+
+    def start_log_capture(self):
+        """
+        This method diverts all logging of the current process into memory.
+        It is used by worker processes so their log lines can be returned to the parent
+        """
+        # the background writers of a forked parent do not run in this process
+        del LoggerServices.log_listeners[:]
+        files_logger = logging.getLogger(FILE_LOGGER_NAME)
+        for handler in files_logger.handlers[:]:
+            files_logger.removeHandler(handler)
+        files_logger.propagate = True
+        if self.file_log_file:
+            files_logger.setLevel(logging.DEBUG)
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        log_capture = LogCaptureHandler()
+        root_logger.addHandler(log_capture)
+        if self.log_level:
+            root_logger.setLevel(self.log_level)
+        return log_capture
+
+    @staticmethod
+    def replay_log_records(log_records):
+        """
+        This method writes log records captured in a worker process into the script run log,
+        the per-file debug lines into the per-file log when there is one
+        """
+        for levelno, msg, logger_name in log_records:
+            logging.getLogger(logger_name).log(levelno, msg)
+        return None
+
     def starting_template(self, parameter_list, args):
         """
         This method takes a list of cmd line args
@@ -127,6 +273,7 @@ class LoggerServices:
         """
         This method appends the closing log info and closes the logfile
         """
+        self.stop_log_listeners()
         self.log_file = self.setLogFile()
         try:
             fo = open(self.log_file, 'a', encoding='utf-8')
@@ -169,19 +316,34 @@ class LoggerServices:
         return script_end
 
     def set_log_level(self):
-        resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
-        wb = load_workbook(os.path.join(resource_path, "BackupList.xlsx"))
-        sheetset = {'AppConfig': 6}
+        row_sets = self.config_sheet_rows('AppConfig', 6)
+        if len(row_sets) > 2:
+            self.log_level = row_sets[2][1]
+        return self.log_level
 
-        for ws in wb:
-            if ws.title in sheetset.keys():
-                worksheet = wb[ws.title]
+    @staticmethod
+    def config_backend():
+        """
+        This method returns the configuration backend, BackupList.sqlite once it has been imported
+        and the BackupList.xlsx workbook otherwise
+        """
+        resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
+        return config_backend.backend_for(resource_path)
 
-                row_sets = [worksheetsets for worksheetsets in worksheet.iter_rows(
-                    min_row=2, max_col=sheetset[ws.title], min_col=1, values_only=True)]
+    @staticmethod
+    def config_sheet_rows(sheet_title, max_col):
+        """
+        This method returns the rows below the header of a configuration sheet, max_col columns wide,
+        from the configuration backend so the workbook is only parsed when it changes
+        """
+        return LoggerServices.config_backend().sheet_rows(sheet_title, max_col)
 
-                self.log_level = row_sets[2][1]
-        return self.log_level
+    @staticmethod
+    def config_sheet_titles():
+        """
+        This method returns the titles of the sheets held by the configuration backend
+        """
+        return LoggerServices.config_backend().sheet_titles()
 
     @staticmethod
     def separationBar():
@@ -190,42 +352,52 @@ class LoggerServices:
         """
         return 75 * f'='
 
-    def critical(self, msg):
+    def critical(self, msg, *args):
         """
         This method takes a message and logs it as a
         CRITICAL to the script run log
         """
-        logging.critical(msg)
+        logging.critical(msg, *args)
         return None
 
-    def error(self, msg):
+    def error(self, msg, *args):
         """
         This method takes a message and logs it as an
         ERROR  to the script run log
         """
-        logging.error(msg)
+        logging.error(msg, *args)
         return None
 
-    def warn(self, msg):
+    def warn(self, msg, *args):
         """
         This method takes a message and logs it as an
         WARNING to the script run log
         """
-        logging.warning(msg)
+        logging.warning(msg, *args)
         return None
 
-    def info(self, msg):
+    def info(self, msg, *args):
         """
         This method takes a message and logs it as an
         INFO to the script run log
         """
-        logging.info(msg)
+        logging.info(msg, *args)
         return None
 
-    def debug(self, msg):
+    def debug(self, msg, *args):
         """
         This method takes a message and logs it as a
-        DEBUG message to the script run log
+        DEBUG message to the script run log. Per-file lines should pass their values as
+        %-style args, so the message is only formatted when DEBUG is enabled.
+        """
+        logging.debug(msg, *args)
+        return None
+
+    def file_debug(self, msg, *args):
+        """
+        This method takes a message about a single file and logs it as a DEBUG message
+        to the per-file log with -file_log, to the script run log otherwise. The values
+        are passed as %-style args and only formatted when the line is written.
         """
-        logging.debug(msg)
+        logging.getLogger(FILE_LOGGER_NAME).debug(msg, *args)
         return None
@@ -37,6 +37,7 @@ class OsServices(logger_services):
         self.script_path = os.path.join(os.getcwd(), sys.argv[0])
         self.reports_dir = self.setReportDir()  # set the reports dir path
         self.crontabs_dir = self.setCronDir()  # the cron dir under UNIX/LINUX
+        self.catalogs_dir = self.setCatalogDir()  # the metadata catalog dir
         self.msg = ''
 
     def setReportDir(self):
@@ -83,6 +84,58 @@ class OsServices(logger_services):
         """
         return self.crontabs_dir
 
+    def setCatalogDir(self):
+        """
+        This method sets the metadata catalog directory
+        """
+        catalogs_dir = os.path.join(str(Path.home()), 'catalogs')
+
+        if not os.path.isdir(catalogs_dir):
+            os.makedirs(catalogs_dir)
+
+            if not os.path.exists(catalogs_dir):
+                self.msg = 'Initial setup of catalogs dir failed, exiting script run!'
+                print(f'{self.date()}: {self.msg}')
+                logger_services.error(self, self.msg)
+                sys.exit(1)
+        return catalogs_dir
+
+    def getCatalogDir(self):
+        """
+        This method returns the metadata catalog directory set on the class
+        """
+        return self.catalogs_dir
+
+    def metadata_catalog_getter(self):
+        """
+        This method opens the metadata catalog shared by the scan, size and backup modes
+        :return: MetadataCatalog object, None when -no_catalog was given or the catalog cannot be opened
+        """
+        if getattr(getattr(self, "args", None), "no_catalog", False):
+            return None
+        import sqlite3
+
+        import Metadata_Catalog as md_catalog
+        try:
+            return md_catalog.MetadataCatalog(os.path.join(self.getCatalogDir(), md_catalog.CATALOG_FILE))
+        except sqlite3.Error as sqlerr:
+            logger_services.warn(self, f'Metadata catalog is not usable, scanning without it. {sqlerr}')
+            return None
+
+    def archive_catalog_getter(self):
+        """
+        This method opens the catalog of the archives written by successful backups
+        :return: ArchiveCatalog object, None when the catalog cannot be opened
+        """
+        import sqlite3
+
+        import Archive_Catalog as arc_catalog
+        try:
+            return arc_catalog.ArchiveCatalog(os.path.join(self.getCatalogDir(), arc_catalog.CATALOG_FILE))
+        except sqlite3.Error as sqlerr:
+            logger_services.warn(self, f'Archive catalog is not usable. {sqlerr}')
+            return None
+
     def haltScript(self):
         """
         This method stop the script  from executing
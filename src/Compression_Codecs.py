@@ -0,0 +1,204 @@
+""" This package contains the registry of compression codecs an archive can be written with"""
+
+CODEC_REGISTRY = {}
+COMPRESS_ALIASES = {"YES": "GZIP", "Y": "GZIP", "TRUE": "GZIP", "NO": "NONE", "N": "NONE", "FALSE": "NONE"}
+DEFAULT_CODEC = "GZIP"
+# size of the blocks compressed by each thread, as Parallel_Gzip.DEFAULT_BLOCK_SIZE
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def register_codec(codec_class):
+    """ Class decorator adding a codec to the registry under its name """
+    CODEC_REGISTRY[codec_class.name] = codec_class
+    return codec_class
+
+
+def parse_codec_spec(compress_value):
+    """
+    This function splits a FileSets Compress value such as 'ZSTD:19' into a codec name and level.
+    YES and NO are read as GZIP and NONE, an empty value as the default codec.
+    :param compress_value: value of the Compress column
+    :return: tuple of codec name and level, level is None when not given
+    """
+    spec = str(compress_value or DEFAULT_CODEC).strip().upper()
+    codec_name, _, codec_level = spec.partition(":")
+    codec_name = COMPRESS_ALIASES.get(codec_name, codec_name)
+    if codec_name not in CODEC_REGISTRY:
+        raise ValueError(f'Unknown compression codec {compress_value}, '
+                         f'use one of {", ".join(sorted(CODEC_REGISTRY))}')
+    return codec_name, int(codec_level) if codec_level else None
+
+
+def get_codec(compress_value, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    This function returns the codec for a FileSets Compress value
+    :param compress_value: value of the Compress column, e.g. NONE, GZIP, GZIP_STREAM, ZSTD:19, LZ4 or XZ
+    :param workers: number of compression threads for codecs that support them
+    :param block_size: size of the blocks compressed by each thread
+    :return: ArchiveCodec object
+    """
+    codec_name, codec_level = parse_codec_spec(compress_value)
+    return CODEC_REGISTRY[codec_name](codec_level, workers, block_size)
+
+
+def archive_extensions():
+    """ Return the file extensions of every registered codec, once each """
+    return tuple(dict.fromkeys(f'.{codec_class.extension}' for codec_class in CODEC_REGISTRY.values()))
+
+
+def codec_for_archive(archive_file):
+    """ Return the codec matching the extension of an archive file name, None if unknown """
+    for codec_class in sorted(CODEC_REGISTRY.values(), key=lambda cc: -len(cc.extension)):
+        if str(archive_file).endswith(f'.{codec_class.extension}'):
+            return codec_class()
+    return None
+
+
+class ArchiveCodec:
+    """
+        This class is the base of the compression codecs. A codec opens the binary stream a tar
+        archive is written to with open_writer(target), target being a path or a binary file object
+        left open, and the stream it is read from with open_reader(archive_file). Codecs whose
+        output can be cut at a known point are resumable and also continue an archive from a
+        checkpoint with open_resumed_writer(fileobj, size, block_offsets), fileobj being positioned
+        at the end of the checkpointed bytes and closed with the writer. The checkpoint code only
+        resumes the archives of codecs with resumable set.
+
+    Args
+        Required: none
+        Optional: level, workers, block_size
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    name = ""
+    extension = ""
+    default_level = None
+    seekable = False
+    resumable = False
+
+    def __init__(self, level=None, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+        self.level = self.default_level if level is None else level
+        self.workers = workers
+        self.block_size = block_size
+
+
+@register_codec
+class NoneCodec(ArchiveCodec):
+    """ Plain tar, for media and images that do not compress """
+    name = "NONE"
+    extension = "tar"
+    seekable = True
+    resumable = True
+
+    def open_writer(self, target):
+        if hasattr(target, "write"):
+            return target
+        return open(target, "wb")
+
+    def open_resumed_writer(self, fileobj, size, block_offsets):
+        return fileobj
+
+    def open_reader(self, archive_file):
+        return open(archive_file, "rb")
+
+
+@register_codec
+class GzipCodec(ArchiveCodec):
+    """
+    gzip compressed in parallel independent blocks, the historic .tgz format made seekable and resumable.
+    A block does not share its dictionary with the previous one, which costs about 0.2% of archive size
+    with 1 MB blocks. GZIP_STREAM archives are not indexed and keep that ratio.
+    """
+    name = "GZIP"
+    extension = "tgz"
+    # level 9 as tarfile w:gz wrote the archives before, GZIP:6 in the Compress column trades size for speed
+    default_level = 9
+    seekable = True
+    resumable = True
+    independent_blocks = True
+
+    def open_writer(self, target):
+        import Parallel_Gzip as pgz
+        return pgz.ParallelGzipWriter(target, compresslevel=self.level, workers=self.workers,
+                                      block_size=self.block_size, independent_blocks=self.independent_blocks)
+
+    def open_resumed_writer(self, fileobj, size, block_offsets):
+        import Parallel_Gzip as pgz
+        archive_out = pgz.ParallelGzipWriter(fileobj, compresslevel=self.level, workers=self.workers,
+                                             block_size=self.block_size, independent_blocks=True)
+        archive_out.resume_at(size, fileobj.tell(), block_offsets)
+        archive_out.close_fileobj = True
+        return archive_out
+
+    def open_reader(self, archive_file):
+        import gzip
+        return gzip.open(archive_file, "rb")
+
+
+@register_codec
+class GzipStreamCodec(GzipCodec):
+    """
+    gzip compressed in parallel blocks chained by their dictionaries into a single stream, as pigz
+    writes it. Single file restores read the archive from its start and -resume starts it over.
+    """
+    name = "GZIP_STREAM"
+    seekable = False
+    resumable = False
+    independent_blocks = False
+
+
+@register_codec
+class ZstdCodec(ArchiveCodec):
+    """ Zstandard, needs the optional zstandard package """
+    name = "ZSTD"
+    extension = "tar.zst"
+    default_level = 3
+
+    def open_writer(self, target):
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=self.level, threads=self.workers or -1)
+        if hasattr(target, "write"):
+            return compressor.stream_writer(target, closefd=False)
+        return compressor.stream_writer(open(target, "wb"), closefd=True)
+
+    def open_reader(self, archive_file):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(archive_file, "rb"), closefd=True)
+
+
+@register_codec
+class Lz4Codec(ArchiveCodec):
+    """ LZ4 frames, needs the optional lz4 package """
+    name = "LZ4"
+    extension = "tar.lz4"
+    default_level = 0
+
+    def open_writer(self, target):
+        import lz4.frame
+        return lz4.frame.open(target, "wb", compression_level=self.level)
+
+    def open_reader(self, archive_file):
+        import lz4.frame
+        return lz4.frame.open(archive_file, "rb")
+
+
+@register_codec
+class XzCodec(ArchiveCodec):
+    """ xz for text heavy sets where ratio matters more than time """
+    name = "XZ"
+    extension = "txz"
+    default_level = 6
+
+    def open_writer(self, target):
+        import lzma
+        return lzma.open(target, "wb", preset=self.level)
+
+    def open_reader(self, archive_file):
+        import lzma
+        return lzma.open(archive_file, "rb")
@@ -0,0 +1,263 @@
+import os
+import sqlite3
+
+import Config_Cache as config_cache
+
+""" This package contains the configuration backends the BackupList sheets are read from and written to"""
+
+WORKBOOK_FILE = "BackupList.xlsx"
+DATABASE_FILE = "BackupList.sqlite"
+
+# backends already opened by this process, keyed by resource path
+opened_backends = {}
+
+
+def sheet_table(sheet_title):
+    """ Return the quoted name of the SQLite table holding a sheet """
+    return '"sheet_' + sheet_title.replace('"', '""') + '"'
+
+
+def column_names(first_column, column_count):
+    """ Return the SQLite column names of column_count sheet columns from the 1-based first_column """
+    return [f'c{column}' for column in range(first_column, first_column + column_count)]
+
+
+class XlsxBackend:
+    """
+        This class reads the configuration sheets from the BackupList.xlsx workbook through the
+        compiled configuration cache and writes FileSets and FS_SIZE back into the workbook.
+
+    Args
+        Required: workbook path
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    name = "xlsx"
+
+    def __init__(self, workbook_path):
+        self.workbook_path = workbook_path
+
+    def sheet_titles(self):
+        return list(config_cache.load_workbook_sheets(self.workbook_path))
+
+    def sheet_header(self, sheet_title):
+        return config_cache.sheet_header(self.workbook_path, sheet_title)
+
+    def sheet_rows(self, sheet_title, max_col):
+        return config_cache.sheet_rows(self.workbook_path, sheet_title, max_col)
+
+    def replace_sheet_columns(self, sheet_title, first_column, header, rows):
+        # the writer pulls in xml.etree, only the modes writing a sheet import it
+        import Workbook_Writer as wb_writer
+        return wb_writer.replace_sheet_columns(self.workbook_path, sheet_title, first_column, header, rows)
+
+
+class SqliteBackend:
+    """
+        This class keeps the configuration sheets in a SQLite database, one table per sheet with
+        one row per sheet row and the columns named c1, c2... as A, B... of the workbook. The
+        header rows are kept in the sheet_headers table. Sheets are loaded with one query each, and kept
+        in memory until the database is changed by this or another process, so scripts may edit
+        the configuration while backups read it.
+
+    Args
+        Required: database path
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    name = "sqlite"
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sheets (title TEXT PRIMARY KEY, columns INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sheet_headers (title TEXT, column_number INTEGER, "
+                                "header, PRIMARY KEY (title, column_number)) WITHOUT ROWID")
+        self.connection.commit()
+        self.loaded_sheets = {}
+        self.data_version = None
+
+    def close(self):
+        self.connection.close()
+
+    def loaded(self):
+        """ Return the sheets loaded so far, dropped when another connection has changed the database """
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.loaded_sheets = {}
+            self.data_version = data_version
+        return self.loaded_sheets
+
+    def sheet_columns(self, sheet_title):
+        """ Return the number of columns kept for a sheet, None when the database has no such sheet """
+        sheet_row = self.connection.execute("SELECT columns FROM sheets WHERE title = ?", (sheet_title,)).fetchone()
+        return sheet_row[0] if sheet_row is not None else None
+
+    def sheet_titles(self):
+        return [title for title, in self.connection.execute("SELECT title FROM sheets ORDER BY rowid")]
+
+    def sheet_header(self, sheet_title):
+        header = [value for _, value in self.connection.execute(
+            "SELECT column_number, header FROM sheet_headers WHERE title = ? ORDER BY column_number",
+            (sheet_title,))]
+        return tuple(header) if header else None
+
+    def sheet_rows(self, sheet_title, max_col):
+        """
+        This method returns the rows below the header of a sheet, max_col columns wide, with
+        blank rows where the sheet has gaps, as the xlsx backend returns them
+        """
+        loaded_sheets = self.loaded()
+        if sheet_title not in loaded_sheets:
+            sheet_columns = self.sheet_columns(sheet_title)
+            if sheet_columns is None:
+                return []
+            row_count, last_row = self.connection.execute(
+                f'SELECT COUNT(*), MAX(row_number) FROM {sheet_table(sheet_title)}').fetchone()
+            if row_count == 0 or last_row - 1 == row_count:
+                # no gaps, the rows are fetched as they are
+                sheet_rows = self.connection.execute(f'SELECT {", ".join(column_names(1, sheet_columns))} '
+                                                     f'FROM {sheet_table(sheet_title)} ORDER BY row_number').fetchall()
+            else:
+                blank_row = (None,) * sheet_columns
+                sheet_rows = []
+                for row_set in self.connection.execute(
+                        f'SELECT row_number, {", ".join(column_names(1, sheet_columns))} '
+                        f'FROM {sheet_table(sheet_title)} ORDER BY row_number'):
+                    sheet_rows.extend([blank_row] * (row_set[0] - 2 - len(sheet_rows)))
+                    sheet_rows.append(row_set[1:])
+            loaded_sheets[sheet_title] = (sheet_columns, sheet_rows)
+        sheet_columns, sheet_rows = loaded_sheets[sheet_title]
+        if max_col >= sheet_columns:
+            return list(sheet_rows)
+        return [row_set[:max_col] for row_set in sheet_rows]
+
+    def create_sheet(self, sheet_title, sheet_columns):
+        """ Add an empty sheet to the database """
+        self.connection.execute(f'CREATE TABLE {sheet_table(sheet_title)} (row_number INTEGER PRIMARY KEY, '
+                                f'{", ".join(column_names(1, sheet_columns))})')
+        self.connection.execute("INSERT INTO sheets VALUES (?, ?)", (sheet_title, sheet_columns))
+
+    def replace_sheet_columns(self, sheet_title, first_column, header, rows):
+        """
+        This method replaces the data of a block of columns of one sheet in a single transaction.
+        The rows follow the header from row 2, the other columns are kept, and rows left with no
+        values are dropped.
+        :return: number of rows written below the header
+        """
+        kept_columns = self.sheet_columns(sheet_title)
+        sheet_columns = max(kept_columns or 0, first_column + len(header) - 1)
+        written_names = column_names(first_column, len(header))
+        all_names = column_names(1, sheet_columns)
+        sheet_rows = ((row_number, *row_set) for row_number, row_set in enumerate(rows, start=2))
+        try:
+            if kept_columns is None:
+                self.create_sheet(sheet_title, sheet_columns)
+            elif kept_columns < sheet_columns:
+                for column_name in all_names[kept_columns:]:
+                    self.connection.execute(f'ALTER TABLE {sheet_table(sheet_title)} ADD COLUMN {column_name}')
+                self.connection.execute("UPDATE sheets SET columns = ? WHERE title = ?",
+                                        (sheet_columns, sheet_title))
+            self.connection.executemany("INSERT OR REPLACE INTO sheet_headers VALUES (?, ?, ?)",
+                                        [(sheet_title, column, value) for column, value in
+                                         enumerate(header, start=first_column)])
+            self.connection.execute(f'UPDATE {sheet_table(sheet_title)} SET '
+                                    f'{", ".join(f"{name} = NULL" for name in written_names)}')
+            written_count = self.connection.executemany(
+                f'INSERT INTO {sheet_table(sheet_title)} (row_number, {", ".join(written_names)}) '
+                f'VALUES ({", ".join("?" * (len(written_names) + 1))}) ON CONFLICT (row_number) DO UPDATE SET '
+                f'{", ".join(f"{name} = excluded.{name}" for name in written_names)}', sheet_rows).rowcount
+            self.connection.execute(f'DELETE FROM {sheet_table(sheet_title)} WHERE '
+                                    f'{" AND ".join(f"{name} IS NULL" for name in all_names)}')
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        self.loaded_sheets.pop(sheet_title, None)
+        return written_count
+
+
+def backend_for(resource_path):
+    """
+    This function returns the configuration backend of a resource directory. BackupList.sqlite is the
+    source of truth once it has been imported, BackupList.xlsx otherwise.
+    """
+    resource_path = os.path.abspath(resource_path)
+    if resource_path not in opened_backends:
+        if os.path.exists(os.path.join(resource_path, DATABASE_FILE)):
+            opened_backends[resource_path] = SqliteBackend(os.path.join(resource_path, DATABASE_FILE))
+        else:
+            opened_backends[resource_path] = XlsxBackend(os.path.join(resource_path, WORKBOOK_FILE))
+    return opened_backends[resource_path]
+
+
+def copy_sheets(source_backend, target_backend):
+    """
+    This function copies every configuration sheet of one backend into another, the columns
+    read from each sheet are written over the target's, its other columns are kept
+    :return: dictionary of sheet title to the number of rows copied
+    """
+    copied_rows = {}
+    source_titles = source_backend.sheet_titles()
+    for sheet_title, max_col in config_cache.SHEET_COLUMNS.items():
+        if sheet_title in source_titles:
+            header = source_backend.sheet_header(sheet_title) or (None,) * max_col
+            sheet_rows = [row_set + (None,) * (max_col - len(row_set))
+                          for row_set in source_backend.sheet_rows(sheet_title, max_col)]
+            while sheet_rows and all(value is None for value in sheet_rows[-1]):
+                sheet_rows.pop()
+            copied_rows[sheet_title] = target_backend.replace_sheet_columns(sheet_title, 1, header, sheet_rows)
+    return copied_rows
+
+
+def import_workbook(resource_path):
+    """
+    This function loads the sheets of BackupList.xlsx into BackupList.sqlite, which then
+    becomes the configuration backend of the resource directory
+    :return: dictionary of sheet title to the number of rows imported
+    """
+    resource_path = os.path.abspath(resource_path)
+    database_path = os.path.join(resource_path, DATABASE_FILE)
+    database_tmp = f'{database_path}.{os.getpid()}.tmp'
+    target_backend = SqliteBackend(database_tmp)
+    try:
+        copied_rows = copy_sheets(XlsxBackend(os.path.join(resource_path, WORKBOOK_FILE)), target_backend)
+        target_backend.close()
+        os.replace(database_tmp, database_path)
+    finally:
+        target_backend.close()
+        if os.path.exists(database_tmp):
+            os.remove(database_tmp)
+    opened_backends.pop(resource_path, None)
+    return copied_rows
+
+
+def export_workbook(resource_path):
+    """
+    This function writes the sheets of BackupList.sqlite into BackupList.xlsx, keeping the
+    workbook's formulas, formatting and other sheets
+    :return: dictionary of sheet title to the number of rows exported
+    """
+    resource_path = os.path.abspath(resource_path)
+    database_path = os.path.join(resource_path, DATABASE_FILE)
+    if not os.path.exists(database_path):
+        raise FileNotFoundError(f'{database_path} has not been imported')
+    source_backend = SqliteBackend(database_path)
+    try:
+        return copy_sheets(source_backend, XlsxBackend(os.path.join(resource_path, WORKBOOK_FILE)))
+    finally:
+        source_backend.close()
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+
+""" This package contains the compiled configuration cache of the BackupList.xlsx workbook"""
+
+# sheets compiled into the cache and the number of columns read from each
+SHEET_COLUMNS = {'AppConfig': 6, 'RootPaths': 4, 'BackupSets': 6, 'StorageSets': 5, 'FileSets': 6,
+                 'GeneralList': 4, 'FS_SIZE': 3}
+CACHE_FORMAT = 2
+
+# compiled workbooks already loaded by this process, keyed by workbook path
+loaded_workbooks = {}
+
+
+def cache_file(workbook_path):
+    """ Return the cache path of a workbook, a hidden file next to it """
+    return os.path.join(os.path.dirname(workbook_path), f'.{os.path.basename(workbook_path)}.cache')
+
+
+def workbook_hash(workbook_path):
+    sha256 = hashlib.sha256()
+    with open(workbook_path, "rb") as fi:
+        for block in iter(lambda: fi.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def compile_workbook(workbook_path):
+    """
+    This function parses every configuration sheet of the workbook once
+    :return: dictionary of sheet title to the list of row tuples, the header row first
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(workbook_path, read_only=True)
+    try:
+        workbook_sheets = {}
+        for sheet_title, max_col in SHEET_COLUMNS.items():
+            if sheet_title in wb.sheetnames:
+                workbook_sheets[sheet_title] = [tuple(row_set) for row_set in wb[sheet_title].iter_rows(
+                    min_row=1, max_col=max_col, min_col=1, values_only=True)]
+    finally:
+        wb.close()
+    return workbook_sheets
+
+
+def load_workbook_sheets(workbook_path):
+    """
+    This function returns the compiled sheets of a workbook. The compiled sheets are kept in memory for the
+    process and pickled next to the workbook. The cache is used while the workbook's mtime and size are
+    unchanged, or when its content hash still matches, and the workbook is parsed again otherwise.
+    :param workbook_path: path of BackupList.xlsx
+    :return: dictionary of sheet title to the list of row tuples, the header row first
+    """
+    workbook_path = os.path.abspath(workbook_path)
+    workbook_stat = os.stat(workbook_path)
+    workbook_key = (workbook_stat.st_mtime_ns, workbook_stat.st_size)
+
+    loaded_workbook = loaded_workbooks.get(workbook_path)
+    if loaded_workbook is not None and loaded_workbook["key"] == workbook_key:
+        return loaded_workbook["sheets"]
+
+    compiled_workbook = None
+    try:
+        with open(cache_file(workbook_path), "rb") as fi:
+            compiled_workbook = pickle.load(fi)
+        if compiled_workbook.get("format") != CACHE_FORMAT:
+            compiled_workbook = None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        compiled_workbook = None
+
+    if compiled_workbook is None or compiled_workbook["key"] != workbook_key:
+        content_hash = workbook_hash(workbook_path)
+        if compiled_workbook is None or compiled_workbook["hash"] != content_hash:
+            compiled_workbook = {"format": CACHE_FORMAT, "hash": content_hash,
+                                 "sheets": compile_workbook(workbook_path)}
+        compiled_workbook["key"] = workbook_key
+        try:
+            cache_tmp = f'{cache_file(workbook_path)}.{os.getpid()}'
+            with open(cache_tmp, "wb") as fo:
+                pickle.dump(compiled_workbook, fo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_tmp, cache_file(workbook_path))
+        except OSError:
+            pass
+
+    loaded_workbooks[workbook_path] = compiled_workbook
+    return compiled_workbook["sheets"]
+
+
+def sheet_rows(workbook_path, sheet_title, max_col):
+    """
+    This function returns the rows below the header of a sheet, max_col columns wide,
+    as openpyxl iter_rows(min_row=2, max_col=max_col, values_only=True) would
+    """
+    return [row_set[:max_col] for row_set in load_workbook_sheets(workbook_path).get(sheet_title, [])[1:]]
+
+
+def sheet_header(workbook_path, sheet_title):
+    """ This function returns the header row of a sheet, None when the sheet is empty or missing """
+    workbook_sheet = load_workbook_sheets(workbook_path).get(sheet_title, [])
+    return workbook_sheet[0] if workbook_sheet else None
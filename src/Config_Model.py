@@ -0,0 +1,79 @@
+""" This package contains the in-memory configuration model built from the BackupList.xlsx sheets"""
+
+# StorageFormat of a StorageSet, compressed tar archives or a deduplicating chunk repository
+STORAGE_FORMAT_ARCHIVE = "ARCHIVE"
+STORAGE_FORMAT_REPOSITORY = "REPOSITORY"
+
+
+class BackupSetRecord:
+    """ One row of the BackupSets sheet """
+    __slots__ = ("Index", "BackupSetName", "StorageSetName", "FileSetName", "Versions", "Frequency")
+
+    def __init__(self, row_set_dict):
+        for slot in self.__slots__:
+            setattr(self, slot, row_set_dict.get(slot))
+
+
+class StorageSetRecord:
+    """ One row of the StorageSets sheet """
+    __slots__ = ("Index", "StorageSetName", "StoragePath", "DeviceType", "StorageFormat")
+
+    def __init__(self, row_set_dict):
+        for slot in self.__slots__:
+            setattr(self, slot, row_set_dict.get(slot))
+
+
+class FileSetRecord:
+    """ One row of the FileSets sheet, a FileSetName usually spans several rows """
+    __slots__ = ("Index", "FileSetName", "Includes", "Excludes", "Compress", "Recurse")
+
+    def __init__(self, row_set_dict):
+        for slot in self.__slots__:
+            setattr(self, slot, row_set_dict.get(slot))
+
+
+class ConfigModel:
+    """
+        This class holds the BackupSets, StorageSets and FileSets rows read by Excel_Converter
+        as records, indexed by BackupSetName, StorageSetName and FileSetName so every lookup
+        is a dictionary access instead of a scan of the sheet.
+
+    Args
+        Required: BackupSet, StorageSet and FileSet arrays of dictionaries
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, backup_set_aod, storage_set_aod, file_set_aod):
+        self.backup_sets = [BackupSetRecord(row_set_dict) for row_set_dict in backup_set_aod]
+        self.storage_sets = [StorageSetRecord(row_set_dict) for row_set_dict in storage_set_aod]
+        self.file_sets = [FileSetRecord(row_set_dict) for row_set_dict in file_set_aod]
+
+        # the first row of a BackupSetName or StorageSetName wins, as it did when the sheets were scanned
+        self.backup_sets_by_name = {}
+        for backup_set in self.backup_sets:
+            self.backup_sets_by_name.setdefault(str(backup_set.BackupSetName).strip(), backup_set)
+        self.storage_sets_by_name = {}
+        for storage_set in self.storage_sets:
+            self.storage_sets_by_name.setdefault(storage_set.StorageSetName, storage_set)
+        self.file_sets_by_name = {}
+        for file_set in self.file_sets:
+            self.file_sets_by_name.setdefault(file_set.FileSetName, []).append(file_set)
+
+    def backup_set(self, backup_set_name):
+        """ Return the BackupSetRecord of a BackupSetName, None if it is not in the sheet """
+        return self.backup_sets_by_name.get(str(backup_set_name).strip())
+
+    def storage_set(self, storage_set_name):
+        """ Return the StorageSetRecord of a StorageSetName, None if it is not in the sheet """
+        return self.storage_sets_by_name.get(storage_set_name)
+
+    def file_set_rows(self, file_set_name):
+        """ Return the FileSetRecords of a FileSetName in sheet order, empty if it is not in the sheet """
+        return self.file_sets_by_name.get(file_set_name, [])
@@ -1,6 +1,5 @@
 import os
 
-from openpyxl import *
 from CommonOs import OsServices as os_services
 
 
@@ -27,21 +26,22 @@ class Excel_Converter(os_services):
     FileSet_AoD = []
 
     def excelSetsConvert(self):
-        wb = load_workbook(os.path.join(self.resource_path, "BackupList.xlsx"))
-        sheetset = {'BackupSets': 6, 'StorageSets': 4, 'FileSets': 6}
+        sheetset = {'BackupSets': 6, 'StorageSets': 5, 'FileSets': 6}
+        # trailing columns which may be left blank without skipping the row
+        sheetset_optional = {'StorageSets': 1}
 
-        for ws in wb:
-            if ws.title in sheetset.keys():
-                worksheet = wb[ws.title]
+        for sheet_title in sheetset.keys():
+            if sheet_title in self.config_sheet_titles():
 
-                row_sets = [worksheetsets for worksheetsets in worksheet.iter_rows(
-                    min_row=2, max_col=sheetset[ws.title], min_col=1, values_only=True)
-                            if None not in worksheetsets]
+                required_cols = sheetset[sheet_title] - sheetset_optional.get(sheet_title, 0)
+                row_sets = [worksheetsets for worksheetsets in self.config_sheet_rows(
+                    sheet_title, sheetset[sheet_title])
+                            if None not in worksheetsets[:required_cols]]
 
                 row_set_count = 0
                 for row_set in row_sets:
                     row_set_dict = {}
-                    if worksheet.title == "BackupSets":
+                    if sheet_title == "BackupSets":
                         for index in range(len(row_set)):
                             if index == 0:
                                 row_set_dict["Index"] = row_set_count
@@ -61,7 +61,7 @@ class Excel_Converter(os_services):
                         self.BackupSet_AoD.append(row_set_dict)
                         row_set_count += 1
 
-                    elif worksheet.title == "StorageSets":
+                    elif sheet_title == "StorageSets":
                         for index in range(len(row_set)):
                             if index == 0:
                                 row_set_dict["Index"] = row_set_count
@@ -71,13 +71,15 @@ class Excel_Converter(os_services):
                                 row_set_dict["StoragePath"] = row_set[index]
                             elif index == 3:
                                 row_set_dict["DeviceType"] = row_set[index]
+                            elif index == 4:
+                                row_set_dict["StorageFormat"] = str(row_set[index] or "ARCHIVE").upper()
                             else:
                                 raise AttributeError
 
                         self.StorageSet_AoD.append(row_set_dict)
                         row_set_count += 1
 
-                    elif worksheet.title == "FileSets":
+                    elif sheet_title == "FileSets":
                         for index in range(len(row_set)):
                             if index == 0:
                                 row_set_dict["Index"] = row_set_count
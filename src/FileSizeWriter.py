@@ -1,7 +1,6 @@
 import os
 
-import pandas as pd
-from openpyxl import load_workbook
+import Run_Metrics as run_metrics
 from CommonOs import OsServices as os_services
 
 
@@ -25,16 +24,23 @@ class FSWriter(os_services):
     resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
 
     def Collect_file_sizes(self):
+        run_metric = run_metrics.RunMetric("refresh_sizes", "FS_SIZE")
         FileSizeRows = []
         IncludesRead = self.read_filesets_in()
         row_set_count = 0
 
+        # one scan of every recursive folder, nested Includes are answered from the enclosing folder's scan
+        size_table = self.folder_size_table(
+            [IncludesRead[index]["Includes"] for index in range(len(IncludesRead))
+             if str(IncludesRead[index]["Recurse"]).upper() == "YES"
+             and os.path.isdir(IncludesRead[index]["Includes"])])
+
         for index in range(len(IncludesRead)):
             for key in IncludesRead[index]:
                 FileSizeRow = {}
                 if key == "Includes" and os.path.isdir(IncludesRead[index][key]) \
                         and ("lost+found" or "Trash") not in IncludesRead[index][key]:
-                    key_size = self.getFolderSize(IncludesRead[index][key], IncludesRead[index]["Recurse"])
+                    key_size = self.getFolderSize(IncludesRead[index][key], IncludesRead[index]["Recurse"], size_table)
                     FileSizeRow["Index"] = row_set_count
                     FileSizeRow["Path"] = IncludesRead[index][key]
                     FileSizeRow["Size"] = key_size
@@ -55,47 +61,59 @@ class FSWriter(os_services):
                     pass
 
         write_files_sizes_rc = self.write_files_sizes(FileSizeRows)
+        run_metric.files = len(FileSizeRows)
+        self.record_metric(run_metric.finish(0 if write_files_sizes_rc > 0 else 1))
         return write_files_sizes_rc
 
-    def getFolderSize(self, folder, recurse):
-        itempath = ""
-        total_size = os.path.getsize(folder)
-        if str(recurse).upper() == "YES":
-            try:
-                for item in os.listdir(folder):
-                    itempath = os.path.join(folder, item)
-                    if os.path.isfile(itempath):
-                        total_size += os.path.getsize(itempath)
-                    elif os.path.isdir(itempath):
-                        total_size += self.getFolderSize(itempath, recurse)
-            except PermissionError as pe:
-                os_services.error(self, f'{itempath} is not accessible. {pe}')
-                return 0
-            except OSError as ose:
+    def folder_size_table(self, folders):
+        """
+        This method sizes a list of folders with a single scan of their union
+        :param folders: list of folder paths
+        :return: SizeTable object
+        """
+        import Size_Table as sz_table
+        metadata_catalog = self.metadata_catalog_getter()
+        try:
+            size_table = sz_table.SizeTable.scan_roots(folders, metadata_catalog)
+        finally:
+            if metadata_catalog is not None:
+                metadata_catalog.close()
+        for itempath, ose in size_table.scan_errors:
+            if isinstance(ose, PermissionError):
+                os_services.error(self, f'{itempath} is not accessible. {ose}')
+            else:
                 os_services.error(self, f'{itempath} access error. {ose}')
-                return 0
-        return total_size
+        return size_table
+
+    def getFolderSize(self, folder, recurse, size_table=None):
+        """
+        This method returns the size of a folder, including everything below it when recurse is YES
+        :param size_table: SizeTable already holding the folder, it is scanned on its own otherwise
+        """
+        if str(recurse).upper() != "YES":
+            return os.path.getsize(folder)
+        if size_table is None or size_table.folder_size(folder) is None:
+            size_table = self.folder_size_table([folder])
+        return size_table.folder_size(folder) or 0
 
     def read_filesets_in(self):
         """
         This method reads in the FileSets sheet and writes the specific columns into an array of dictionaries
         """
         resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
-        wb = load_workbook(os.path.join(self.resource_path, "BackupList.xlsx"))
         sheetset = {'FileSets': 6}
         IncludesRead = []
 
-        for ws in wb:
-            if ws.title in sheetset.keys():
-                worksheet = wb[ws.title]
+        for sheet_title in sheetset.keys():
+            if sheet_title in self.config_sheet_titles():
 
-                row_sets = [worksheetsets for worksheetsets in worksheet.iter_rows(
-                    min_row=2, max_col=sheetset[ws.title], min_col=1, values_only=True)
+                row_sets = [worksheetsets for worksheetsets in self.config_sheet_rows(
+                    sheet_title, sheetset[sheet_title])
                             if None not in worksheetsets]
                 row_set_count = 0
                 for row_set in row_sets:
                     row_set_dict = {}
-                    if worksheet.title == "FileSets":
+                    if sheet_title == "FileSets":
                         for index in range(len(row_set)):
                             if index == 0:
                                 row_set_dict["Index"] = row_set_count
@@ -116,24 +134,11 @@ class FSWriter(os_services):
 
     def write_files_sizes(self, fs_dict):
         """
-        This method writes a supplied dictionary to the FileSizes sheet of the BackupList.xlsx workbook using pandas.
-        :param fs_dict:
-        :return:
+        This method writes a supplied list of dictionaries to the FS_SIZE sheet of the configuration backend
+        in one streamed write. Rows left over from a longer previous list are cleared.
+        :param fs_dict: list of FS_SIZE row dictionaries
+        :return: number of rows written
         """
-        wb = load_workbook(os.path.join(self.resource_path, "BackupList.xlsx"))
-        writer = pd.ExcelWriter(os.path.join(self.resource_path, "BackupList.xlsx"), engine='openpyxl')
-        writer.book = wb
-        writer.sheets = dict((ws.title, ws) for ws in wb.worksheets)
-
-        ws = wb["FS_SIZE"]
-        for row in ws["B2:C1100"]:
-            for cell in row:
-                cell.value = None
-        writer.save()
-
-        df = pd.DataFrame(data=fs_dict)
-        df.to_excel(writer, sheet_name="FS_SIZE", startcol=0, startrow=0,
-                    columns=['Path', 'Size'],
-                    index_label='Index')
-        writer.save()
-        return df.size
+        return self.config_backend().replace_sheet_columns(
+            "FS_SIZE", 1, ['Index', 'Path', 'Size'],
+            ((index, row['Path'], row['Size']) for index, row in enumerate(fs_dict)))
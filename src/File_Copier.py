@@ -0,0 +1,169 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+""" This package contains the copy engine skipping unchanged files and copying the others in parallel"""
+
+# FICLONE ioctl of linux/fs.h, clones the whole file on filesystems sharing extents (btrfs, xfs)
+FICLONE = 0x40049409
+# largest request passed to copy_file_range at once
+COPY_RANGE_BYTES = 64 * 1024 * 1024
+# errors meaning the kernel shortcut is not available for these files, the copy is done by reading and writing
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                   errno.EPERM}
+
+
+def file_digest(file_path):
+    blake2b = hashlib.blake2b()
+    with open(file_path, "rb") as fi:
+        for block in iter(lambda: fi.read(1024 * 1024), b""):
+            blake2b.update(block)
+    return blake2b.digest()
+
+
+def is_unchanged(source_path, source_stat, target_path, compare_hash=False):
+    """
+    This function tells whether target_path already holds a copy of source_path: same size and
+    same mtime to the second, and the same content hash when compare_hash is True
+    """
+    try:
+        target_stat = os.stat(target_path)
+    except OSError:
+        return False
+    if target_stat.st_size != source_stat.st_size or int(target_stat.st_mtime) != int(source_stat.st_mtime):
+        return False
+    return not compare_hash or file_digest(source_path) == file_digest(target_path)
+
+
+def clone_file(fd_in, fd_out):
+    """ Clone a whole file with the FICLONE ioctl, return False when the filesystem cannot """
+    try:
+        import fcntl
+        fcntl.ioctl(fd_out, FICLONE, fd_in)
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+def copy_range(fd_in, fd_out, file_size):
+    """ Copy a file inside the kernel with copy_file_range, return False when it is not available """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied_bytes = 0
+    try:
+        while copied_bytes < file_size:
+            range_bytes = os.copy_file_range(fd_in, fd_out, min(COPY_RANGE_BYTES, file_size - copied_bytes))
+            if range_bytes == 0:
+                break
+            copied_bytes += range_bytes
+    except OSError as ose:
+        if ose.errno in FALLBACK_ERRNOS and copied_bytes == 0:
+            return False
+        raise
+    return True
+
+
+def copy_file(source_path, target_path):
+    """
+    This function copies one file with its permissions and times, cloning it or copying it inside the
+    kernel where the filesystems allow it. The copy is written beside the target and renamed over it,
+    so an interrupted copy never leaves a partial target behind. Every copy gets its own temporary file.
+    :return: number of bytes copied
+    """
+    tmp_fd, target_tmp = tempfile.mkstemp(dir=os.path.dirname(target_path) or os.curdir,
+                                          prefix=f'.{os.path.basename(target_path)}.', suffix=".tmp")
+    try:
+        with os.fdopen(tmp_fd, "wb") as fo, open(source_path, "rb") as fi:
+            file_size = os.fstat(fi.fileno()).st_size
+            if not clone_file(fi.fileno(), fo.fileno()) and not copy_range(fi.fileno(), fo.fileno(), file_size):
+                shutil.copyfileobj(fi, fo, 1024 * 1024)
+        shutil.copystat(source_path, target_tmp)
+        os.replace(target_tmp, target_path)
+    finally:
+        if os.path.exists(target_tmp):
+            os.remove(target_tmp)
+    return file_size
+
+
+class CopyStats:
+    """
+    This class counts the files copied, skipped and failed by the copy threads and the bytes copied
+    """
+
+    def __init__(self):
+        self.copied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.copied_bytes = 0
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return f'copied {self.copied}, skipped {self.skipped} unchanged, failed {self.failed}, ' \
+               f'{self.copied_bytes / (1024 * 1024):.1f} MB moved'
+
+
+class FileCopier:
+    """
+        This class copies a list of files into their target folders with a pool of threads.
+        Files whose target already has the same size and mtime are skipped, the others are
+        cloned, copied with copy_file_range or read and written, whichever the filesystems allow.
+
+    Args
+        Required: none
+        Optional: workers, compare_hash
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, workers=None, compare_hash=False):
+        self.workers = workers
+        self.compare_hash = compare_hash
+
+    def copy_one(self, source_path, target_path, copy_stats):
+        try:
+            source_stat = os.stat(source_path)
+            if is_unchanged(source_path, source_stat, target_path, self.compare_hash):
+                with copy_stats.lock:
+                    copy_stats.skipped += 1
+                return
+            copied_bytes = copy_file(source_path, target_path)
+        except Exception as ex:
+            # an error of any kind fails this file only, it is counted and reported with the others
+            with copy_stats.lock:
+                copy_stats.failed += 1
+                copy_stats.errors.append((source_path, ex))
+            return
+        with copy_stats.lock:
+            copy_stats.copied += 1
+            copy_stats.copied_bytes += copied_bytes
+
+    def copy_files(self, copy_pairs):
+        """
+        This method copies every (source file, target folder) pair, creating the target folders first
+        :param copy_pairs: iterable of source file path and target folder tuples
+        :return: CopyStats object
+        """
+        copy_stats = CopyStats()
+        copy_pairs = list(copy_pairs)
+        for target_folder in {target_folder for _, target_folder in copy_pairs}:
+            os.makedirs(target_folder, exist_ok=True)
+        # one copy per target path, the last pair naming it wins as when the files were copied one by one
+        target_sources = {}
+        for source_path, target_folder in copy_pairs:
+            target_sources[os.path.join(target_folder, os.path.basename(source_path))] = source_path
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            copy_futures = [executor.submit(self.copy_one, source_path, target_path, copy_stats)
+                            for target_path, source_path in target_sources.items()]
+        for copy_future in copy_futures:
+            copy_future.result()
+        return copy_stats
@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+""" This package contains the SQLite catalog of filesystem metadata shared by the scan, size and backup modes"""
+
+CATALOG_FILE = "metadata.sqlite"
+KIND_FILE = 0
+KIND_DIR = 1
+KIND_LINK = 2
+# longest time a write transaction is held, backup workers in other processes share the catalog
+COMMIT_SECONDS = 1.0
+
+
+def entry_kind(mode):
+    """ Return the catalog kind of an lstat st_mode """
+    if stat.S_ISLNK(mode):
+        return KIND_LINK
+    if stat.S_ISDIR(mode):
+        return KIND_DIR
+    return KIND_FILE
+
+
+def subtree_range(dir_path):
+    """ Return the bounds of the paths strictly below dir_path, for an index range scan """
+    dir_path = dir_path.rstrip("/")
+    return f'{dir_path}/', f'{dir_path}0'
+
+
+class MetadataCatalog:
+    """
+        This class keeps the path, inode, size and mtime of every directory and entry scanned by
+        -reload, -refresh_sizes or a backup run in a SQLite database, one row per directory with
+        its listing packed in it. A directory whose inode and mtime have not changed since it was
+        cataloged is not listed again, its entry names come from the catalog. File sizes and mtimes
+        change without touching the directory mtime, so callers needing them current ask for the
+        entries to be re-stat'ed. Reports read the cataloged sizes without touching the disk.
+
+    Args
+        Required: catalog file
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, catalog_file):
+        self.catalog_file = catalog_file
+        # one connection shared by the scanner threads, every statement runs under the lock
+        self.connection = sqlite3.connect(catalog_file, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.last_commit = time.monotonic()
+        self.preloaded_dirs = {}
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, inode INTEGER, "
+                                    "mtime_ns INTEGER, size INTEGER, file_bytes INTEGER, listing TEXT) "
+                                    "WITHOUT ROWID")
+            self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.commit()
+            except sqlite3.Error:
+                pass
+            finally:
+                self.connection.close()
+
+    def preload_subtree(self, root_path):
+        """
+        This method reads the cataloged listings of a whole tree with one range query, so the
+        directories of a scan are checked against memory instead of one query each
+        """
+        root_path = os.path.normpath(str(root_path))
+        lower_bound, upper_bound = subtree_range(root_path)
+        with self.lock:
+            for path, inode, mtime_ns, listing in self.connection.execute(
+                    "SELECT path, inode, mtime_ns, listing FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                    (root_path, lower_bound, upper_bound)):
+                self.preloaded_dirs[path] = (inode, mtime_ns, listing)
+
+    def cached_entries(self, dir_path, dir_stat):
+        """ Return the cataloged entries of a directory when its inode and mtime still match, None otherwise """
+        dir_row = self.preloaded_dirs.pop(dir_path, None)
+        if dir_row is None:
+            with self.lock:
+                dir_row = self.connection.execute("SELECT inode, mtime_ns, listing FROM dirs WHERE path = ?",
+                                                  (dir_path,)).fetchone()
+        if dir_row is None or dir_row[:2] != (dir_stat.st_ino, dir_stat.st_mtime_ns):
+            return None
+        return [tuple(dir_entry) for dir_entry in json.loads(dir_row[2])]
+
+    def list_dir(self, dir_path, stat_entries=False):
+        """
+        This method lists a directory through the catalog
+        :param dir_path: directory to list
+        :param stat_entries: True to lstat every entry so size and mtime are current
+        :return: tuple of the directory's stat result and a list of (name, kind, inode, size, mtime_ns)
+        :raise OSError: when the directory cannot be stat'ed or listed
+        """
+        dir_stat = os.stat(dir_path)
+        dir_entries = self.cached_entries(dir_path, dir_stat)
+        if dir_entries is not None and not stat_entries:
+            return dir_stat, dir_entries
+
+        if dir_entries is None:
+            with os.scandir(dir_path) as dir_scan:
+                names_kinds = [(dir_entry.name, KIND_LINK if dir_entry.is_symlink()
+                                else KIND_DIR if dir_entry.is_dir(follow_symlinks=False) else KIND_FILE,
+                                dir_entry.inode()) for dir_entry in dir_scan]
+        else:
+            names_kinds = [(name, kind, inode) for name, kind, inode, _, _ in dir_entries]
+
+        if stat_entries:
+            dir_entries = []
+            for name, kind, inode in names_kinds:
+                try:
+                    entry_stat = os.lstat(os.path.join(dir_path, name))
+                except OSError:
+                    continue
+                dir_entries.append((name, entry_kind(entry_stat.st_mode), entry_stat.st_ino,
+                                    entry_stat.st_size, entry_stat.st_mtime_ns))
+        else:
+            dir_entries = [(name, kind, inode, None, None) for name, kind, inode in names_kinds]
+        self.record_dir(dir_path, dir_stat, dir_entries)
+        return dir_stat, dir_entries
+
+    def record_dir(self, dir_path, dir_stat, dir_entries):
+        """
+        This method replaces the cataloged listing of a directory. Subdirectories no longer
+        in the listing are dropped from the catalog with everything below them.
+        :param dir_entries: list of (name, kind, inode, size, mtime_ns)
+        """
+        subdir_names = {name for name, kind, _, _, _ in dir_entries if kind == KIND_DIR}
+        file_sizes = [size for _, kind, _, size, _ in dir_entries if kind != KIND_DIR and size is not None]
+        with self.lock:
+            dir_row = self.connection.execute("SELECT listing FROM dirs WHERE path = ?", (dir_path,)).fetchone()
+            if dir_row is not None:
+                for name, kind, _, _, _ in json.loads(dir_row[0]):
+                    if kind == KIND_DIR and name not in subdir_names:
+                        self.forget_subtree(os.path.join(dir_path, name))
+            self.connection.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)",
+                                    (dir_path, dir_stat.st_ino, dir_stat.st_mtime_ns, dir_stat.st_size,
+                                     sum(file_sizes) if file_sizes else None,
+                                     json.dumps(dir_entries, separators=(",", ":"))))
+            if time.monotonic() - self.last_commit >= COMMIT_SECONDS:
+                self.connection.commit()
+                self.last_commit = time.monotonic()
+
+    def record_listing(self, dir_path, dir_stat, member_stats):
+        """
+        Catalog a directory from (name, lstat result) pairs its caller already has. Recording is best
+        effort, a catalog locked by another process beyond the timeout is left as it is.
+        :return: True when the listing was recorded
+        """
+        try:
+            self.record_dir(dir_path, dir_stat, [(name, entry_kind(member_stat.st_mode), member_stat.st_ino,
+                                                  member_stat.st_size, member_stat.st_mtime_ns)
+                                                 for name, member_stat in member_stats])
+        except sqlite3.Error:
+            return False
+        return True
+
+    def forget_subtree(self, dir_path):
+        """ Drop a directory and everything below it, the caller holds the lock """
+        lower_bound, upper_bound = subtree_range(dir_path)
+        self.connection.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                (dir_path, lower_bound, upper_bound))
+
+    def folder_size(self, dir_path):
+        """
+        Return the cataloged size of a folder and everything below it, without touching the disk
+        :return: size in bytes, None when the folder is not cataloged
+        """
+        dir_path = os.path.normpath(str(dir_path))
+        lower_bound, upper_bound = subtree_range(dir_path)
+        with self.lock:
+            dir_count, dir_bytes, file_bytes = self.connection.execute(
+                "SELECT COUNT(*), SUM(size), SUM(file_bytes) FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                (dir_path, lower_bound, upper_bound)).fetchone()
+        if dir_count == 0:
+            return None
+        return (dir_bytes or 0) + (file_bytes or 0)
+
+    def fileset_size(self, includes):
+        """ Return the cataloged size of a list of Includes paths, folders with everything below them """
+        fileset_bytes = 0
+        for include in includes:
+            include = os.path.normpath(str(include))
+            include_bytes = self.folder_size(include)
+            if include_bytes is None:
+                include_dir, include_name = os.path.split(include)
+                with self.lock:
+                    dir_row = self.connection.execute("SELECT listing FROM dirs WHERE path = ?",
+                                                      (include_dir,)).fetchone()
+                for name, kind, _, size, _ in json.loads(dir_row[0]) if dir_row is not None else []:
+                    if name == include_name:
+                        include_bytes = size
+            fileset_bytes += include_bytes or 0
+        return fileset_bytes
@@ -0,0 +1,196 @@
+import errno
+import mmap
+import os
+
+""" This package contains the file readers keeping the files read by a backup out of the page cache"""
+
+READ_MODE_CACHE = "cache"
+READ_MODE_DONTNEED = "dontneed"
+READ_MODE_DIRECT = "direct"
+READ_MODES = (READ_MODE_CACHE, READ_MODE_DONTNEED, READ_MODE_DIRECT)
+# pages already read are dropped every DROP_BYTES, so a large file does not fill the cache before it is closed
+DROP_BYTES = 8 * 1024 * 1024
+# files from this size are read with O_DIRECT in direct mode, smaller ones do not pay for the aligned buffer
+DIRECT_MIN_BYTES = 64 * 1024 * 1024
+DIRECT_BUFFER_BYTES = 8 * 1024 * 1024
+
+# libc functions loaded on first use, False when they are not available
+loaded_libc = None
+
+
+def fadvise(fd, offset, length, advice_name):
+    """ Give the kernel an advice about a range of a file, where the platform has posix_fadvise """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+        except OSError:
+            pass
+
+
+def libc():
+    """ Return libc with mmap, mincore and munmap typed for ctypes, None when they cannot be loaded """
+    global loaded_libc
+    if loaded_libc is None:
+        import ctypes
+        import ctypes.util
+        try:
+            loaded_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            loaded_libc.mmap.restype = ctypes.c_void_p
+            loaded_libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int,
+                                         ctypes.c_int, ctypes.c_long]
+            loaded_libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+            loaded_libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        except (OSError, AttributeError):
+            loaded_libc = False
+    return loaded_libc or None
+
+
+def resident_pages(fd, file_size):
+    """
+    This function counts the pages of a file held in the page cache, with mincore on a mapping of the
+    file that is never read, so the count does not change what it measures
+    :return: tuple of the resident and total pages, None when mincore is not available
+    """
+    total_pages = (file_size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    if total_pages == 0:
+        return 0, 0
+    libc_functions = libc()
+    if libc_functions is None:
+        return None
+    import ctypes
+    file_map = libc_functions.mmap(None, file_size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+    if file_map in (None, ctypes.c_void_p(-1).value):
+        return None
+    try:
+        page_vector = (ctypes.c_ubyte * total_pages)()
+        if libc_functions.mincore(file_map, file_size, page_vector) != 0:
+            return None
+        return total_pages - bytes(page_vector).count(0), total_pages
+    finally:
+        libc_functions.munmap(file_map, file_size)
+
+
+def path_residency(path):
+    """ Return the resident and total pages of a file, None when they cannot be counted """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return resident_pages(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+
+
+class UncachedFile:
+    """
+        This class reads a file for the backup without leaving it in the page cache. The kernel
+        is told the file is read sequentially, and the pages read are dropped every DROP_BYTES and
+        when the file is closed. Files from DIRECT_MIN_BYTES can be read with O_DIRECT through an
+        aligned buffer, bypassing the cache. A file already in the cache before the backup is part
+        of someone's working set and is read as usual.
+
+    Args
+        Required: file path
+        Optional: direct
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, path, direct=False):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.file_size = os.fstat(self.fd).st_size
+        self.offset = 0
+        self.dropped_offset = 0
+        self.direct_buffer = None
+        self.buffer_start = 0
+        self.buffer_end = 0
+        page_counts = resident_pages(self.fd, self.file_size)
+        self.keep_cached = page_counts is not None and page_counts[0] > 0
+        if direct and not self.keep_cached and self.file_size >= DIRECT_MIN_BYTES and hasattr(os, "O_DIRECT"):
+            try:
+                direct_fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+            except OSError:
+                # tmpfs and some network filesystems refuse O_DIRECT
+                direct_fd = None
+            if direct_fd is not None:
+                os.close(self.fd)
+                self.fd = direct_fd
+                # anonymous maps are page aligned, as O_DIRECT needs
+                self.direct_buffer = mmap.mmap(-1, DIRECT_BUFFER_BYTES)
+        if self.direct_buffer is None:
+            fadvise(self.fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(DROP_BYTES), b""))
+        if self.direct_buffer is not None:
+            return self.read_direct(size)
+        data = os.read(self.fd, size)
+        self.offset += len(data)
+        if not self.keep_cached and self.offset - self.dropped_offset >= DROP_BYTES:
+            fadvise(self.fd, self.dropped_offset, self.offset - self.dropped_offset, "POSIX_FADV_DONTNEED")
+            self.dropped_offset = self.offset
+        return data
+
+    def read_direct(self, size):
+        """ Return up to size bytes from the aligned buffer, refilled a whole buffer at a time """
+        if self.buffer_start == self.buffer_end:
+            try:
+                self.buffer_end = os.readv(self.fd, [self.direct_buffer])
+            except OSError as ose:
+                if ose.errno != errno.EINVAL:
+                    raise
+                # the filesystem accepted O_DIRECT at open but not the read, continue through the cache
+                self.fallback_to_cached()
+                return self.read(size)
+            self.buffer_start = 0
+            self.offset += self.buffer_end
+        data = self.direct_buffer[self.buffer_start:min(self.buffer_start + size, self.buffer_end)]
+        self.buffer_start += len(data)
+        return data
+
+    def fallback_to_cached(self):
+        os.close(self.fd)
+        self.fd = os.open(self.path, os.O_RDONLY)
+        os.lseek(self.fd, self.offset, os.SEEK_SET)
+        self.direct_buffer.close()
+        self.direct_buffer = None
+        self.buffer_start = self.buffer_end = 0
+        self.dropped_offset = self.offset
+        fadvise(self.fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            if self.direct_buffer is None and not self.keep_cached:
+                fadvise(self.fd, 0, 0, "POSIX_FADV_DONTNEED")
+        finally:
+            os.close(self.fd)
+            self.fd = None
+            if self.direct_buffer is not None:
+                self.direct_buffer.close()
+                self.direct_buffer = None
+
+
+def open_member(path, read_mode=READ_MODE_CACHE):
+    """
+    This function opens a file to be archived in a read mode: cache reads through the page cache as
+    before, dontneed drops the pages read and direct also reads large files with O_DIRECT
+    :return: binary file object
+    """
+    if read_mode == READ_MODE_DONTNEED:
+        return UncachedFile(path)
+    if read_mode == READ_MODE_DIRECT:
+        return UncachedFile(path, direct=True)
+    return open(path, "rb")
@@ -0,0 +1,206 @@
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+""" This package contains a gzip writer that compresses fixed size blocks in a pool of threads"""
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DICTIONARY_SIZE = 32 * 1024
+
+
+def compress_block(block, zdict, compresslevel, last_block):
+    """
+    This function deflates one block of the stream. The block is primed with the last 32K of
+    the previous block and ends on a sync flush, so the blocks concatenate into a single deflate stream.
+    zlib releases the GIL while compressing, which lets the blocks run in parallel threads.
+    :param block: uncompressed bytes of the block
+    :param zdict: last 32K of the previous block, or None for the first block
+    :param compresslevel: zlib compression level 1-9
+    :param last_block: True to finish the deflate stream after this block
+    :return: raw deflate bytes of the block
+    """
+    if zdict:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last_block else zlib.Z_SYNC_FLUSH)
+
+
+def compress_member(block, compresslevel):
+    """
+    This function compresses one block into a complete gzip member, so it can be decompressed
+    on its own starting from its offset in the file
+    :param block: uncompressed bytes of the block
+    :param compresslevel: zlib compression level 1-9
+    :return: gzip member bytes
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return gzip_header() + compressor.compress(block) + compressor.flush(zlib.Z_FINISH) + \
+        struct.pack("<LL", zlib.crc32(block) & 0xffffffff, len(block) & 0xffffffff)
+
+
+def gzip_header():
+    """ Return a gzip member header """
+    return b"\x1f\x8b\x08\x00" + struct.pack("<L", int(time.time())) + b"\x00\xff"
+
+
+class ParallelGzipWriter:
+    """
+        This class is a write only file object producing a single member gzip file, like pigz.
+        Data written is cut into fixed size blocks which are compressed in a thread pool
+        and written to the target in order. The output is readable by gzip, tar xzf and tarfile.
+
+        With independent_blocks each block is written as its own gzip member instead, and
+        block_offsets maps the uncompressed offset of every block to its offset in the file,
+        so a reader can seek to any block and start decompressing there.
+
+    Args
+        Required: target path or binary file object
+        Optional: compresslevel, workers, block_size, independent_blocks
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, target, compresslevel=9, workers=None, block_size=DEFAULT_BLOCK_SIZE,
+                 independent_blocks=False):
+        if hasattr(target, "write"):
+            self.fileobj = target
+            self.close_fileobj = False
+        else:
+            self.fileobj = open(target, "wb")
+            self.close_fileobj = True
+        self.compresslevel = compresslevel
+        self.workers = workers or os.cpu_count() or 1
+        self.active_workers = self.workers
+        self.block_size = max(int(block_size), DICTIONARY_SIZE)
+        self.buffer = bytearray()
+        self.zdict = None
+        self.independent_blocks = independent_blocks
+        self.crc = 0
+        self.size = 0
+        self.submitted_size = 0
+        self.compressed_size = 0
+        self.block_offsets = []
+        self.pending_blocks = deque()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.closed = False
+        if not self.independent_blocks:
+            self.write_compressed(gzip_header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_compressed(self, data, block_offset=None):
+        """ Write compressed bytes to the target, recording where each independent block starts """
+        if block_offset is not None:
+            self.block_offsets.append((block_offset, self.compressed_size))
+        self.fileobj.write(data)
+        self.compressed_size += len(data)
+
+    def write(self, data):
+        """ Buffer the data and submit every full block for compression """
+        if self.closed:
+            raise ValueError("write to closed file")
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[:self.block_size])
+            del self.buffer[:self.block_size]
+            self.submit_block(block, False)
+        return len(data)
+
+    def tell(self):
+        """ Return the number of uncompressed bytes written """
+        return self.size
+
+    def submit_block(self, block, last_block):
+        """ Queue a block to the pool, keeping the CRC in stream order """
+        if self.independent_blocks:
+            if len(block) == 0 and self.submitted_size > 0:
+                return
+            self.pending_blocks.append(
+                (self.submitted_size, self.executor.submit(compress_member, block, self.compresslevel)))
+        else:
+            self.crc = zlib.crc32(block, self.crc)
+            self.pending_blocks.append(
+                (None, self.executor.submit(compress_block, block, self.zdict, self.compresslevel, last_block)))
+            self.zdict = block[-DICTIONARY_SIZE:]
+        self.submitted_size += len(block)
+        # a block is queued behind the running ones unless fewer threads than the pool were asked for
+        max_pending = self.workers * 2 if self.active_workers >= self.workers else self.active_workers - 1
+        while len(self.pending_blocks) > max_pending:
+            self.write_pending_block()
+
+    def set_workers(self, workers):
+        """ Change the number of blocks compressed at once while writing, None for the whole pool """
+        self.active_workers = max(1, min(int(workers or self.workers), self.workers))
+
+    def write_pending_block(self):
+        """ Wait for the oldest queued block and write it """
+        block_offset, future = self.pending_blocks.popleft()
+        self.write_compressed(future.result(), block_offset)
+
+    def flush(self):
+        """ Blocks are only written once compressed, so there is nothing to flush until close """
+        pass
+
+    def sync(self):
+        """
+        This method ends the current block early, writes every pending block and fsyncs the target,
+        so the file up to compressed_size is made of complete gzip members holding the first size
+        bytes written. Only independent blocks can be cut this way.
+        :return: tuple of the uncompressed size, the compressed size and the block offsets
+        """
+        if not self.independent_blocks:
+            raise ValueError("only independent blocks can be synced")
+        if len(self.buffer) > 0:
+            self.submit_block(bytes(self.buffer), False)
+            self.buffer = bytearray()
+        while self.pending_blocks:
+            self.write_pending_block()
+        self.fileobj.flush()
+        os.fsync(self.fileobj.fileno())
+        return self.size, self.compressed_size, list(self.block_offsets)
+
+    def resume_at(self, size, compressed_size, block_offsets):
+        """
+        This method continues a file cut by sync, the target file object being positioned at compressed_size
+        :param size: uncompressed size returned by sync
+        :param compressed_size: compressed size returned by sync
+        :param block_offsets: block offsets returned by sync
+        """
+        if not self.independent_blocks or self.size > 0:
+            raise ValueError("only a new writer of independent blocks can be resumed")
+        self.size = self.submitted_size = size
+        self.compressed_size = compressed_size
+        self.block_offsets = [tuple(block_offset) for block_offset in block_offsets]
+
+    def close(self):
+        """ Compress the last block, write the trailer and close the target """
+        if self.closed:
+            return
+        try:
+            self.submit_block(bytes(self.buffer), True)
+            self.buffer = bytearray()
+            while self.pending_blocks:
+                self.write_pending_block()
+            if not self.independent_blocks:
+                self.write_compressed(struct.pack("<LL", self.crc & 0xffffffff, self.size & 0xffffffff))
+            self.fileobj.flush()
+        finally:
+            self.closed = True
+            self.executor.shutdown()
+            if self.close_fileobj:
+                self.fileobj.close()
@@ -1,11 +1,18 @@
 import argparse
+import contextlib
 import os
 import socket
+import stat
 import sys
-import tarfile
 import time
 
-import Target_File_Builder as tfb
+import Backup_Manifest as bm
+import Config_Backend as cb
+import Config_Model as cm
+import Page_Cache as page_cache
+import Run_Metrics as run_metrics
+from Backup_Restore import BackupRestore as backup_restore
+from Backup_Scheduler import BackupScheduler as backup_scheduler
 from CommonOs import OsServices as os_services
 
 from Excel_Converter import Excel_Converter as excel_conv
@@ -14,7 +21,7 @@ from Reload_Filesets import ReloadFileSets as reload_filesets
 from Update_General import UpdateGeneral as updg
 
 
-class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
+class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, backup_scheduler, backup_restore, os_services):
     """
     This class contains the methods to read the FileSets sheet and
     collects and updates the 'Estimated Size' cell for each row
@@ -39,8 +46,10 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
         self.BackupSet_AoD = []
         self.StorageSet_AoD = []
         self.FileSet_AoD = []
+        self.config_model = None
         self.args = ""
         self.resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
+        self.metrics_run_id = run_metrics.new_run_id()
 
     def parseCommandLine(self):
         """
@@ -65,7 +74,62 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
                                  help=f'Pass refresh_sizes to collect and update the file size sheet '
                                       f'of the BackupSetList.xlsx')
             megroup.add_argument("-report", action="store_true", required=False,
-                                 help=f'Create a report of all active backups')
+                                 help=f'Create a report of the cataloged archives of every BackupSet')
+            megroup.add_argument("-restore", required=False,
+                                 help=f'Pass the name of a BackupSet to restore')
+            megroup.add_argument("-config_import", action="store_true", required=False,
+                                 help=f'Pass to import the sheets of BackupList.xlsx into BackupList.sqlite in the '
+                                      f'resources directory, which is then read instead of the workbook. '
+                                      f'Remove BackupList.sqlite to go back to the workbook.')
+            megroup.add_argument("-config_export", action="store_true", required=False,
+                                 help=f'Pass to export the sheets of BackupList.sqlite into BackupList.xlsx '
+                                      f'for review and editing')
+            parser.add_argument("-restore_version", required=False,
+                                help=f'Pass the YYYYMMDD date of the BackupSet version to restore, '
+                                     f'defaults to the latest version')
+            parser.add_argument("-restore_paths", nargs="+", required=False,
+                                help=f'Pass one or more path globs to restore only the matching files')
+            parser.add_argument("-restore_to", required=False,
+                                help=f'Pass the directory to restore into, defaults to $HOME/restore/<BackupSet>')
+            parser.add_argument("-jobs", type=int, default=1, required=False,
+                                help=f'Pass the number of BackupSets to archive in parallel with -run_frequency, '
+                                     f'or the number of restore workers with -restore')
+            parser.add_argument("-jobs_per_storage", type=int, default=1, required=False,
+                                help=f'Pass the maximum number of parallel BackupSets written to the same '
+                                     f'storage device')
+            parser.add_argument("-level", choices=[bm.LEVEL_FULL, bm.LEVEL_INCREMENTAL, bm.LEVEL_DIFFERENTIAL],
+                                default=bm.LEVEL_FULL, required=False,
+                                help=f'Pass 0 for a full backup, 1 for an incremental since the last backup or '
+                                     f'diff for a differential since the last full backup')
+            parser.add_argument("-compress_threads", type=int, required=False,
+                                help=f'Pass the number of threads compressing each archive, '
+                                     f'defaults to the CPU count')
+            parser.add_argument("-compress_block_size", type=int, required=False,
+                                help=f'Pass the size in MB of the blocks compressed by each thread, defaults to 1')
+            parser.add_argument("-read_mode", choices=page_cache.READ_MODES, default=page_cache.READ_MODE_CACHE,
+                                required=False,
+                                help=f'Pass dontneed to drop the files read by the backup from the page cache, or '
+                                     f'direct to also read large files with O_DIRECT, defaults to cache')
+            parser.add_argument("-resume", action="store_true", required=False,
+                                help=f'Pass with -run_frequency to continue the archives of an interrupted run '
+                                     f'from their last checkpoint instead of starting them over')
+            parser.add_argument("-hash_compare", action="store_true", required=False,
+                                help=f'Pass with -upd_general to compare the content of files whose size and '
+                                     f'mtime match their copy before skipping them')
+            parser.add_argument("-metrics_textfile", required=False,
+                                help=f'Pass the path of a Prometheus node-exporter textfile, e.g. '
+                                     f'<textfile collector directory>/pythonbackup.prom, to export the metrics '
+                                     f'of the run into it')
+            parser.add_argument("-profile", action="store_true", required=False,
+                                help=f'Pass to profile the config load, include expansion, archive and retention '
+                                     f'phases of the run with cProfile and tracemalloc, into $HOME/reports. '
+                                     f'The run is slower while profiled.')
+            parser.add_argument("-no_catalog", action="store_true", required=False,
+                                help=f'Pass to scan without reading or updating the metadata catalog '
+                                     f'in $HOME/catalogs')
+            parser.add_argument("-file_log", action="store_true", required=False,
+                                help=f'Pass to write a debug line for every file archived or copied into its own '
+                                     f'$HOME/logs/<script>.<date>.files.log, whatever the log level')
 
             self.args = parser.parse_args()
         except Exception as e:
@@ -77,24 +141,28 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
     def run_PythonBackup(self):
         if self.args.report:
             os_services.info(self, f"Create a report")
-            self.backup_reporter()
+            with self.profile_phase("report"):
+                self.backup_reporter()
 
         elif self.args.reload:
-            FileSetRows = reload_filesets.Build_FileSets(self)
+            with self.profile_phase("reload"):
+                FileSetRows = reload_filesets.Build_FileSets(self)
             if len(FileSetRows) > 0:
                 os_services.info(self, f"Reload of FileSets in BackupList.xlsx loaded {len(FileSetRows)} rows.")
             else:
                 os_services.error(self, f"Reload of FileSets in BackupList.xlsx failed.")
 
         elif self.args.upd_general:
-            updg_rc = updg.Collect_General_Files(self)
+            with self.profile_phase("update general"):
+                updg_rc = updg.Collect_General_Files(self)
             if updg_rc > 0:
                 os_services.info(self, f"Update of General folder loaded {updg_rc} rows.")
             else:
                 os_services.error(self, f'Update of General files has failed.')
 
         elif self.args.refresh_sizes:
-            file_sizes_rc = file_sizes.Collect_file_sizes(self)
+            with self.profile_phase("refresh sizes"):
+                file_sizes_rc = file_sizes.Collect_file_sizes(self)
             if file_sizes_rc > 0:
                 os_services.info(self, f"File Size Refresh loaded {file_sizes_rc} rows.")
             else:
@@ -102,18 +170,95 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
 
         elif self.args.run_frequency:
             os_services.info(self, f'Backing up host {socket.gethostname()}.\n')
-            self.backupSetGetter()
-            self.backup_start(self.args.run_frequency)
+            with self.profile_phase("config load"):
+                self.backupSetGetter()
+            archive_rcs = self.backup_start(self.args.run_frequency)
+            for backup_set_name, archive_rc in archive_rcs.items():
+                if archive_rc != 0:
+                    os_services.error(self, f'BackupSet {backup_set_name} returned {archive_rc}')
             os_services.info(self, f'Completed {socket.gethostname()} backup')
 
+        elif self.args.restore:
+            with self.profile_phase("config load"):
+                self.backupSetGetter()
+            with self.profile_phase("restore"):
+                restore_rc = self.restore_start(self.args.restore, self.args.restore_version,
+                                                self.args.restore_paths, self.args.restore_to, self.args.jobs)
+            if restore_rc >= 0:
+                os_services.info(self, f"Restore of BackupSet {self.args.restore} restored {restore_rc} files.")
+            else:
+                os_services.error(self, f'Restore of BackupSet {self.args.restore} has failed.')
+
+        elif self.args.config_import:
+            imported_rows = cb.import_workbook(self.resource_path)
+            for sheet_title, row_count in imported_rows.items():
+                os_services.info(self, f"Imported {row_count} {sheet_title} rows into {cb.DATABASE_FILE}.")
+
+        elif self.args.config_export:
+            try:
+                exported_rows = cb.export_workbook(self.resource_path)
+            except FileNotFoundError as fnf:
+                os_services.error(self, f'Export of the configuration has failed. {fnf}')
+            else:
+                for sheet_title, row_count in exported_rows.items():
+                    os_services.info(self, f"Exported {row_count} {sheet_title} rows into {cb.WORKBOOK_FILE}.")
+
         else:
             print(f"Missing a run type parameter of "
-                  f"-report, -reload, -upd_general, -refresh_sizes or -run_frequency. "
-                  f"Exiting.")
+                  f"-report, -reload, -upd_general, -refresh_sizes, -restore, -run_frequency, "
+                  f"-config_import or -config_export. Exiting.")
             sys.exit(1)
 
+        if getattr(self.args, "metrics_textfile", None):
+            sample_count = self.export_metrics(self.args.metrics_textfile)
+            os_services.debug(self, f'Exported {sample_count} samples into {self.args.metrics_textfile}')
+
     def backup_start(self, run_frequency):
+        """
+        This method archives every BackupSet scheduled for the run frequency, either one at a time
+        or, when -jobs is greater than 1, in a pool of worker processes
+        :param run_frequency: DAILY, WEEKLY, MONTHLY, ARCHIVE or ANY
+        :return: dictionary of BackupSetName to archive return code
+        """
+        import Throttle as throttle
+        run_metric = run_metrics.RunMetric("backup", str(run_frequency).upper())
+        # set before the workers are started, so they append to the same metrics file
+        self.getMetricsFile()
+        with self.profile_phase("include expansion"):
+            backup_jobs = self.backup_jobs_getter(run_frequency)
+        throttle.install_signal_handlers()
+        max_jobs = getattr(self.args, "jobs", 1) or 1
+        jobs_per_storage = getattr(self.args, "jobs_per_storage", 1) or 1
+
+        if max_jobs > 1 and len(backup_jobs) > 1:
+            archive_rcs = self.backup_jobs_dispatch(backup_jobs, max_jobs, jobs_per_storage)
+        else:
+            archive_rcs = {}
+            for backup_job in backup_jobs:
+                archive_rcs[backup_job["BackupSetName"]] = self.backup_set_archive(backup_job)
+            with self.profile_phase("retention"):
+                self.pruning_wait()
+
+        # the run totals add up the metrics recorded by every BackupSet, in this process or a worker
+        for set_metric in self.run_metrics_getter():
+            if set_metric["operation"] in ("archive", "snapshot"):
+                run_metric.files += set_metric["files"]
+                for field in ("bytes_read", "bytes_written"):
+                    if set_metric[field] is not None:
+                        setattr(run_metric, field, (getattr(run_metric, field) or 0) + set_metric[field])
+        self.record_metric(run_metric.finish(0 if all(archive_rc == 0 for archive_rc in archive_rcs.values())
+                                             else 1))
+        return archive_rcs
+
+    def backup_jobs_getter(self, run_frequency):
+        """
+        This method walks the BackupSets and resolves the storage path, includes, excludes and recurse
+        values of each BackupSet scheduled for the run frequency
+        :param run_frequency: DAILY, WEEKLY, MONTHLY, ARCHIVE or ANY
+        :return: list of BackupSet job dictionaries
+        """
         backup_list_in = self.BackupSet_AoD
+        backup_jobs = []
 
         # loop through backup_sets
         for index in range(len(backup_list_in)):
@@ -126,6 +271,9 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
             include_files_list = []
             exclude_files_list = []
             recurse = ""
+            compress = ""
+            storage_format = cm.STORAGE_FORMAT_ARCHIVE
+            device_type = ""
             skipping = True
             for key in backup_list_in[index]:  # loop through backup set key fields
                 if key == "BackupSetName":
@@ -162,12 +310,16 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
                 include_files_list = self.fileset_includes_getter(file_set_name)
                 exclude_files_list = self.fileset_excludes_getter(file_set_name)
                 recurse = self.fileset_recurse_getter(file_set_name)
+                compress = self.fileset_compress_getter(file_set_name)
+                storage_format = self.storage_format_getter(storage_set_name)
+                device_type = self.storage_device_type_getter(storage_set_name)
 
                 os_services.info(self, f' StoragePath: {storage_path}')
                 os_services.debug(self, f' Frequency: {frequency}')
                 os_services.debug(self, f'  Includes: {include_files_list} ')
                 os_services.debug(self, f'  Excludes: {exclude_files_list}')
                 os_services.debug(self, f'  Recurse: {recurse}')
+                os_services.debug(self, f'  Compress: {compress}')
 
             except Exception as ex:
                 os_services.error(self, f"Exception with BackupSet {backup_set_name}. {ex}")
@@ -185,16 +337,201 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
                     if excl in include_files_list:
                         include_files_list.remove(excl)
 
-            # Determine the archive file name based on the current versions
-            archive_target_basefile = os.path.join(storage_path, backup_set_name, f'{backup_set_name}')
-            os_services.debug(self, f"Searching for the number of {archive_target_basefile}* files")
-            os_services.debug(self, f"  keeping only {backup_versions} versions")
-            archive_builder = tfb.Target_File_Builder(f'{archive_target_basefile}', backup_versions)
-            archive_file = archive_builder.archive_target_file
-            archive_rc = self.write_tar_file(archive_file, include_files_list, recurse)
-            os_services.info(self, f'Back up of Backup Set Name {backup_set_name} '
-                                   f'into {archive_file} '
-                                   f'returned {archive_rc}\n')
+            backup_jobs.append({"BackupSetName": backup_set_name, "FileSetName": file_set_name,
+                                "StoragePath": storage_path, "Versions": backup_versions,
+                                "Frequency": frequency, "Includes": include_files_list, "Recurse": recurse,
+                                "Compress": compress, "StorageFormat": storage_format,
+                                "StorageSetName": storage_set_name, "DeviceType": device_type})
+        return backup_jobs
+
+    def backup_set_archive(self, backup_job):
+        """
+        This method rolls the archive versions of a BackupSet and writes its new archive
+        :param backup_job: BackupSet job dictionary from backup_jobs_getter
+        :return: archive return code
+        """
+        import Retention as retention
+        import Target_File_Builder as tfb
+        backup_set_name = backup_job["BackupSetName"]
+        if backup_job.get("StorageFormat") == cm.STORAGE_FORMAT_REPOSITORY:
+            with self.profile_phase(f'snapshot {backup_set_name}'):
+                return self.backup_set_snapshot(backup_job)
+        run_metric = run_metrics.RunMetric("archive", backup_set_name)
+        archive_throttle = self.archive_throttle_getter(backup_job)
+        archive_codec = self.archive_codec_getter(backup_job.get("Compress"), archive_throttle)
+
+        # Determine the archive file name based on the current versions
+        archive_target_basefile = os.path.join(backup_job["StoragePath"], backup_set_name, f'{backup_set_name}')
+        os_services.debug(self, f"Searching for the number of {archive_target_basefile}* files")
+        os_services.debug(self, f"  keeping only {backup_job['Versions']} versions")
+        with self.profile_phase(f'retention {backup_set_name}'):
+            archive_builder = tfb.Target_File_Builder(f'{archive_target_basefile}', backup_job["Versions"],
+                                                      archive_codec.extension,
+                                                      getattr(self.args, "level", bm.LEVEL_FULL) or bm.LEVEL_FULL,
+                                                      getattr(self.args, "resume", False) and archive_codec.resumable)
+        archive_file = archive_builder.archive_target_file
+        reference_manifest = None
+        archive_summary = {}
+        if archive_builder.reference_archive is not None:
+            os_services.info(self, f' Level {archive_builder.level} backup against {archive_builder.reference_archive}')
+            reference_manifest = bm.BackupManifest.load(archive_builder.reference_archive)
+        with self.profile_phase(f'archive {backup_set_name}'):
+            archive_rc = self.write_tar_file(archive_file, backup_job["Includes"], backup_job["Recurse"],
+                                             archive_codec, archive_builder.level, reference_manifest,
+                                             archive_builder.resumed_archive is not None, archive_throttle,
+                                             run_metric, archive_summary)
+        self.record_metric(run_metric.finish(archive_rc))
+        if archive_rc == 0:
+            self.archive_register(backup_set_name, archive_file, archive_codec.name, archive_builder.level,
+                                  run_metric, archive_summary)
+        # older versions are only removed once the new archive is safely in place
+        if archive_rc == 0 and len(archive_builder.expired_archives + archive_builder.stale_archives) > 0:
+            retention.background_pruner.submit(archive_builder.expired_archives + archive_builder.stale_archives)
+        os_services.info(self, f'Back up of Backup Set Name {backup_set_name} '
+                               f'into {archive_file} '
+                               f'returned {archive_rc}\n')
+        return archive_rc
+
+    def archive_register(self, backup_set_name, archive_file, codec_name, level, run_metric, archive_summary):
+        """
+        This method records a complete archive in the archive catalog read by -report. The archive is in
+        place whether or not the catalog can be written, a catalog error is only logged.
+        :return: True when the archive was registered
+        """
+        archive_catalog = self.archive_catalog_getter()
+        if archive_catalog is None:
+            return False
+        import sqlite3
+        try:
+            with archive_catalog:
+                archive_catalog.register(backup_set_name, archive_file, os.path.getsize(archive_file),
+                                         archive_summary.get("members"), codec_name, level, run_metric.wall_seconds,
+                                         archive_summary.get("checksum"), self.metrics_run_id)
+        except (sqlite3.Error, OSError) as ex:
+            os_services.warn(self, f'{archive_file} was not registered in the archive catalog. {ex}')
+            return False
+        return True
+
+    def profile_phase(self, phase_name):
+        """
+        This method returns the context a phase of the run is profiled in, its cProfile stats and memory
+        summary are written into the profile directory of the run under the reports directory.
+        Without -profile the context does nothing.
+        """
+        if not getattr(getattr(self, "args", None), "profile", False):
+            return contextlib.nullcontext()
+        import Run_Profiler as run_profiler
+        return self.logged_phase(run_profiler.profiler_for(self.getReportDir(), self.metrics_run_id), phase_name)
+
+    @contextlib.contextmanager
+    def logged_phase(self, phase_profiler, phase_name):
+        """ Profile a phase and log its summary once it is written """
+        with phase_profiler.phase(phase_name) as phase_record:
+            yield phase_record
+        os_services.info(self, f'Profiled {phase_record["summary"]} into {phase_profiler.profile_dir}')
+
+    def pruning_wait(self):
+        """
+        This method waits for the expired archives queued by backup_set_archive to be deleted
+        :return: number of archives deleted
+        """
+        import Retention as retention
+        deleted_archives, prune_errors = retention.background_pruner.wait()
+        for archive_path, ose in prune_errors:
+            os_services.error(self, f'Expired archive {archive_path} could not be deleted. {ose}')
+        if len(deleted_archives) > 0:
+            os_services.info(self, f'Deleted {len(deleted_archives)} expired archives')
+            archive_catalog = self.archive_catalog_getter()
+            if archive_catalog is not None:
+                import sqlite3
+                try:
+                    with archive_catalog:
+                        archive_catalog.forget(deleted_archives)
+                except sqlite3.Error as sqlerr:
+                    os_services.warn(self, f'Expired archives are still in the archive catalog. {sqlerr}')
+        return len(deleted_archives)
+
+    def backup_set_snapshot(self, backup_job):
+        """
+        This method stores a BackupSet in the deduplicating repository of its StoragePath
+        :param backup_job: BackupSet job dictionary from backup_jobs_getter
+        :return: snapshot return code
+        """
+        import Chunk_Repository as chunk_repo
+        backup_set_name = backup_job["BackupSetName"]
+        repository_path = os.path.join(backup_job["StoragePath"], "repository")
+        recurse = backup_job["Recurse"] if backup_job["Recurse"] is not None else False
+        run_metric = run_metrics.RunMetric("snapshot", backup_set_name)
+        metadata_catalog = self.metadata_catalog_getter()
+        repository = None
+        try:
+            repository = chunk_repo.ChunkRepository(repository_path, str(backup_job.get("Compress")).upper() != "NONE")
+            snapshot_file = repository.write_snapshot(backup_set_name,
+                                                      self.archive_members(backup_job["Includes"], recurse,
+                                                                           metadata_catalog),
+                                                      backup_job["Versions"])
+            snapshot_rc = 0
+        except OSError as oserr:
+            snapshot_file = repository_path
+            snapshot_rc = oserr
+        finally:
+            if metadata_catalog is not None:
+                metadata_catalog.close()
+        if repository is not None:
+            run_metric.files = repository.chunk_stats["files"] + repository.chunk_stats["reused_files"]
+            run_metric.bytes_read = repository.chunk_stats["bytes"]
+            run_metric.bytes_written = repository.chunk_stats["new_bytes"]
+        self.record_metric(run_metric.finish(snapshot_rc))
+        os_services.info(self, f'Back up of Backup Set Name {backup_set_name} '
+                               f'into {snapshot_file} '
+                               f'returned {snapshot_rc}\n')
+        return snapshot_rc
+
+    def archive_throttle_getter(self, backup_job):
+        """
+        This method returns the throttle of a BackupSet archive, with the caps of the AppConfig Throttle_ row
+        of its StorageSetName or DeviceType, changed while it runs by the control file of the resource directory
+        :param backup_job: BackupSet job dictionary from backup_jobs_getter
+        :return: ArchiveThrottle object
+        """
+        import Throttle as throttle
+        try:
+            workbook_limits = throttle.limits_for(self.config_sheet_rows('AppConfig', 6),
+                                                  backup_job.get("StorageSetName"), backup_job.get("DeviceType"))
+        except ValueError as ve:
+            os_services.warn(self, f'Throttle caps of BackupSet {backup_job["BackupSetName"]} are not usable, '
+                                   f'archiving uncapped. {ve}')
+            workbook_limits = throttle.ThrottleLimits()
+        archive_throttle = throttle.ArchiveThrottle(workbook_limits,
+                                                    os.path.join(self.resource_path, throttle.CONTROL_FILE))
+        if archive_throttle.control_error is not None:
+            os_services.warn(self, f'{throttle.CONTROL_FILE} is not usable. {archive_throttle.control_error}')
+        os_services.debug(self, f'  Throttle: {archive_throttle.limits}')
+        return archive_throttle
+
+    def archive_codec_getter(self, compress, archive_throttle=None):
+        """
+        This method returns the compression codec for a FileSets Compress value. Unknown codecs, or codecs
+        whose optional package is not installed, fall back to GZIP so the BackupSet is still archived.
+        :param compress: value of the Compress column, e.g. NONE, GZIP, GZIP_STREAM, ZSTD:19, LZ4 or XZ
+        :param archive_throttle: ArchiveThrottle capping the compression threads
+        :return: ArchiveCodec object
+        """
+        import Compression_Codecs as codecs
+        compress_threads = getattr(self.args, "compress_threads", None)
+        if archive_throttle is not None:
+            compress_threads = archive_throttle.compress_threads(compress_threads)
+        block_size = (getattr(self.args, "compress_block_size", None) or 1) * 1024 * 1024
+        try:
+            archive_codec = codecs.get_codec(compress, compress_threads, block_size)
+            if archive_codec.name == "ZSTD":
+                import zstandard  # noqa: F401
+            elif archive_codec.name == "LZ4":
+                import lz4.frame  # noqa: F401
+        except (ValueError, ImportError) as ex:
+            os_services.warn(self, f'Compress {compress} is not usable, falling back to {codecs.DEFAULT_CODEC}. {ex}')
+            archive_codec = codecs.get_codec(codecs.DEFAULT_CODEC, compress_threads, block_size)
+        return archive_codec
 
     def backupSetGetter(self):
         """
@@ -202,91 +539,137 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
         :return: Nothing
         """
         self.BackupSet_AoD, self.StorageSet_AoD, self.FileSet_AoD = excel_conv.excelSetsConvert(self)
+        self.config_model = cm.ConfigModel(self.BackupSet_AoD, self.StorageSet_AoD, self.FileSet_AoD)
+
+    def config_model_getter(self):
+        """
+        This method returns the indexed configuration model, building it from the dictionaries
+        when they were loaded without backupSetGetter
+        :return: ConfigModel object
+        """
+        if self.config_model is None:
+            self.config_model = cm.ConfigModel(self.BackupSet_AoD, self.StorageSet_AoD, self.FileSet_AoD)
+        return self.config_model
 
     def storage_path_getter(self, storageSet_needle):
-        storagesets_in = self.StorageSet_AoD
+        storage_set = self.config_model_getter().storage_set(storageSet_needle)
+        if storage_set is not None:
+            return storage_set.StoragePath
+
+    def storage_format_getter(self, storageSet_needle):
+        storage_set = self.config_model_getter().storage_set(storageSet_needle)
+        if storage_set is None:
+            return cm.STORAGE_FORMAT_ARCHIVE
+        return str(storage_set.StorageFormat or cm.STORAGE_FORMAT_ARCHIVE).upper()
 
-        for index in range(len(storagesets_in)):
-            for key in storagesets_in[index]:
-                if key == "StorageSetName" and storagesets_in[index]['StorageSetName'] == storageSet_needle:
-                    return storagesets_in[index]["StoragePath"]
+    def storage_device_type_getter(self, storageSet_needle):
+        storage_set = self.config_model_getter().storage_set(storageSet_needle)
+        if storage_set is not None:
+            return storage_set.DeviceType
 
     def fileset_includes_getter(self, filesetname_needle):
-        filesets_in = self.FileSet_AoD
         fs_includes = []
 
-        for index in range(len(filesets_in)):
-            for key in filesets_in[index]:
-                if key == "FileSetName" and filesets_in[index]["FileSetName"] == filesetname_needle:
-                    fd_obj = filesets_in[index]["Includes"]
-                    if os.path.exists(fd_obj) and os.path.isdir(fd_obj):
-                        fs_listdir = os.listdir(fd_obj)
-                        for fs_file in fs_listdir:
-                            fs_includes.append(os.path.join(fd_obj, fs_file))
-                    elif os.path.exists(fd_obj) and os.path.isfile(fd_obj):
-                        fs_includes.append(fd_obj)
-                    else:
-                        msg = f'  File Set {fd_obj} does not exist. Remove it from' \
-                              f' FileSets sheet in BackupList.xlsx '
-                        os_services.warn(self, msg)
+        for file_set in self.config_model_getter().file_set_rows(filesetname_needle):
+            fd_obj = file_set.Includes
+            if os.path.exists(fd_obj) and os.path.isdir(fd_obj):
+                fs_listdir = os.listdir(fd_obj)
+                for fs_file in fs_listdir:
+                    fs_includes.append(os.path.join(fd_obj, fs_file))
+            elif os.path.exists(fd_obj) and os.path.isfile(fd_obj):
+                fs_includes.append(fd_obj)
+            else:
+                msg = f'  File Set {fd_obj} does not exist. Remove it from' \
+                      f' FileSets sheet in BackupList.xlsx '
+                os_services.warn(self, msg)
         return fs_includes
 
     def fileset_excludes_getter(self, filesetname_needle):
-        filesets_in = self.FileSet_AoD
         fs_excludes = []
 
-        for index in range(len(filesets_in)):
-            for key in filesets_in[index]:
-                if "FileSetName" in key and filesetname_needle in filesets_in[index][key]:
-                    expaths = None
-                    for expath in str(filesets_in[index]["Excludes"]).split(","):
-                        if os.path.exists(expath):
-                            if expaths is None:
-                                expaths = f'{expath}'
-                            else:
-                                expaths = f'{expaths}, {expath}'
-                    fs_excludes.append(expaths)
+        for file_set in self.config_model_getter().file_set_rows(filesetname_needle):
+            expaths = None
+            for expath in str(file_set.Excludes).split(","):
+                if os.path.exists(expath):
+                    if expaths is None:
+                        expaths = f'{expath}'
+                    else:
+                        expaths = f'{expaths}, {expath}'
+            fs_excludes.append(expaths)
 
         return fs_excludes
 
     def fileset_recurse_getter(self, filesetname_needle):
-        filesets_in = self.FileSet_AoD
         fs_recurse = False
 
-        for index in range(len(filesets_in)):
-            for key in filesets_in[index]:
-                if key == "FileSetName" and filesets_in[index]["FileSetName"] == filesetname_needle:
-                    if str(filesets_in[index]["Recurse"]).upper() == "YES":
-                        fs_recurse = True
+        for file_set in self.config_model_getter().file_set_rows(filesetname_needle):
+            if str(file_set.Recurse).upper() == "YES":
+                fs_recurse = True
         return fs_recurse
 
+    def fileset_compress_getter(self, filesetname_needle):
+        import Compression_Codecs as codecs
+        for file_set in self.config_model_getter().file_set_rows(filesetname_needle):
+            return str(file_set.Compress or codecs.DEFAULT_CODEC).upper()
+        return codecs.DEFAULT_CODEC
+
     def backup_reporter(self):
         """
-            Method to create a report of current backup files and
-            their storage locations
+            Method to create a report of the archives of every BackupSet, their version history,
+            the storage they use and the age of their last success. It is answered from the archive
+            catalog filled by the successful backups, neither the sources nor the storage are read.
         """
         self.backupSetGetter()
-        backupSetsIn = self.BackupSet_AoD
+        archive_catalog = self.archive_catalog_getter()
+        if archive_catalog is None:
+            return 1
+        with archive_catalog:
+            set_versions = archive_catalog.versions()
+        metadata_catalog = self.metadata_catalog_getter()
+        report_time = time.time()
+        configured_sets = list(dict.fromkeys(backup_set["BackupSetName"] for backup_set in self.BackupSet_AoD))
         print("Backup set report")
-        backup_set_name = ""
-        storage_path = ""
+        total_bytes = 0
+        total_archives = 0
+
+        for backup_set_name in configured_sets + sorted(set(set_versions) - set(configured_sets)):
+            archives = set_versions.get(backup_set_name, [])
+            set_note = "" if backup_set_name in configured_sets else " (not in BackupSets)"
+            if len(archives) == 0:
+                print(f"Backup Set {backup_set_name}{set_note}: no successful backup cataloged")
+            else:
+                set_bytes = sum(archive["size"] or 0 for archive in archives)
+                total_bytes += set_bytes
+                total_archives += len(archives)
+                print(f"Backup Set {backup_set_name}{set_note}: {len(archives)} versions, "
+                      f"{set_bytes / 1048576:.1f} MB stored, last success "
+                      f"{self.age_text(report_time - archives[-1]['created'])} ago")
+                for archive in reversed(archives):
+                    print(f"  {time.strftime('%Y/%m/%d %H:%M', time.localtime(archive['created']))} "
+                          f"{os.path.basename(archive['archive_path'])} level {archive['level']} {archive['codec']} "
+                          f"{(archive['size'] or 0) / 1048576:.1f} MB {archive['members']} files "
+                          f"in {archive['duration_seconds'] or 0:.1f}s {archive['checksum']}")
+            if metadata_catalog is not None and backup_set_name in configured_sets:
+                # sizes as last cataloged by -reload, -refresh_sizes or a backup, without touching the disk
+                backup_set = self.config_model_getter().backup_set(backup_set_name)
+                fileset_bytes = metadata_catalog.fileset_size(
+                    [file_set.Includes for file_set in
+                     self.config_model_getter().file_set_rows(getattr(backup_set, "FileSetName", None))])
+                print(f"  Sources cataloged size {fileset_bytes / 1048576:.1f} MB")
+        if metadata_catalog is not None:
+            metadata_catalog.close()
+        print(f"Total storage used {total_bytes / 1048576:.1f} MB in {total_archives} archives")
+        return 0
 
-        for index in range(len(backupSetsIn)):
-            fileSetName = ""
-            for key in backupSetsIn[index]:  # loop through backup set key fields
-                if key == "BackupSetName":
-                    backup_set_name = backupSetsIn[index][key]
-                elif key == "FileSetName":
-                    include_files_list = self.fileset_includes_getter(backupSetsIn[index][key])
-                    for fileSetName in include_files_list:
-                        pass
-                elif key == "StorageSetName":
-                    storage_path = self.storage_path_getter(backupSetsIn[index][key])
-                    if storage_path is None:
-                        break
-                else:
-                    pass
-                print(f"Backup Set {backup_set_name} is FileSetName {fileSetName} using Storage Path {storage_path}")
+    @staticmethod
+    def age_text(age_seconds):
+        """ Return an age in seconds as days and hours, hours and minutes, or minutes """
+        age_minutes = int(max(age_seconds, 0) // 60)
+        if age_minutes >= 1440:
+            return f'{age_minutes // 1440}d {age_minutes % 1440 // 60}h'
+        if age_minutes >= 60:
+            return f'{age_minutes // 60}h {age_minutes % 60}m'
+        return f'{age_minutes}m'
 
     @staticmethod
     def is_file_older_than_x_days(file, days=1):
@@ -294,21 +677,171 @@ class PythonBackup(updg, reload_filesets, file_sizes, excel_conv, os_services):
         # Check against 24 hours
         return (time.time() - file_time) / 3600 > 24 * days
 
-    def write_tar_file(self, target, sources, recursive):
-        """ Tar and compress the sources into the target """
+    @staticmethod
+    def archive_members(sources, recursive, metadata_catalog=None):
+        """
+        This method yields every path to be archived with its lstat result. Each source is yielded
+        first, then the entries of every directory below it sorted by name, one directory at a time
+        in the top-down order of os.walk over the sorted subdirectories. Unlike tarfile.add, a
+        directory's entries are all yielded before the contents of its first subdirectory. Without
+        recursion only the sources themselves are yielded. The listing of every directory walked is
+        recorded in the metadata catalog when one is given.
+        """
+        for src in sources:
+            try:
+                src_stat = os.lstat(src)
+            except OSError:
+                continue
+            yield src, src_stat
+            if recursive and os.path.isdir(src) and not os.path.islink(src):
+                dir_stats = {src: src_stat}
+                for dirpath, dirnames, filenames in os.walk(src, followlinks=False):
+                    member_stats = []
+                    for name in sorted(dirnames + filenames):
+                        member_path = os.path.join(dirpath, name)
+                        try:
+                            member_stat = os.lstat(member_path)
+                        except OSError:
+                            continue
+                        member_stats.append((name, member_stat))
+                        if stat.S_ISDIR(member_stat.st_mode):
+                            dir_stats[member_path] = member_stat
+                        yield member_path, member_stat
+                    dirnames.sort()
+                    dir_stat = dir_stats.pop(dirpath, None)
+                    if metadata_catalog is not None and dir_stat is not None:
+                        metadata_catalog.record_listing(dirpath, dir_stat, member_stats)
+
+    @staticmethod
+    def add_tar_member(tar_out, member_path, archive_index, archive_throttle, read_mode=page_cache.READ_MODE_CACHE):
+        """
+        This method adds one path to the tar as tarfile.add would, reading regular files in the read mode
+        and through the throttle, and indexes it
+        :return: True when the path was added, False for the sockets and other types tar cannot hold
+        """
+        tar_info = tar_out.gettarinfo(member_path)
+        if tar_info is None:
+            return False
+        member_offset = tar_out.offset
+        if tar_info.isreg():
+            with page_cache.open_member(member_path, read_mode) as fi:
+                tar_out.addfile(tar_info, archive_throttle.reader(fi))
+        else:
+            tar_out.addfile(tar_info)
+        archive_index.add_member(tar_out.members[-1], member_offset)
+        return True
+
+    def write_tar_file(self, target, sources, recursive, archive_codec=None, level=bm.LEVEL_FULL,
+                       reference_manifest=None, resume=False, archive_throttle=None, run_metric=None,
+                       archive_summary=None):
+        """
+        Tar and compress the sources into the target with the codec of the FileSet, and write the manifest
+        of every file seen next to it. With a reference manifest only new or changed files are archived.
+        Seekable codecs also get a member index for single file restores.
+        The archive is written to a partial file, flushed to the device and renamed to the target once
+        complete. Resumable codecs checkpoint the partial file while it is written, and with resume a run
+        continues the partial file from its last checkpoint instead of starting over.
+        The files read and the bytes written are throttled to the caps of the archive throttle, and the
+        files are read in the -read_mode, which can keep them out of the page cache. The files seen and
+        the bytes read and written are counted into run_metric when one is given. The archive is hashed as
+        it is written, and its checksum and member count are put into archive_summary when one is given.
+        """
+        import tarfile
+
+        import Archive_Catalog as arc_catalog
+        import Archive_Checkpoint as ckpt
+        import Compression_Codecs as codecs
+        import Seekable_Archive as sa
+        import Throttle as throttle
         if recursive is None:
             recursive = False
             os_services.warn(self, f'Recursive autoset to FALSE')
+        if archive_codec is None:
+            archive_codec = self.archive_codec_getter(codecs.DEFAULT_CODEC)
+        if archive_throttle is None:
+            archive_throttle = throttle.ArchiveThrottle(throttle.ThrottleLimits())
+        read_mode = getattr(self.args, "read_mode", None) or page_cache.READ_MODE_CACHE
+        backup_manifest = bm.BackupManifest(level, os.path.basename(reference_manifest.archive_file)
+                                            if reference_manifest is not None else None)
+        archive_index = sa.ArchiveIndex()
+        archive_part = ckpt.part_file(target)
+        if resume and not archive_codec.resumable:
+            os_services.info(self, f'  {archive_codec.name} archives are not resumable, starting {target} over')
+        archive_journal = ckpt.ArchiveJournal.load(target) if resume and archive_codec.resumable else None
+        if archive_journal is not None and archive_journal.journal_header.get("codec") != archive_codec.name:
+            os_services.warn(self, f'  {archive_part} was written with another codec, starting over')
+            archive_journal = None
+        metadata_catalog = self.metadata_catalog_getter()
         try:
-            with tarfile.open(target, 'w:gz') as tar_out:
-                for src in sources:
-                    os_services.debug(self, f'  Processing {src} into backup')
-                    tar_out.add(src, recursive=recursive)
-
-            tar_out.close()
+            if archive_journal is not None:
+                part_out = open(archive_part, "r+b")
+                part_out.truncate(archive_journal.last_checkpoint["file_offset"])
+                part_out.seek(archive_journal.last_checkpoint["file_offset"])
+            else:
+                part_out = open(archive_part, "wb")
+            with part_out:
+                archive_checksum = arc_catalog.ChecksumWriter(part_out, part_out.tell())
+                if archive_journal is not None:
+                    archive_out = archive_codec.open_resumed_writer(archive_throttle.writer(archive_checksum),
+                                                                    archive_journal.last_checkpoint["tar_offset"],
+                                                                    archive_journal.last_checkpoint["blocks"])
+                    backup_manifest.entries = archive_journal.manifest_entries
+                    archive_index.members = archive_journal.index_members
+                    archive_journal.start(resumed=True)
+                    os_services.info(self, f'  Resuming {target} after {len(backup_manifest.entries)} files')
+                else:
+                    archive_out = archive_codec.open_writer(archive_throttle.writer(archive_checksum))
+                    if archive_codec.resumable:
+                        archive_journal = ckpt.ArchiveJournal(target, {"codec": archive_codec.name,
+                                                                       "level": level}).start()
+                archive_throttle.set_compressor(archive_out)
+                resumed_paths = set(backup_manifest.entries)
+                with archive_out:
+                    with tarfile.open(fileobj=archive_out, mode='w') as tar_out:
+                        for src in sources:
+                            os_services.debug(self, '  Processing %s into backup', src)
+                            for member_path, member_stat in self.archive_members([src], recursive,
+                                                                                 metadata_catalog):
+                                if member_path in resumed_paths:
+                                    continue
+                                archived = reference_manifest is None or \
+                                    reference_manifest.is_changed(member_path, member_stat)
+                                if archived:
+                                    archived = self.add_tar_member(tar_out, member_path, archive_index,
+                                                                   archive_throttle, read_mode)
+                                backup_manifest.add_entry(member_path, member_stat, archived)
+                                os_services.file_debug(self, '  %s %s', "Archived" if archived else "Unchanged",
+                                                       member_path)
+                                if archive_journal is not None and archive_journal.checkpoint_due():
+                                    archive_journal.checkpoint(archive_out, backup_manifest, archive_index)
+            if archive_codec.seekable:
+                archive_index.save(archive_part, archive_codec.name,
+                                   getattr(archive_out, "block_offsets", None) or [(0, 0)])
+            backup_manifest.record_deletions(reference_manifest)
+            backup_manifest.save(archive_part)
+            if archive_summary is not None:
+                archive_summary.update(members=backup_manifest.archived_count(), checksum=archive_checksum.checksum())
+            if archive_journal is not None:
+                archive_journal.close()
+            ckpt.commit_archive(target)
+            os_services.debug(self, f'  Archived {backup_manifest.archived_count()} of {len(backup_manifest.entries)}'
+                                    f' files, {len(backup_manifest.deleted)} deleted')
+            os_services.info(self, f'  Throughput: {archive_throttle.report()}')
             return 0
         except OSError as oserr:
+            if archive_journal is None:
+                ckpt.discard_archive(target)
             return oserr
+        finally:
+            if archive_journal is not None:
+                archive_journal.close()
+            if metadata_catalog is not None:
+                metadata_catalog.close()
+            if run_metric is not None:
+                # every byte read and written goes through the throttle, so its buckets hold the counts
+                run_metric.files = len(backup_manifest.entries)
+                run_metric.bytes_read = archive_throttle.read_bucket.consumed_bytes
+                run_metric.bytes_written = archive_throttle.write_bucket.consumed_bytes
 
 
 # =================================
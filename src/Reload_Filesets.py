@@ -1,7 +1,6 @@
 import os
 
-import pandas as pd
-from openpyxl import *
+import Run_Metrics as run_metrics
 from CommonOs import OsServices as os_services
 
 
@@ -32,78 +31,11 @@ class ReloadFileSets(os_services):
         then writing these files and folders into the FileSets sheet of the BackupList.xlsx workbook.
         :return:
         """
+        run_metric = run_metrics.RunMetric("reload", "FileSets")
         FileSetRows = []
         FileSystemsIn = self.read_rootpaths_in()
-        if len(FileSystemsIn) > 0:
-            for fsi in FileSystemsIn:
-                for dirpath, subdirList, filesList in self.walklevel(fsi["RootPath"], fsi["MaxDepth"]):
-                    if fsi["MaxDepth"] == 0:
-                        ''' empty scan '''
-                        pass
-                    elif fsi["MaxDepth"] == -1:
-                        ''' collect the files in the RootFileSystem directory and all subdirectories'''
-                        if fsi["FilesFolders"] in ("Folders", "Both"):
-                            for subdir in subdirList:
-                                if os.path.join(dirpath, subdir).find("Trash") == -1 and \
-                                        os.path.join(dirpath, subdir).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, subdir)):
-                                    FileSetRows.append(
-                                        {"FileSetName": "ToBeUpdated",
-                                         "Includes": os.path.join(dirpath, subdir),
-                                         "Excludes": "NA", "Compress": "YES", "Recurse": "Yes"})
-                        if fsi["FilesFolders"] in ("Files", "Both"):
-                            for file in filesList:
-                                if os.path.join(dirpath, file).find("Trash") == -1 and \
-                                        os.path.join(dirpath, file).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, file)):
-                                    FileSetRows.append(
-                                        {"FileSetName": "ToBeUpdated",
-                                         "Includes": os.path.join(dirpath, file),
-                                         "Excludes": "NA", "Compress": "YES", "Recurse": "No"})
-                    elif fsi["MaxDepth"] == os.path.abspath(fsi["RootPath"]).count(os.path.sep):
-                        ''' collect the files and directories ONLY in the RootFileSystem - no recursive scan'''
-                        if fsi["FilesFolders"] in ("Folders", "Both"):
-                            for subdir in subdirList:
-                                if os.path.join(dirpath, subdir).find("Trash") == -1 and \
-                                        os.path.join(dirpath, subdir).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, subdir)):
-                                    if os.path.join(dirpath, subdir).count(os.path.sep) <= fsi["MaxDepth"]:
-                                        FileSetRows.append(
-                                            {"FileSetName": "ToBeUpdated",
-                                             "Includes": os.path.join(dirpath, subdir),
-                                             "Excludes": "NA", "Compress": "YES", "Recurse": "No"})
-                        if fsi["FilesFolders"] in ("Files", "Both"):
-                            for file in filesList:
-                                if os.path.join(dirpath, file).find("Trash") == -1 and \
-                                        os.path.join(dirpath, file).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, file)):
-                                    if os.path.join(dirpath, file).count(os.path.sep) == fsi["MaxDepth"] + 1:
-                                        FileSetRows.append(
-                                            {"FileSetName": "ToBeUpdated",
-                                             "Includes": os.path.join(dirpath, file),
-                                             "Excludes": "NA", "Compress": "YES", "Recurse": "No"})
-                    elif fsi["MaxDepth"] >= os.path.abspath(fsi["RootPath"]).count(os.path.sep):
-                        ''' collect the files and directories in the RootFileSystem - with recursive scan'''
-                        if fsi["FilesFolders"] in ("Folders", "Both"):
-                            for subdir in subdirList:
-                                if os.path.join(dirpath, subdir).find("Trash") == -1 and \
-                                        os.path.join(dirpath, subdir).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, subdir)):
-                                    if os.path.join(dirpath, subdir).count(os.path.sep) <= fsi["MaxDepth"]:
-                                        FileSetRows.append(
-                                            {"FileSetName": "ToBeUpdated",
-                                             "Includes": os.path.join(dirpath, subdir),
-                                             "Excludes": "NA", "Compress": "YES", "Recurse": "YES"})
-                        if fsi["FilesFolders"] in ("Files", "Both"):
-                            for file in filesList:
-                                if os.path.join(dirpath, file).find("Trash") == -1 and \
-                                        os.path.join(dirpath, file).find("lost+found") == -1 and \
-                                        not os.path.islink(os.path.join(dirpath, file)):
-                                    if os.path.join(dirpath, file).count(os.path.sep) == fsi["MaxDepth"] + 1:
-                                        FileSetRows.append(
-                                            {"FileSetName": "ToBeUpdated",
-                                             "Includes": os.path.join(dirpath, file),
-                                             "Excludes": "NA", "Compress": "YES", "Recurse": "No"})
+        for fsi in FileSystemsIn:
+            FileSetRows.extend(self.fileset_rows(fsi))
 
         if len(FileSetRows) == 0:
             print(f' Empty RootPath Scan Returned. Verify MaxDepth values in RootPath Sheet of workbook.'
@@ -112,6 +44,8 @@ class ReloadFileSets(os_services):
         sorted_FileSetRows = sorted(FileSetRows, key=lambda I: I["Includes"])
         write_filesets_rc = self.write_filesets(sorted_FileSetRows)
         os_services.info(self, f' \nCaptured {write_filesets_rc} file sets')
+        run_metric.files = write_filesets_rc
+        self.record_metric(run_metric.finish(0 if write_filesets_rc > 0 else 1))
         return FileSetRows
 
     def read_rootpaths_in(self):
@@ -122,22 +56,20 @@ class ReloadFileSets(os_services):
         :return: Count of rows read in and written to  FileSystemsIn{}
         """
         resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
-        wb = load_workbook(os.path.join(resource_path, "BackupList.xlsx"))
         sheetset = {'RootPaths': 4}
         row_set_count = 0
         FileSystemsIn = []
 
-        for ws in wb:
-            if ws.title in sheetset.keys():
-                worksheet = wb[ws.title]
+        for sheet_title in sheetset.keys():
+            if sheet_title in self.config_sheet_titles():
 
-                row_sets = [worksheetsets for worksheetsets in worksheet.iter_rows(
-                    min_row=2, max_col=sheetset[ws.title], min_col=1, values_only=True)
+                row_sets = [worksheetsets for worksheetsets in self.config_sheet_rows(
+                    sheet_title, sheetset[sheet_title])
                             if None not in worksheetsets]
                 row_set_count = 0
                 for row_set in row_sets:
                     row_set_dict = {}
-                    if worksheet.title == "RootPaths":
+                    if sheet_title == "RootPaths":
                         for index in range(len(row_set)):
                             if index == 0:
                                 row_set_dict["Index"] = row_set_count
@@ -156,27 +88,62 @@ class ReloadFileSets(os_services):
 
     def write_filesets(self, fs_dict):
         """
-        This method writes a supplied dictionary to the FileSets sheet  of the BackupList.xlsx workbook using pandas.
-        :param fs_dict:
-        :return:
+        This method writes a supplied list of dictionaries to the FileSets sheet of the configuration backend
+        in one streamed write. Rows left over from a longer previous list are cleared, the other columns and
+        sheets are kept as they are.
+        :param fs_dict: list of FileSets row dictionaries
+        :return: number of rows written
+        """
+        fileset_columns = ['FileSetName', 'Includes', 'Excludes', 'Compress', 'Recurse']
+        return self.config_backend().replace_sheet_columns(
+            "FileSets", 2, fileset_columns, (tuple(row[column] for column in fileset_columns) for row in fs_dict))
+
+    def fileset_rows(self, fsi):
         """
-        wb = load_workbook(os.path.join(self.resource_path, "BackupList.xlsx"))
-        writer = pd.ExcelWriter(os.path.join(self.resource_path, "BackupList.xlsx"), engine='openpyxl')
-        writer.book = wb
-        writer.sheets = dict((ws.title, ws) for ws in wb.worksheets)
-
-        ws = wb["FileSets"]
-        for row in ws["C2:F10000"]:
-            for cell in row:
-                cell.value = None
-        writer.save()
-
-        df = pd.DataFrame(data=fs_dict)
-        df.to_excel(writer, sheet_name="FileSets", startcol=1, startrow=0,
-                    columns=['FileSetName', 'Includes', 'Excludes', 'Compress', 'Recurse'],
-                    index=False)
-        writer.save()
-        return df.size
+        This method scans one RootPath and streams out its FileSets rows. MaxDepth is the path depth,
+        counted in path separators, of the deepest folders to list; files are listed one level below them.
+        -1 lists every folder and file under the RootPath and 0 lists nothing.
+        :param fsi: RootPaths row dictionary
+        :return: yield FileSets row dictionaries
+        """
+        max_depth = fsi["MaxDepth"]
+        root_path = os.path.abspath(fsi["RootPath"])
+        root_depth = root_path.count(os.path.sep)
+        if max_depth == -1:
+            scan_depth = -1
+            folder_recurse = "Yes"
+        elif max_depth > 0 and max_depth >= root_depth:
+            scan_depth = max_depth - root_depth
+            # a RootPath whose MaxDepth is its own depth lists its files and folders without recursion
+            folder_recurse = "No" if max_depth == root_depth else "YES"
+        else:
+            return
+
+        import Tree_Scanner as tree_scan
+        metadata_catalog = self.metadata_catalog_getter()
+        tree_scanner = tree_scan.TreeScanner(metadata_catalog=metadata_catalog)
+        try:
+            yield from self.scanned_rows(fsi, tree_scanner.scan(root_path, scan_depth), folder_recurse,
+                                         tree_scanner.skipped)
+        finally:
+            if metadata_catalog is not None:
+                metadata_catalog.close()
+
+    @staticmethod
+    def scanned_rows(fsi, tree_scan_results, folder_recurse, skipped):
+        """ Turn the directories listed by the scanner into FileSets rows """
+        max_depth = fsi["MaxDepth"]
+        for dirpath, subdirList, filesList in tree_scan_results:
+            dirpath_depth = dirpath.count(os.path.sep)
+            if fsi["FilesFolders"] in ("Folders", "Both") and (max_depth == -1 or dirpath_depth < max_depth):
+                for subdir in subdirList:
+                    yield {"FileSetName": "ToBeUpdated", "Includes": os.path.join(dirpath, subdir),
+                           "Excludes": "NA", "Compress": "YES", "Recurse": folder_recurse}
+            if fsi["FilesFolders"] in ("Files", "Both") and (max_depth == -1 or dirpath_depth == max_depth):
+                for file in filesList:
+                    if not skipped(file):
+                        yield {"FileSetName": "ToBeUpdated", "Includes": os.path.join(dirpath, file),
+                               "Excludes": "NA", "Compress": "YES", "Recurse": "No"}
 
     def walklevel(self, rfspath, max_depth):
         """
@@ -185,25 +152,15 @@ class ReloadFileSets(os_services):
             yielding directories and files
             :param rfspath: Root File system to be scanned
             :param max_depth: Maximum directory depth to scan the path
-            :return: yield tuples of max_depth, root, dirs[:], files
+            :return: yield tuples of root, dirs, files, without symlinks, Trash and lost+found
         """
         if max_depth == 0:  # return nothing
             return
-        elif max_depth < 0:  # return everything
-            for dirpath, dirnames, filenames in os.walk(rfspath, followlinks=False):
-                yield dirpath, dirnames[:], filenames
+        if max_depth > 0 and not os.path.isdir(rfspath):
+            print(f'A valid directory was not provided')
             return
-        else:  # return only up to the max depth
-            rfspath = str(rfspath).rstrip(os.path.sep)  # strip of any ending pathsep
-            if os.path.isdir(rfspath):
-                rfspath_depth = rfspath.count(os.path.sep)
-                for dirpath, dirnames, filenames in os.walk(rfspath, followlinks=False):
-                    dirpath_depth = dirpath.count(os.path.sep)
-                    yield dirpath, dirnames, filenames
-                    if rfspath_depth + max_depth <= dirpath_depth:
-                        del dirnames[:]
-            else:
-                print(f'A valid directory was not provided')
+        import Tree_Scanner as tree_scan
+        yield from tree_scan.TreeScanner().scan(str(rfspath).rstrip(os.path.sep) or os.path.sep, max_depth)
 
     def build_file_sizes(self, file_path_dict):
         """
@@ -0,0 +1,219 @@
+import datetime
+import os
+import re
+
+import Archive_Checkpoint as ckpt
+import Backup_Manifest as bm
+import Seekable_Archive as sa
+
+""" This package contains the retention policies of the archive versions and their background pruning"""
+
+# a Versions value is a number of versions to keep, or rules such as "7d 4w 12m" keeping the newest version
+# of the last 7 days, 4 weeks and 12 months that have one; l keeps the last versions and y one per year
+RULE_PATTERN = re.compile(r'(\d+)\s*([ldwmy])', re.IGNORECASE)
+RULE_UNITS = {"l": "last", "d": "daily", "w": "weekly", "m": "monthly", "y": "yearly"}
+LEVEL_TAGS = {"L1": bm.LEVEL_INCREMENTAL, "D": bm.LEVEL_DIFFERENTIAL}
+
+
+class ArchiveFile:
+    """
+    An archive of a BackupSet found in its storage folder, with the date and level read from its name
+    and the time it was last written
+    """
+
+    __slots__ = ("name", "date", "level", "mtime")
+
+    def __init__(self, name, date, level, mtime=0):
+        self.name = name
+        self.date = date
+        self.level = level
+        self.mtime = mtime
+
+    def __repr__(self):
+        return f'ArchiveFile({self.name!r})'
+
+
+def archive_name_pattern(archive_basename, archive_extensions):
+    """ Return the regex matching exactly the archive names of one BackupSet: basename_YYYYMMDD[_L1|_D].ext """
+    extensions = "|".join(re.escape(extension) for extension in archive_extensions)
+    return re.compile(rf'^{re.escape(archive_basename)}_(\d{{8}})(?:_(L1|D))?({extensions})$')
+
+
+def scan_archives(archive_dir, archive_basename, archive_extensions):
+    """
+    This function lists the archives of one BackupSet with a single scan of its storage folder
+    :return: list of ArchiveFile, oldest first. A full backup comes before the other levels of the same day,
+        which follow in the order they were written, their order in the chain.
+    """
+    name_pattern = archive_name_pattern(archive_basename, archive_extensions)
+    archives = []
+    with os.scandir(archive_dir) as archive_scan:
+        for entry in archive_scan:
+            name_match = name_pattern.match(entry.name)
+            if name_match is None or not entry.is_file():
+                continue
+            try:
+                archive_date = datetime.datetime.strptime(name_match.group(1), "%Y%m%d").date()
+            except ValueError:
+                continue
+            archives.append(ArchiveFile(entry.name, archive_date, LEVEL_TAGS.get(name_match.group(2), bm.LEVEL_FULL),
+                                        entry.stat().st_mtime))
+    # the names of an incremental and a differential of the same day do not tell which was taken last
+    archives.sort(key=lambda archive: (archive.date, archive.level != bm.LEVEL_FULL, archive.mtime, archive.name))
+    return archives
+
+
+def archive_chains(archives):
+    """
+    This function groups archives, oldest first, into chains of a full backup followed by the
+    incrementals and differentials depending on it
+    :return: list of chains, each a list of ArchiveFile
+    """
+    chains = []
+    for archive in archives:
+        if archive.level == bm.LEVEL_FULL or len(chains) == 0:
+            chains.append([archive])
+        else:
+            chains[-1].append(archive)
+    return chains
+
+
+class RetentionPolicy:
+    """
+        This class decides which versions of a BackupSet are kept. It keeps the last versions and,
+        grandfather-father-son style, the newest version of each of the last days, weeks, months and
+        years having one. A plain number of Versions keeps that many last versions, as before.
+
+    Args
+        Required: none
+        Optional: last, daily, weekly, monthly, yearly
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, last=0, daily=0, weekly=0, monthly=0, yearly=0):
+        self.last = last
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.yearly = yearly
+
+    @classmethod
+    def from_versions(cls, versions):
+        """
+        This method reads the Versions value of a BackupSet
+        :param versions: number of versions, or rules such as "7d 4w 12m"
+        :return: RetentionPolicy object
+        :raise ValueError: when versions is neither
+        """
+        if isinstance(versions, (int, float)):
+            return cls(last=int(versions))
+        versions = str(versions).strip()
+        if versions.isdigit():
+            return cls(last=int(versions))
+        if RULE_PATTERN.sub("", versions).strip(" ,;") != "" or not RULE_PATTERN.search(versions):
+            raise ValueError(f'Versions {versions} is neither a number nor retention rules such as 7d 4w 12m')
+        rules = {}
+        for count, unit in RULE_PATTERN.findall(versions):
+            rules[RULE_UNITS[unit.lower()]] = int(count)
+        return cls(**rules)
+
+    def __str__(self):
+        return " ".join(f'{getattr(self, rule)}{unit}' for unit, rule in RULE_UNITS.items() if getattr(self, rule))
+
+    def kept(self, version_dates):
+        """
+        This method applies the policy to the dates of the versions of a BackupSet
+        :param version_dates: date of every version, newest first
+        :return: set of the positions in version_dates of the versions to keep
+        """
+        rule_buckets = [(self.daily, lambda version_date: version_date),
+                        (self.weekly, lambda version_date: version_date.isocalendar()[:2]),
+                        (self.monthly, lambda version_date: (version_date.year, version_date.month)),
+                        (self.yearly, lambda version_date: version_date.year)]
+        kept_versions = set(range(min(max(self.last, 0), len(version_dates))))
+        for rule_count, bucket_key in rule_buckets:
+            last_bucket = None
+            for position, version_date in enumerate(version_dates):
+                if rule_count <= 0:
+                    break
+                if bucket_key(version_date) != last_bucket:
+                    last_bucket = bucket_key(version_date)
+                    kept_versions.add(position)
+                    rule_count -= 1
+        return kept_versions
+
+
+def archive_files(archive_path):
+    """ Return an archive with its manifest and index and any partial file left of it, deleted together """
+    return [archive_path, bm.manifest_file(archive_path), sa.index_file(archive_path),
+            ckpt.part_file(archive_path), ckpt.journal_file(archive_path)]
+
+
+def prune_archives(archive_paths):
+    """
+    This function deletes archives with their manifests and indexes
+    :return: tuple of the list of archives deleted and the list of (path, OSError) not deleted
+    """
+    deleted_archives = []
+    prune_errors = []
+    for archive_path in archive_paths:
+        try:
+            for archive_file in archive_files(archive_path):
+                if os.path.isfile(archive_file):
+                    os.remove(archive_file)
+            deleted_archives.append(archive_path)
+        except OSError as ose:
+            prune_errors.append((archive_path, ose))
+    return deleted_archives, prune_errors
+
+
+class BackgroundPruner:
+    """
+        This class deletes expired archives in a background thread, so the next BackupSet is
+        archived while the storage of the previous one is pruned. There is one per process.
+
+    Args
+        Required: none
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self):
+        self.executor = None
+        self.pending_prunes = []
+
+    def submit(self, archive_paths):
+        """ Queue archives for deletion, in the order they are submitted """
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prune")
+        self.pending_prunes.append(self.executor.submit(prune_archives, list(archive_paths)))
+
+    def wait(self):
+        """
+        This method waits for the queued deletions
+        :return: tuple of the list of archives deleted and the list of (path, OSError) not deleted
+        """
+        deleted_archives = []
+        prune_errors = []
+        for pending_prune in self.pending_prunes:
+            prune_deleted, prune_failed = pending_prune.result()
+            deleted_archives.extend(prune_deleted)
+            prune_errors.extend(prune_failed)
+        self.pending_prunes = []
+        return deleted_archives, prune_errors
+
+
+background_pruner = BackgroundPruner()
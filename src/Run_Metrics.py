@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import socket
+import time
+
+""" This package contains the performance metrics of a run, appended as JSON lines and exported for Prometheus"""
+
+METRICS_EXTENSION = "metrics.jsonl"
+# metric fields exported to the Prometheus textfile, with their metric name and help text; fields left None
+# are not exported
+PROMETHEUS_FIELDS = {
+    "wall_seconds": ("pythonbackup_wall_seconds", "Wall time of the last run in seconds"),
+    "files": ("pythonbackup_files", "Files processed by the last run"),
+    "bytes_read": ("pythonbackup_read_bytes", "Bytes read by the last run"),
+    "bytes_written": ("pythonbackup_written_bytes", "Bytes written by the last run"),
+    "compression_ratio": ("pythonbackup_compression_ratio", "Bytes read per byte written by the last run"),
+    "files_per_second": ("pythonbackup_files_per_second", "Files processed per second by the last run"),
+    "success": ("pythonbackup_success", "1 when the last run returned 0"),
+    "timestamp": ("pythonbackup_last_run_timestamp_seconds", "Unix time the last run ended"),
+}
+SAMPLE_PATTERN = re.compile(r'^(\w+)\{operation="((?:[^"\\]|\\.)*)",name="((?:[^"\\]|\\.)*)"\} (\S+)$')
+
+
+def new_run_id():
+    """ Return the id tying together the metrics written by one run and its worker processes """
+    return f'{socket.gethostname()}-{os.getpid()}-{int(time.time())}'
+
+
+class RunMetric:
+    """
+        This class measures one operation of a run, a BackupSet archive or a whole mode,
+        counting the files it processed and the bytes it read and wrote
+
+    Args
+        Required: operation, name
+        Optional: run id
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, operation, name, run_id=None):
+        self.operation = operation
+        self.name = str(name)
+        self.run_id = run_id
+        self.files = 0
+        self.bytes_read = None
+        self.bytes_written = None
+        self.start_time = time.monotonic()
+        self.wall_seconds = None
+        self.return_code = None
+
+    def finish(self, return_code):
+        self.wall_seconds = time.monotonic() - self.start_time
+        self.return_code = return_code
+        return self
+
+    def as_dict(self):
+        """ Return the metric as written to the JSON lines, with the rates derived from the counts """
+        wall_seconds = self.wall_seconds if self.wall_seconds is not None else time.monotonic() - self.start_time
+        return {"run_id": self.run_id, "host": socket.gethostname(), "operation": self.operation,
+                "name": self.name, "timestamp": round(time.time(), 3), "wall_seconds": round(wall_seconds, 3),
+                "files": self.files, "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                "compression_ratio": round(self.bytes_read / self.bytes_written, 3)
+                if self.bytes_read is not None and self.bytes_written else None,
+                "files_per_second": round(self.files / wall_seconds, 1) if wall_seconds > 0 else None,
+                "success": int(self.return_code == 0), "return_code": str(self.return_code)}
+
+    def __str__(self):
+        metric = self.as_dict()
+        summary = f'{self.operation} {self.name}: {metric["wall_seconds"]:.1f}s, {self.files} files'
+        if metric["files_per_second"] is not None:
+            summary += f' at {metric["files_per_second"]:.1f} files/s'
+        for field in ("bytes_read", "bytes_written"):
+            if metric[field] is not None:
+                summary += f', {metric[field] / (1024 * 1024):.1f} MB {field.split("_")[1]}'
+        if metric["compression_ratio"] is not None:
+            summary += f', ratio {metric["compression_ratio"]:.2f}'
+        return summary
+
+
+def append_metric(metrics_path, run_metric):
+    """
+    This function appends a metric to the JSON lines file of the run. The line is written with a single
+    write to a file opened for appending, so worker processes can share the file.
+    """
+    metric_line = (json.dumps(run_metric.as_dict()) + "\n").encode("utf-8")
+    fd = os.open(metrics_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, metric_line)
+    finally:
+        os.close(fd)
+
+
+def read_metrics(metrics_path, run_id=None):
+    """ Return the metrics of a JSON lines file, only those of one run when run_id is given """
+    metrics = []
+    if not os.path.isfile(metrics_path):
+        return metrics
+    with open(metrics_path, encoding="utf-8") as fi:
+        for line in fi:
+            try:
+                metric = json.loads(line)
+            except ValueError:
+                continue
+            if run_id is None or metric.get("run_id") == run_id:
+                metrics.append(metric)
+    return metrics
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def write_textfile(textfile_path, metrics):
+    """
+    This function writes the metrics into a Prometheus node-exporter textfile. The samples of the
+    operations and names not in metrics are kept from the previous textfile, so every BackupSet keeps
+    its last values whichever run archived it. The file is replaced atomically, as the collector
+    may read it at any time.
+    :return: number of samples written
+    """
+    samples = {}
+    if os.path.isfile(textfile_path):
+        with open(textfile_path, encoding="utf-8") as fi:
+            for line in fi:
+                sample_match = SAMPLE_PATTERN.match(line.strip())
+                if sample_match is not None:
+                    samples[(sample_match.group(2), sample_match.group(3), sample_match.group(1))] = \
+                        sample_match.group(4)
+    for metric in metrics:
+        operation, name = label_value(metric["operation"]), label_value(metric["name"])
+        for field, (metric_name, _) in PROMETHEUS_FIELDS.items():
+            samples.pop((operation, name, metric_name), None)
+            if metric.get(field) is not None:
+                samples[(operation, name, metric_name)] = repr(float(metric[field]))
+
+    textfile_lines = []
+    for metric_name, help_text in PROMETHEUS_FIELDS.values():
+        field_samples = sorted((operation, name, value) for (operation, name, sample_name), value in samples.items()
+                               if sample_name == metric_name)
+        if field_samples:
+            textfile_lines.append(f'# HELP {metric_name} {help_text}')
+            textfile_lines.append(f'# TYPE {metric_name} gauge')
+            textfile_lines.extend(f'{metric_name}{{operation="{operation}",name="{name}"}} {value}'
+                                  for operation, name, value in field_samples)
+    textfile_tmp = f'{textfile_path}.{os.getpid()}.tmp'
+    try:
+        with open(textfile_tmp, "w", encoding="utf-8") as fo:
+            fo.write("\n".join(textfile_lines) + "\n")
+        os.replace(textfile_tmp, textfile_path)
+    finally:
+        if os.path.exists(textfile_tmp):
+            os.remove(textfile_tmp)
+    return len(samples)
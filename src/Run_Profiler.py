@@ -0,0 +1,124 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import tracemalloc
+
+""" This package contains the per phase cProfile and tracemalloc profiling of a run"""
+
+PROFILE_DIR_PREFIX = "profile"
+SUMMARY_FILE = "phases.txt"
+# functions listed in the summary of each phase, by cumulative time
+TOP_FUNCTIONS = 30
+# source lines listed in the summary of each phase, by memory allocated during the phase and still held
+TOP_ALLOCATIONS = 15
+TRACE_FRAMES = 1
+MB = 1024 * 1024
+
+# profilers already opened by this process, keyed by profile directory
+opened_profilers = {}
+
+
+def phase_slug(phase_name):
+    """ Return a phase name usable in a file name """
+    return re.sub(r'[^A-Za-z0-9_.-]+', "_", phase_name).strip("_") or "phase"
+
+
+def profiler_for(report_dir, run_name):
+    """ Return the profiler of a run in this process, worker processes get their own into the same directory """
+    profile_dir = os.path.join(report_dir, f'{PROFILE_DIR_PREFIX}_{run_name}')
+    if profile_dir not in opened_profilers:
+        opened_profilers[profile_dir] = PhaseProfiler(profile_dir)
+    return opened_profilers[profile_dir]
+
+
+class PhaseProfiler:
+    """
+        This class profiles the phases of a run, each in its own cProfile profiler, while tracemalloc
+        follows the memory they allocate. Every phase leaves in the profile directory its cProfile stats,
+        loadable with pstats or snakeviz, and a summary of its wall time, peak memory, top functions
+        and top allocating lines. A phase started inside another pauses the outer one's profiler.
+
+    Args
+        Required: profile directory
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, profile_dir):
+        self.profile_dir = profile_dir
+        os.makedirs(profile_dir, exist_ok=True)
+        self.phase_count = 0
+        self.active_phases = []
+
+    @contextlib.contextmanager
+    def phase(self, phase_name):
+        """ Profile the code run inside the with block as one phase """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self.phase_count += 1
+        if self.active_phases:
+            outer_phase = self.active_phases[-1]
+            outer_phase["profile"].disable()
+            outer_phase["peak"] = max(outer_phase["peak"], tracemalloc.get_traced_memory()[1])
+        phase_record = {"name": phase_name, "number": self.phase_count, "profile": cProfile.Profile(), "peak": 0,
+                        "start_memory": tracemalloc.get_traced_memory()[0],
+                        "start_snapshot": tracemalloc.take_snapshot()}
+        self.active_phases.append(phase_record)
+        tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        phase_record["profile"].enable()
+        try:
+            yield phase_record
+        finally:
+            phase_record["profile"].disable()
+            phase_record["wall_seconds"] = time.perf_counter() - start_time
+            phase_record["peak"] = max(phase_record["peak"], tracemalloc.get_traced_memory()[1])
+            self.active_phases.pop()
+            self.write_report(phase_record)
+            if self.active_phases:
+                outer_phase = self.active_phases[-1]
+                outer_phase["peak"] = max(outer_phase["peak"], phase_record["peak"])
+                tracemalloc.reset_peak()
+                outer_phase["profile"].enable()
+
+    def write_report(self, phase_record):
+        """
+        This method writes the cProfile stats and the summary of a finished phase
+        :return: one line summary of the phase
+        """
+        report_base = os.path.join(self.profile_dir, f'{os.getpid()}_{phase_record["number"]:03d}_'
+                                                     f'{phase_slug(phase_record["name"])}')
+        phase_record["profile"].dump_stats(f'{report_base}.prof')
+
+        stats_out = io.StringIO()
+        pstats.Stats(phase_record["profile"], stream=stats_out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        own_files = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                     tracemalloc.Filter(False, cProfile.__file__), tracemalloc.Filter(False, pstats.__file__))
+        allocation_diffs = tracemalloc.take_snapshot().filter_traces(own_files).compare_to(
+            phase_record["start_snapshot"].filter_traces(own_files), "lineno")
+        phase_record["start_snapshot"] = None
+
+        phase_summary = f'{phase_record["name"]}: {phase_record["wall_seconds"]:.2f}s, ' \
+                        f'peak {(phase_record["peak"] - phase_record["start_memory"]) / MB:.1f} MB above ' \
+                        f'{phase_record["start_memory"] / MB:.1f} MB traced at its start'
+        with open(f'{report_base}.txt', "w", encoding="utf-8") as fo:
+            fo.write(f'Phase {phase_summary}\n\n')
+            fo.write(f'Top {TOP_ALLOCATIONS} lines by memory allocated during the phase and still held\n')
+            for allocation_diff in allocation_diffs[:TOP_ALLOCATIONS]:
+                fo.write(f'  {allocation_diff}\n')
+            fo.write(f'\nTop {TOP_FUNCTIONS} functions by cumulative time\n')
+            fo.write(stats_out.getvalue())
+        with open(os.path.join(self.profile_dir, SUMMARY_FILE), "a", encoding="utf-8") as fo:
+            fo.write(f'{os.path.basename(report_base)} {phase_summary}\n')
+        phase_record["summary"] = phase_summary
+        return phase_summary
@@ -0,0 +1,159 @@
+import bisect
+import fnmatch
+import gzip
+import json
+import os
+import tarfile
+
+""" This package contains the member index of seekable archives and the single member lookup using it"""
+
+INDEX_EXTENSION = "idx"
+SEEKABLE_CODECS = ("GZIP", "NONE")
+
+
+def index_file(archive_file):
+    """ Return the index path of an archive """
+    return f'{archive_file}.{INDEX_EXTENSION}'
+
+
+def member_selected(member_name, path_globs):
+    """
+    Return True when a member name matches one of the fnmatch globs, or no globs were given. Globs are
+    matched as member names, without the leading /, so a glob selects the same paths in every storage format.
+    """
+    if not path_globs:
+        return True
+    return any(fnmatch.fnmatch(member_name, glob.replace(os.sep, "/").lstrip("/")) for glob in path_globs)
+
+
+def tar_extract(tar_in, tarinfo, target_dir):
+    """ Extract a member keeping its mtime and permissions, using the tar filter where Python has filters """
+    if hasattr(tarfile, "tar_filter"):
+        tar_in.extract(tarinfo, target_dir, filter="tar")
+    else:
+        tar_in.extract(tarinfo, target_dir)
+
+
+class ArchiveIndex:
+    """
+        This class collects the offset of every member while an archive is written and saves
+        the index next to the archive. The index maps each member name to the uncompressed offset
+        of its tar header, and each compressed block to its uncompressed and file offsets.
+
+    Args
+        Required: none
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self):
+        self.members = []
+
+    def add_member(self, tarinfo, member_offset):
+        """ Record a member just added to the tar stream at member_offset """
+        self.members.append((tarinfo.name, member_offset, tarinfo.size))
+
+    def save(self, archive_file, codec_name, block_offsets):
+        """
+        Write the index next to the archive
+        :param archive_file: archive the index describes
+        :param codec_name: codec the archive was written with, GZIP or NONE
+        :param block_offsets: list of (uncompressed offset, file offset) of each independent block
+        :return: path of the index
+        """
+        with gzip.open(index_file(archive_file), "wt", encoding="utf-8") as fo:
+            fo.write(json.dumps({"codec": codec_name, "members": len(self.members),
+                                 "blocks": [list(block_offset) for block_offset in block_offsets]}) + "\n")
+            for member_name, member_offset, member_size in self.members:
+                fo.write(json.dumps({"name": member_name, "offset": member_offset, "size": member_size}) + "\n")
+        return index_file(archive_file)
+
+
+class SeekableArchive:
+    """
+        This class reads single members of an indexed archive. It seeks straight to the
+        compressed block holding the member, so the time to restore a file depends on the
+        file's size and not on the size of the archive.
+
+    Args
+        Required: archive file
+        Optional: none
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        self.members = {}
+        with gzip.open(index_file(archive_file), "rt", encoding="utf-8") as fi:
+            index_header = json.loads(fi.readline())
+            for line in fi:
+                index_entry = json.loads(line)
+                self.members[index_entry["name"]] = (index_entry["offset"], index_entry["size"])
+        self.codec = index_header["codec"]
+        self.block_uoffsets = [block_offset[0] for block_offset in index_header["blocks"]]
+        self.block_foffsets = [block_offset[1] for block_offset in index_header["blocks"]]
+
+    @staticmethod
+    def has_index(archive_file):
+        return os.path.isfile(index_file(archive_file))
+
+    @staticmethod
+    def member_name(path):
+        """ Return the name tarfile stores a path under """
+        return str(path).replace(os.sep, "/").lstrip("/")
+
+    def member_names(self):
+        return list(self.members)
+
+    def open_member(self, member_name):
+        """
+        Open the archive positioned on the tar header of a member
+        :return: tuple of the open archive file and a stream starting at the member header
+        """
+        member_offset = self.members[self.member_name(member_name)][0]
+        archive_in = open(self.archive_file, "rb")
+        if self.codec == "NONE":
+            archive_in.seek(member_offset)
+            return archive_in, archive_in
+
+        block_number = max(bisect.bisect_right(self.block_uoffsets, member_offset) - 1, 0)
+        archive_in.seek(self.block_foffsets[block_number])
+        member_stream = gzip.GzipFile(fileobj=archive_in, mode="rb")
+        member_stream.seek(member_offset - self.block_uoffsets[block_number])
+        return archive_in, member_stream
+
+    def extract_member(self, member_name, target_dir):
+        """
+        Extract one member under target_dir, keeping its mtime and permissions
+        :return: TarInfo of the extracted member
+        """
+        archive_in, member_stream = self.open_member(member_name)
+        try:
+            with tarfile.open(fileobj=member_stream, mode="r|") as tar_in:
+                tarinfo = tar_in.next()
+                tar_extract(tar_in, tarinfo, target_dir)
+                return tarinfo
+        finally:
+            archive_in.close()
+
+    def read_member(self, member_name):
+        """ Return the content of a file member """
+        archive_in, member_stream = self.open_member(member_name)
+        try:
+            with tarfile.open(fileobj=member_stream, mode="r|") as tar_in:
+                member_in = tar_in.extractfile(tar_in.next())
+                return member_in.read() if member_in is not None else b""
+        finally:
+            archive_in.close()
@@ -0,0 +1,155 @@
+import os
+from array import array
+
+import Metadata_Catalog as md_catalog
+
+""" This package contains the per directory size table built in one scandir pass over a set of folders"""
+
+
+class SizeTable:
+    """
+        This class walks a set of folders once with os.scandir and keeps one row per directory:
+        its parent row, its depth, the size of the directory itself and the bytes of the files
+        directly in it. The columns are arrays, so the subtree totals are rolled up bottom-up in
+        one pass, vectorized per depth level when NumPy is installed. Nested folders are read
+        once, however many FS_SIZE rows ask for them.
+
+    Args
+        Required: none
+        Optional: metadata_catalog
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, metadata_catalog=None):
+        self.metadata_catalog = metadata_catalog
+        self.dir_paths = []
+        self.dir_index = {}
+        self.parents = array('q')
+        self.depths = array('q')
+        self.dir_sizes = array('q')
+        self.file_sizes = array('q')
+        self.failed = array('b')
+        self.scan_errors = []
+        self.totals = None
+
+    @classmethod
+    def scan_roots(cls, root_paths, metadata_catalog=None):
+        """
+        This method builds the table of the folders in root_paths. A folder lying inside another
+        one is answered from the outer folder's scan instead of being walked again.
+        :param root_paths: list of folder paths
+        :param metadata_catalog: optional MetadataCatalog the listings are read from and recorded in
+        :return: SizeTable object with its totals rolled up
+        """
+        size_table = cls(metadata_catalog)
+        for root_path in sorted({os.path.normpath(str(root_path)) for root_path in root_paths}):
+            if root_path not in size_table.dir_index:
+                size_table.scan(root_path)
+        size_table.rollup()
+        return size_table
+
+    def add_dir(self, dir_path, parent, depth, dir_size):
+        self.dir_index[dir_path] = len(self.dir_paths)
+        self.dir_paths.append(dir_path)
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.dir_sizes.append(dir_size)
+        self.file_sizes.append(0)
+        self.failed.append(0)
+        return self.dir_index[dir_path]
+
+    def scan(self, root_path):
+        """
+        This method adds the directories under root_path to the table, depth first. Files are sized with
+        one stat each, symlinked files by the size of their target. Symlinked directories are not followed.
+        A directory that cannot be read is marked failed and sizes to 0 along with its subtree.
+        """
+        try:
+            root_size = os.path.getsize(root_path)
+        except OSError as ose:
+            self.scan_errors.append((root_path, ose))
+            return
+        pending_dirs = [self.add_dir(root_path, -1, 0, root_size)]
+        while pending_dirs:
+            dir_row = pending_dirs.pop()
+            dir_path = self.dir_paths[dir_row]
+            try:
+                subdir_sizes, file_bytes = self.list_sizes(dir_path)
+            except OSError as ose:
+                self.scan_errors.append((dir_path, ose))
+                self.failed[dir_row] = 1
+                continue
+            for subdir_path, subdir_size in subdir_sizes:
+                pending_dirs.append(self.add_dir(subdir_path, dir_row, self.depths[dir_row] + 1, subdir_size))
+            self.file_sizes[dir_row] = file_bytes
+
+    def list_sizes(self, dir_path):
+        """
+        This method lists one directory, through the metadata catalog when there is one
+        :return: tuple of the list of (subdirectory path, size) and the bytes of the files in the directory
+        """
+        subdir_sizes = []
+        file_bytes = 0
+        if self.metadata_catalog is not None:
+            _, dir_entries = self.metadata_catalog.list_dir(dir_path, stat_entries=True)
+            for name, kind, _, size, _ in dir_entries:
+                if kind == md_catalog.KIND_DIR:
+                    subdir_sizes.append((os.path.join(dir_path, name), size))
+                elif kind == md_catalog.KIND_LINK:
+                    if os.path.isfile(os.path.join(dir_path, name)):
+                        file_bytes += os.path.getsize(os.path.join(dir_path, name))
+                else:
+                    file_bytes += size
+            return subdir_sizes, file_bytes
+
+        with os.scandir(dir_path) as dir_scan:
+            for dir_entry in dir_scan:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    subdir_sizes.append((dir_entry.path, dir_entry.stat(follow_symlinks=False).st_size))
+                elif dir_entry.is_symlink():
+                    if dir_entry.is_file():
+                        file_bytes += dir_entry.stat().st_size
+                else:
+                    file_bytes += dir_entry.stat(follow_symlinks=False).st_size
+        return subdir_sizes, file_bytes
+
+    def rollup(self):
+        """ Sum every directory's size, its files and its subdirectories' totals, deepest directories first """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is None or len(self.dir_paths) == 0:
+            totals = [dir_size + file_size for dir_size, file_size in zip(self.dir_sizes, self.file_sizes)]
+            # rows are added depth first, so every child comes after its parent
+            for dir_row in range(len(totals) - 1, -1, -1):
+                if self.failed[dir_row]:
+                    totals[dir_row] = 0
+                if self.parents[dir_row] >= 0:
+                    totals[self.parents[dir_row]] += totals[dir_row]
+        else:
+            parents = np.frombuffer(self.parents, dtype=np.int64)
+            depths = np.frombuffer(self.depths, dtype=np.int64)
+            failed = np.frombuffer(self.failed, dtype=np.int8).astype(bool)
+            totals = np.frombuffer(self.dir_sizes, dtype=np.int64) + np.frombuffer(self.file_sizes, dtype=np.int64)
+            for depth in range(int(depths.max()), -1, -1):
+                level_rows = depths == depth
+                totals[level_rows & failed] = 0
+                child_rows = level_rows & (parents >= 0)
+                np.add.at(totals, parents[child_rows], totals[child_rows])
+            totals = totals.tolist()
+        self.totals = totals
+
+    def folder_size(self, folder):
+        """ Return the total size of a scanned folder and everything below it, None if it was not scanned """
+        dir_row = self.dir_index.get(os.path.normpath(str(folder)))
+        if dir_row is None:
+            return None
+        return self.totals[dir_row]
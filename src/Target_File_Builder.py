@@ -1,11 +1,18 @@
+import datetime
 import os
 import re
 
+import Archive_Checkpoint as ckpt
+import Backup_Manifest as bm
+import Compression_Codecs as codecs
+import Retention as retention
 from CommonLogger import LoggerServices as logger_services
 from CommonOs import OsServices as os_services
 
 """ This package contains methods to roll a provided number of files to archive"""
 
+LEVEL_SUFFIXES = {bm.LEVEL_FULL: "", bm.LEVEL_INCREMENTAL: "_L1", bm.LEVEL_DIFFERENTIAL: "_D"}
+
 
 class Target_File_Builder(os_services):
     """
@@ -23,9 +30,16 @@ class Target_File_Builder(os_services):
     __version__ = "20220330.1"
     # # # # # End of header # # # #
     
-    def __init__(self, archive_target_file, versions):
+    def __init__(self, archive_target_file, versions, extension="tgz", level=bm.LEVEL_FULL, resume=False):
         # super().__init__()
         self.versions = versions
+        self.extension = extension
+        self.level = level
+        self.resume = resume
+        self.resumed_archive = None
+        self.reference_archive = None
+        self.expired_archives = []
+        self.stale_archives = []
         self.archive_target_file = archive_target_file
         self.create_target_file()
 
@@ -34,42 +48,142 @@ class Target_File_Builder(os_services):
         archive_target_basename = os.path.basename(self.archive_target_file)
         archive_target_basename = archive_target_basename.split('_')[0]
 
-        atf_list = []
+        atf_chains = []
+        atf_parts = []
         logger_services.debug(self, f'Looking for {archive_target_basename} files in {archive_target_filename_path}')
 
-        # remove any excessive archive target files
         if os.path.isdir(archive_target_filename_path):
             atf_list = self.atfp_scan(archive_target_filename_path)
-            while len(atf_list) >= self.versions:
-                if len(atf_list) > 0:
-                    # equal to or exceeded versions count - delete the oldest file
-                    atf_eldest = os.path.join(archive_target_filename_path, sorted(atf_list)[0])
-                    logger_services.debug(self, f'Deleting {atf_eldest}')
-                    os.remove(atf_eldest)
-                    atf_list = self.atfp_scan(archive_target_filename_path)
-                else:
-                    logger_services.debug(self, f'No previous files exist.')
+            atf_parts = [atf for atf in atf_list if atf.endswith(f'.{ckpt.PART_EXTENSION}')]
+            atf_chains = self.archive_chains([atf for atf in atf_list if atf not in atf_parts])
         else:
             os.makedirs(archive_target_filename_path)
 
-        self.archive_target_file = os.path.join(
-            archive_target_filename_path, f'{archive_target_basename}_{self.file_date()}.tgz')
+        archive_target_name = f'{archive_target_basename}_{self.file_date()}' \
+                              f'{LEVEL_SUFFIXES[self.level]}.{self.extension}'
+
+        # an interrupted archive with a checkpoint is continued under its own name and level
+        atf_interrupted = [atf_part[:-len(ckpt.PART_EXTENSION) - 1] for atf_part in atf_parts]
+        atf_resumable = [atf for atf in atf_interrupted if atf.endswith(f'.{self.extension}') and
+                         os.path.isfile(ckpt.journal_file(os.path.join(archive_target_filename_path, atf)))]
+        if self.resume and len(atf_resumable) > 0:
+            archive_target_name = atf_resumable[-1]
+            self.resumed_archive = os.path.join(archive_target_filename_path, archive_target_name)
+            self.level = self.archive_level(archive_target_name)
+            logger_services.info(self, f'Resuming the interrupted archive {archive_target_name}')
+
+        # an incremental or differential needs the manifest of the backup it builds on
+        if self.level != bm.LEVEL_FULL:
+            self.reference_archive = self.reference_getter(atf_chains, archive_target_name)
+            if self.reference_archive is not None:
+                self.reference_archive = os.path.join(archive_target_filename_path, self.reference_archive)
+            if self.reference_archive is None or not os.path.isfile(bm.manifest_file(self.reference_archive)):
+                logger_services.warn(self, f'No full backup with a manifest found for {archive_target_basename}, '
+                                           f'taking a full backup instead.')
+                self.level = bm.LEVEL_FULL
+                self.reference_archive = None
+                self.resumed_archive = None
+                archive_target_name = f'{archive_target_basename}_{self.file_date()}.{self.extension}'
+
+        # partial files of other archives are left from interrupted runs
+        self.stale_archives = [os.path.join(archive_target_filename_path, atf) for atf in atf_interrupted
+                               if atf != archive_target_name]
+
+        # expired archive chains are removed when a full backup starts a new chain, a full backup
+        # and the incrementals depending on it go together
+        if self.level == bm.LEVEL_FULL:
+            self.expired_archives = [os.path.join(archive_target_filename_path, atf)
+                                     for atf_chain in self.expired_chains(atf_chains, archive_target_name)
+                                     for atf in atf_chain]
+            for atf_expired in self.expired_archives:
+                logger_services.debug(self, f'Deleting {atf_expired}')
+
+        self.archive_target_file = os.path.join(archive_target_filename_path, archive_target_name)
         logger_services.debug(self, f'New archive target file is {self.archive_target_file}')
         return self.archive_target_file
 
+    def expired_chains(self, atf_chains, archive_target_name):
+        """
+        This method applies the Versions retention policy to the archive chains, counting the new
+        full backup as the newest version. The full backup a new one overwrites, a second run the same
+        day, is not expired, but the incrementals and differentials taken against it are, as they
+        would be left pointing at the replaced full.
+        :param atf_chains: chains of archive file names, oldest first
+        :return: list of the chains to delete
+        """
+        overwritten_chains = [atf_chain[1:] for atf_chain in atf_chains
+                              if atf_chain[0] == archive_target_name and len(atf_chain) > 1]
+        atf_chains = [atf_chain for atf_chain in atf_chains if atf_chain[0] != archive_target_name]
+        try:
+            retention_policy = retention.RetentionPolicy.from_versions(self.versions)
+        except ValueError as ve:
+            logger_services.warn(self, f'{ve}, only the archives depending on an overwritten full are deleted.')
+            return overwritten_chains
+        chain_dates = [datetime.date.today()] + [self.archive_date(atf_chain[-1]) for atf_chain in reversed(atf_chains)]
+        kept_chains = retention_policy.kept(chain_dates)
+        return overwritten_chains + [atf_chain for position, atf_chain in enumerate(reversed(atf_chains), start=1)
+                                     if position not in kept_chains]
+
+    @staticmethod
+    def archive_level(atf):
+        """ Return the backup level of an archive file name """
+        level_match = re.search(r'_\d{8}_(L1|D)\.', atf)
+        if level_match is None:
+            return bm.LEVEL_FULL
+        return bm.LEVEL_INCREMENTAL if level_match.group(1) == "L1" else bm.LEVEL_DIFFERENTIAL
+
+    @staticmethod
+    def archive_date(atf):
+        """ Return the date of an archive file name """
+        return datetime.datetime.strptime(re.search(r'_(\d{8})(?:_(?:L1|D))?\.', atf).group(1), "%Y%m%d").date()
+
+    def archive_chains(self, atf_list):
+        """
+        This method groups archive file names, oldest first, into chains of a full backup
+        followed by the incrementals and differentials depending on it
+        :param atf_list: archive file names found by atfp_scan
+        :return: list of chains, each a list of archive file names
+        """
+        atf_chains = []
+        for atf in sorted(atf_list):
+            if self.archive_level(atf) == bm.LEVEL_FULL or len(atf_chains) == 0:
+                atf_chains.append([atf])
+            else:
+                atf_chains[-1].append(atf)
+        return atf_chains
+
+    def reference_getter(self, atf_chains, archive_target_name):
+        """
+        This method returns the archive an incremental or differential is taken against: the latest archive
+        of the current chain for an incremental, the full backup of the current chain for a differential.
+        An archive about to be overwritten by the new target is never used as the reference.
+        :return: archive file name or None when there is no full backup to build on
+        """
+        if len(atf_chains) == 0 or self.archive_level(atf_chains[-1][0]) != bm.LEVEL_FULL:
+            return None
+        atf_chain = [atf for atf in atf_chains[-1] if atf != archive_target_name]
+        if len(atf_chain) == 0:
+            return None
+        if self.level == bm.LEVEL_DIFFERENTIAL:
+            return atf_chain[0]
+        return atf_chain[-1]
+
     def atfp_scan(self, archive_target_filename_path):
+        """
+        This method lists the archives of this BackupSet with one scan of its folder. Names are matched
+        exactly, basename_YYYYMMDD[_L1|_D].extension, so sets sharing a prefix are left alone.
+        Partial files of interrupted archives are listed too, with their .part extension.
+        :return: list of archive file names, oldest first
+        """
         archive_target_basename = os.path.basename(self.archive_target_file)
         if '_' in archive_target_basename:
             archive_target_basename = archive_target_basename.split('_')[0]
 
-        atf_list = []
-
-        with os.scandir(archive_target_filename_path) as atfp_scan:
-            for entry in atfp_scan:
-                if not entry.name.startswith('.') and entry.is_file():
-                    if re.search(rf'^{archive_target_basename}', entry.name):
-                        atf_list.append(entry.name)
-            logger_services.debug(self, f'{len(atf_list)} files found')
-            for atf in atf_list:
-                logger_services.debug(self, f'  {atf}')
+        archive_extensions = codecs.archive_extensions()
+        atf_list = [archive.name for archive in retention.scan_archives(
+            archive_target_filename_path, archive_target_basename,
+            archive_extensions + tuple(f'{extension}.{ckpt.PART_EXTENSION}' for extension in archive_extensions))]
+        logger_services.debug(self, f'{len(atf_list)} files found')
+        for atf in atf_list:
+            logger_services.debug(self, f'  {atf}')
         return atf_list
@@ -0,0 +1,300 @@
+import os
+import signal
+import threading
+import time
+
+""" This package contains the token bucket throttling of the reads, writes and compression threads of an archive"""
+
+# AppConfig rows Throttle_<StorageSetName>, Throttle_<DeviceType> and Throttle_Default hold the read MB/s,
+# write MB/s and compression threads caps in Value1 to Value3, a blank value leaves that resource uncapped
+CONFIG_KEY_PREFIX = "Throttle_"
+DEFAULT_CONFIG_KEY = "Throttle_Default"
+# control file in the resource directory overriding the AppConfig caps of every archive being written,
+# with lines such as "read 20", "write 10" and "threads 2", none or 0 lifting a cap
+CONTROL_FILE = "Throttle.control"
+CONTROL_KEYS = {"read": "read_mbs", "write": "write_mbs", "threads": "compress_threads"}
+# time between two checks of the control file
+CONTROL_POLL_SECONDS = 1.0
+# bytes a bucket may hold, in seconds of its rate, so short pauses are not made up with a burst
+BURST_SECONDS = 0.5
+MB = 1024 * 1024
+
+# set by the signal handlers, SIGUSR1 re-reads the control file and SIGUSR2 lifts or restores every cap
+reload_requested = threading.Event()
+throttling_suspended = threading.Event()
+
+
+def cap_value(value):
+    """ Return a cap read from the workbook or the control file, None for a blank, none or 0 value """
+    if value is None or str(value).strip().upper() in ("", "NONE", "0"):
+        return None
+    cap = float(value)
+    if cap < 0:
+        raise ValueError(f'Throttle cap {value} is negative')
+    return cap
+
+
+class ThrottleLimits:
+    """ The caps of one archive, None leaves the resource uncapped """
+
+    __slots__ = ("read_mbs", "write_mbs", "compress_threads")
+
+    def __init__(self, read_mbs=None, write_mbs=None, compress_threads=None):
+        self.read_mbs = read_mbs
+        self.write_mbs = write_mbs
+        self.compress_threads = int(compress_threads) if compress_threads else None
+
+    @classmethod
+    def from_row(cls, row_set):
+        """ Read the Value1 to Value3 columns of a Throttle_ AppConfig row """
+        row_values = list(row_set[1:4]) + [None] * (4 - len(row_set))
+        return cls(cap_value(row_values[0]), cap_value(row_values[1]), cap_value(row_values[2]))
+
+    def __str__(self):
+        return f'read {format_cap(self.read_mbs, "MB/s")}, write {format_cap(self.write_mbs, "MB/s")}, ' \
+               f'compress threads {format_cap(self.compress_threads, "")}'
+
+
+def format_cap(cap, unit):
+    return "uncapped" if cap is None else f'{cap:g} {unit}'.strip()
+
+
+def limits_for(app_config_rows, storage_set_name, device_type):
+    """
+    This function returns the caps of an archive from the AppConfig rows, the Throttle_ row of its
+    StorageSetName winning over the row of its DeviceType, which wins over Throttle_Default
+    :return: ThrottleLimits object, uncapped when no row matches
+    """
+    throttle_rows = {}
+    for row_set in app_config_rows:
+        if row_set and isinstance(row_set[0], str) and row_set[0].upper().startswith(CONFIG_KEY_PREFIX.upper()):
+            throttle_rows.setdefault(row_set[0].strip().upper(), row_set)
+    for config_key in (f'{CONFIG_KEY_PREFIX}{storage_set_name}', f'{CONFIG_KEY_PREFIX}{device_type}',
+                       DEFAULT_CONFIG_KEY):
+        if config_key.upper() in throttle_rows:
+            return ThrottleLimits.from_row(throttle_rows[config_key.upper()])
+    return ThrottleLimits()
+
+
+def read_control_file(control_path):
+    """
+    This function reads the caps set in the control file
+    :return: dictionary of ThrottleLimits attribute to cap, empty when there is no control file
+    :raise ValueError: when a line is not a known resource followed by a cap
+    """
+    control_caps = {}
+    if not os.path.isfile(control_path):
+        return control_caps
+    with open(control_path, encoding="utf-8") as fi:
+        for line in fi:
+            line = line.split("#", 1)[0].replace("=", " ").split()
+            if len(line) == 0:
+                continue
+            if len(line) != 2 or line[0].lower() not in CONTROL_KEYS:
+                raise ValueError(f'{control_path} line {" ".join(line)} is not one of '
+                                 f'{", ".join(CONTROL_KEYS)} followed by a cap')
+            control_caps[CONTROL_KEYS[line[0].lower()]] = cap_value(line[1])
+    return control_caps
+
+
+def request_reload(signum, frame):
+    reload_requested.set()
+
+
+def toggle_suspended(signum, frame):
+    if throttling_suspended.is_set():
+        throttling_suspended.clear()
+    else:
+        throttling_suspended.set()
+    reload_requested.set()
+
+
+def install_signal_handlers():
+    """ Handle SIGUSR1 and SIGUSR2 in this process, only the main thread of a process can set handlers """
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, request_reload)
+        signal.signal(signal.SIGUSR2, toggle_suspended)
+
+
+class TokenBucket:
+    """
+        This class lets bytes through at a rate, a caller taking more tokens than the bucket holds
+        sleeps until they have been refilled. It is shared by the threads of an archive.
+
+    Args
+        Required: none
+        Optional: rate in bytes per second, None for no limit
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = 0.0
+        self.refill_time = time.monotonic()
+        self.consumed_bytes = 0
+        self.waited_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.tokens = min(self.tokens, self.capacity())
+            self.refill_time = time.monotonic()
+
+    def capacity(self):
+        return (self.rate or 0) * BURST_SECONDS
+
+    def consume(self, nbytes):
+        """ Take nbytes from the bucket, sleeping while it is in debt """
+        with self.lock:
+            self.consumed_bytes += nbytes
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.refill_time) * self.rate, self.capacity()) - nbytes
+            self.refill_time = now
+            wait_seconds = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            # waiting inside the lock queues the other threads of the archive behind this one
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+                self.waited_seconds += wait_seconds
+                self.tokens = 0.0
+                self.refill_time = time.monotonic()
+
+
+class ThrottledFile:
+    """ A binary file whose reads or writes take their bytes from a token bucket, the rest is passed through """
+
+    def __init__(self, fileobj, token_bucket, throttle):
+        self.fileobj = fileobj
+        self.token_bucket = token_bucket
+        self.throttle = throttle
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.throttle.poll()
+        self.token_bucket.consume(len(data))
+        return data
+
+    def write(self, data):
+        self.throttle.poll()
+        self.token_bucket.consume(len(data))
+        return self.fileobj.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.fileobj.close()
+
+
+class ArchiveThrottle:
+    """
+        This class throttles the writing of one archive: the files read into it, the bytes written
+        to its storage and its compression threads. Its caps come from the AppConfig Throttle_ rows,
+        and are changed while the archive is written by the control file of the resource directory,
+        checked every second or at once on SIGUSR1. SIGUSR2 lifts every cap until it is sent again.
+
+    Args
+        Required: ThrottleLimits from the workbook
+        Optional: control file path
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, workbook_limits, control_path=None):
+        self.workbook_limits = workbook_limits
+        self.control_path = control_path
+        self.limits = workbook_limits
+        self.read_bucket = TokenBucket()
+        self.write_bucket = TokenBucket()
+        self.compress_writer = None
+        self.control_mtime = None
+        self.control_error = None
+        self.suspended = False
+        self.poll_time = 0.0
+        self.start_time = time.monotonic()
+        self.apply_limits(self.current_limits())
+
+    def current_limits(self):
+        """ Return the workbook caps overridden by the control file, or no caps while suspended """
+        if throttling_suspended.is_set():
+            return ThrottleLimits()
+        if self.control_path is None:
+            return self.workbook_limits
+        try:
+            control_caps = read_control_file(self.control_path)
+        except (OSError, ValueError) as ex:
+            # a control file being edited keeps the caps in place until it reads again
+            self.control_error = ex
+            return self.limits
+        self.control_error = None
+        return ThrottleLimits(**{attribute: control_caps.get(attribute, getattr(self.workbook_limits, attribute))
+                                 for attribute in ThrottleLimits.__slots__})
+
+    def apply_limits(self, limits):
+        self.limits = limits
+        self.suspended = throttling_suspended.is_set()
+        self.read_bucket.set_rate(limits.read_mbs * MB if limits.read_mbs else None)
+        self.write_bucket.set_rate(limits.write_mbs * MB if limits.write_mbs else None)
+        if self.compress_writer is not None and hasattr(self.compress_writer, "set_workers"):
+            self.compress_writer.set_workers(limits.compress_threads)
+
+    def poll(self):
+        """ Apply the control file when it has changed, at most once a second unless a signal asked for it """
+        now = time.monotonic()
+        if now - self.poll_time < CONTROL_POLL_SECONDS and not reload_requested.is_set():
+            return
+        self.poll_time = now
+        try:
+            control_mtime = os.stat(self.control_path).st_mtime_ns if self.control_path is not None else None
+        except OSError:
+            control_mtime = None
+        if reload_requested.is_set() or control_mtime != self.control_mtime or \
+                self.suspended != throttling_suspended.is_set():
+            reload_requested.clear()
+            self.control_mtime = control_mtime
+            self.apply_limits(self.current_limits())
+
+    def set_compressor(self, archive_out):
+        """ Let the compression threads of a writer be changed while it writes, when its codec allows it """
+        self.compress_writer = archive_out
+        self.apply_limits(self.limits)
+
+    def compress_threads(self, requested_threads):
+        """ Return the number of compression threads of the archive, requested_threads capped """
+        if self.limits.compress_threads is None:
+            return requested_threads
+        return min(requested_threads or os.cpu_count() or 1, self.limits.compress_threads)
+
+    def reader(self, fileobj):
+        return ThrottledFile(fileobj, self.read_bucket, self)
+
+    def writer(self, fileobj):
+        return ThrottledFile(fileobj, self.write_bucket, self)
+
+    def report(self):
+        """ Return the throughput achieved by the archive against its caps """
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        return f'read {self.read_bucket.consumed_bytes / MB:.1f} MB at ' \
+               f'{self.read_bucket.consumed_bytes / MB / elapsed:.1f} MB/s ' \
+               f'(cap {format_cap(self.limits.read_mbs, "MB/s")}, throttled {self.read_bucket.waited_seconds:.1f}s), ' \
+               f'wrote {self.write_bucket.consumed_bytes / MB:.1f} MB at ' \
+               f'{self.write_bucket.consumed_bytes / MB / elapsed:.1f} MB/s ' \
+               f'(cap {format_cap(self.limits.write_mbs, "MB/s")}, ' \
+               f'throttled {self.write_bucket.waited_seconds:.1f}s), ' \
+               f'compress threads {format_cap(self.limits.compress_threads, "")}'
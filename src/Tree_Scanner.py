@@ -0,0 +1,123 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import Metadata_Catalog as md_catalog
+
+""" This package contains a directory tree scanner reading independent subtrees in a pool of threads"""
+
+# directories whose path contains one of these is skipped along with everything below it
+SKIP_NAMES = ("Trash", "lost+found")
+
+
+def scan_dir(dirpath):
+    """
+    This function lists one directory with a single scandir. Entries are sorted by their DirEntry
+    type, which comes from the directory listing itself, so no entry is stat'ed.
+    :param dirpath: directory to list
+    :return: tuple of dirpath, subdirectory names, file names and symlink names
+    """
+    dirnames = []
+    filenames = []
+    linknames = []
+    try:
+        with os.scandir(dirpath) as dir_scan:
+            for dir_entry in dir_scan:
+                if dir_entry.is_symlink():
+                    linknames.append(dir_entry.name)
+                elif dir_entry.is_dir(follow_symlinks=False):
+                    dirnames.append(dir_entry.name)
+                else:
+                    filenames.append(dir_entry.name)
+    except OSError:
+        # unreadable directories are skipped, as os.walk does without onerror
+        pass
+    return dirpath, dirnames, filenames, linknames
+
+
+def scan_cataloged_dir(metadata_catalog, dirpath):
+    """
+    This function lists one directory through the metadata catalog, which only reads the
+    directory again when its mtime changed since it was cataloged
+    :return: tuple of dirpath, subdirectory names, file names and symlink names
+    """
+    dirnames = []
+    filenames = []
+    linknames = []
+    try:
+        _, dir_entries = metadata_catalog.list_dir(dirpath)
+    except OSError:
+        return dirpath, dirnames, filenames, linknames
+    for name, kind, _, _, _ in dir_entries:
+        if kind == md_catalog.KIND_LINK:
+            linknames.append(name)
+        elif kind == md_catalog.KIND_DIR:
+            dirnames.append(name)
+        else:
+            filenames.append(name)
+    return dirpath, dirnames, filenames, linknames
+
+
+class TreeScanner:
+    """
+        This class walks a directory tree top down, listing the directories of independent
+        subtrees in parallel threads. The depth limit and the skip names are applied while
+        descending, so pruned subtrees are never read, and directories are yielded as soon
+        as they are listed rather than once the whole tree is known.
+
+    Args
+        Required: none
+        Optional: workers, skip_names, metadata_catalog
+
+    Logging: none
+
+    """
+
+    __author__ = "Barry Onizak"
+    __version__ = "20261018.1"
+    # # # # # End of header # # # #
+
+    def __init__(self, workers=None, skip_names=SKIP_NAMES, metadata_catalog=None):
+        self.workers = workers
+        self.skip_names = tuple(skip_names)
+        self.metadata_catalog = metadata_catalog
+
+    def list_dir(self, dirpath):
+        """ List one directory, through the metadata catalog when there is one """
+        if self.metadata_catalog is not None:
+            return scan_cataloged_dir(self.metadata_catalog, dirpath)
+        return scan_dir(dirpath)
+
+    def skipped(self, path):
+        """ Return True when a path contains one of the skip names """
+        return any(skip_name in path for skip_name in self.skip_names)
+
+    def scan(self, root_path, max_depth=-1):
+        """
+        This method yields every directory of a tree, in no particular order. Symlinks are
+        neither followed nor listed, and skipped directories are left out with their subtrees.
+        :param root_path: directory to scan
+        :param max_depth: number of levels below root_path to list, negative for no limit
+        :return: yield tuples of dirpath, subdirectory names and file names
+        """
+        root_path = str(root_path)
+        if not os.path.isdir(root_path) or self.skipped(root_path):
+            return
+        if self.metadata_catalog is not None:
+            self.metadata_catalog.preload_subtree(root_path)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            running_scans = {executor.submit(self.list_dir, root_path): 0}
+            while running_scans:
+                done_scans, _ = wait(running_scans, return_when=FIRST_COMPLETED)
+                for done_scan in done_scans:
+                    dir_depth = running_scans.pop(done_scan)
+                    dirpath, dirnames, filenames, _ = done_scan.result()
+                    dirnames = [dirname for dirname in dirnames
+                                if not self.skipped(os.path.join(dirpath, dirname))]
+                    if max_depth < 0 or dir_depth < max_depth:
+                        for dirname in dirnames:
+                            subdir_scan = executor.submit(self.list_dir, os.path.join(dirpath, dirname))
+                            running_scans[subdir_scan] = dir_depth + 1
+                    yield dirpath, dirnames, filenames
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
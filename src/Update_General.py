@@ -1,9 +1,8 @@
 import fnmatch
 import os
-import shutil
 import sys
 
-from openpyxl import load_workbook
+import Run_Metrics as run_metrics
 from CommonOs import OsServices as os_services
 
 
@@ -26,26 +25,26 @@ class UpdateGeneral(os_services):
     def Collect_General_Files(self):
         """
         This method collects the non-user files list in the GeneralList sheet
-         and copies them into a $HOME/Documents/General folder
-        :return:
+         and copies them into a $HOME/Documents/General folder. Files unchanged since
+         the last run are skipped and the others are copied in parallel.
+        :return: number of files copied or already up to date
         """
+        run_metric = run_metrics.RunMetric("upd_general", "General")
         General_AoD = self.extract_GeneralList()
-        copy_count = 0
+        copy_pairs = []
 
         for index in range(len(General_AoD)):
             for key in General_AoD[index]:
                 if key == "SourceFile_FolderName" and "*" in General_AoD[index]["SourceFile_FolderName"]:
                     ff_dirname = os.path.dirname(General_AoD[index]["SourceFile_FolderName"])
                     ff_basename = os.path.basename(General_AoD[index]["SourceFile_FolderName"])
-                    os_services.debug(self, f' Scan for {ff_basename} in Folder {ff_dirname}')
+                    os_services.debug(self, ' Scan for %s in Folder %s', ff_basename, ff_dirname)
                     if os.path.exists(ff_dirname):
                         for file in os.listdir(ff_dirname):
-                            if fnmatch.fnmatch(file, ff_basename):
-                                os_services.debug(self, f' Copying {file} into {General_AoD[index]["TargetFolder"]}')
-                                if not os.path.exists(General_AoD[index]["TargetFolder"]):
-                                    os.makedirs(General_AoD[index]["TargetFolder"])
-                                shutil.copy(os.path.join(ff_dirname, file), General_AoD[index]["TargetFolder"])
-                                copy_count += 1
+                            if fnmatch.fnmatch(file, ff_basename) and os.path.isfile(os.path.join(ff_dirname, file)):
+                                os_services.file_debug(self, ' Copying %s into %s', file,
+                                                       General_AoD[index]["TargetFolder"])
+                                copy_pairs.append((os.path.join(ff_dirname, file), General_AoD[index]["TargetFolder"]))
                     else:
                         os_services.critical(self, f'{ff_dirname} does not exist.')
                 elif key == "SourceFile_FolderName" and os.path.isdir(General_AoD[index]["SourceFile_FolderName"]):
@@ -54,36 +53,39 @@ class UpdateGeneral(os_services):
                     os_services.debug(self, f' Scan for all files in Folder '
                                             f'{General_AoD[index]["SourceFile_FolderName"]}')
                     for file in os.listdir(General_AoD[index]["SourceFile_FolderName"]):
-                        os_services.debug(self, f' Copying {file} into {General_AoD[index]["TargetFolder"]}')
-                        if not os.path.exists(General_AoD[index]["TargetFolder"]):
-                            os.makedirs(General_AoD[index]["TargetFolder"])
-                        shutil.copy2(os.path.join(General_AoD[index]["SourceFile_FolderName"], file),
-                                     General_AoD[index]["TargetFolder"])
-                        copy_count += 1
+                        if os.path.isfile(os.path.join(General_AoD[index]["SourceFile_FolderName"], file)):
+                            os_services.file_debug(self, ' Copying %s into %s', file,
+                                                   General_AoD[index]["TargetFolder"])
+                            copy_pairs.append((os.path.join(General_AoD[index]["SourceFile_FolderName"], file),
+                                               General_AoD[index]["TargetFolder"]))
                 elif key == "SourceFile_FolderName" and os.path.isfile(General_AoD[index]["SourceFile_FolderName"]):
-                    os_services.debug(self, f' Copying {General_AoD[index]["SourceFile_FolderName"]} into '
-                                            f'{General_AoD[index]["TargetFolder"]}')
-                    if not os.path.exists(General_AoD[index]["TargetFolder"]):
-                        os.makedirs(General_AoD[index]["TargetFolder"])
-                    shutil.copy(General_AoD[index]["SourceFile_FolderName"],
-                                General_AoD[index]["TargetFolder"])
-                    copy_count += 1
-        os_services.info(self, f' Copied {copy_count} files.')
-        return copy_count
+                    os_services.file_debug(self, ' Copying %s into %s', General_AoD[index]["SourceFile_FolderName"],
+                                           General_AoD[index]["TargetFolder"])
+                    copy_pairs.append((General_AoD[index]["SourceFile_FolderName"],
+                                       General_AoD[index]["TargetFolder"]))
+
+        import File_Copier as file_copier
+        copy_stats = file_copier.FileCopier(compare_hash=getattr(self.args, "hash_compare", False)) \
+            .copy_files(copy_pairs)
+        for source_path, ose in copy_stats.errors:
+            os_services.error(self, f' {source_path} was not copied. {ose}')
+        os_services.info(self, f' General files {copy_stats}.')
+        run_metric.files = copy_stats.copied + copy_stats.skipped
+        run_metric.bytes_read = run_metric.bytes_written = copy_stats.copied_bytes
+        self.record_metric(run_metric.finish(0 if copy_stats.failed == 0 else 1))
+        return copy_stats.copied + copy_stats.skipped
 
     def extract_GeneralList(self):
         resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resource")
-        wb = load_workbook(os.path.join(resource_path, "BackupList.xlsx"))
         sheetset = {'GeneralList': 4}
 
         GeneralList_AoD = []
 
-        for ws in wb:
-            if ws.title in sheetset.keys():
-                worksheet = wb[ws.title]
+        for sheet_title in sheetset.keys():
+            if sheet_title in self.config_sheet_titles():
 
-                row_sets = [worksheetsets for worksheetsets in worksheet.iter_rows(
-                    min_row=2, max_col=sheetset[ws.title], min_col=1, values_only=True)
+                row_sets = [worksheetsets for worksheetsets in self.config_sheet_rows(
+                    sheet_title, sheetset[sheet_title])
                             if None not in worksheetsets]
 
                 if len(row_sets) == 0:
@@ -93,7 +95,7 @@ class UpdateGeneral(os_services):
                     row_set_count = 0
                     for row_set in row_sets:
                         row_set_dict = {}
-                        if worksheet.title == "GeneralList":
+                        if sheet_title == "GeneralList":
                             for index in range(len(row_set)):
                                 if index == 0:
                                     row_set_dict["Index"] = row_set_count
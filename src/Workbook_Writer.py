@@ -0,0 +1,206 @@
+import itertools
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+""" This package contains the streaming writer replacing the data columns of one sheet of an xlsx workbook"""
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+ROW_PATTERN = re.compile(rb'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.DOTALL)
+CELL_PATTERN = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.DOTALL)
+ROW_NUMBER_PATTERN = re.compile(rb'\br="(\d+)"')
+CELL_REF_PATTERN = re.compile(rb'\br="([A-Z]+)\d+"')
+CELL_STYLE_PATTERN = re.compile(rb'\bs="(\d+)"')
+SPANS_PATTERN = re.compile(rb'\s+spans="[^"]*"')
+DIMENSION_PATTERN = re.compile(rb'<dimension\b[^>]*/>')
+# rows written to the zip member at a time
+WRITE_BATCH = 4096
+
+
+def column_letter(column_number):
+    """ Return the letters of a 1-based column number, 1 is A, 27 is AA """
+    letters = ""
+    while column_number > 0:
+        column_number, remainder = divmod(column_number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_number(letters):
+    """ Return the 1-based column number of column letters """
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def sheet_member(workbook_zip, sheet_title):
+    """ Return the zip member name holding a sheet, found through workbook.xml and its relationships """
+    workbook_xml = ElementTree.fromstring(workbook_zip.read("xl/workbook.xml"))
+    rels_xml = ElementTree.fromstring(workbook_zip.read("xl/_rels/workbook.xml.rels"))
+    for sheet in workbook_xml.iter(f'{{{MAIN_NS}}}sheet'):
+        if sheet.get("name") == sheet_title:
+            sheet_rid = sheet.get(f'{{{REL_NS}}}id')
+            for relationship in rels_xml.iter(f'{{{PKG_REL_NS}}}Relationship'):
+                if relationship.get("Id") == sheet_rid:
+                    target = relationship.get("Target")
+                    if target.startswith("/"):
+                        return target.lstrip("/")
+                    return posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(f'Sheet {sheet_title} is not in the workbook')
+
+
+def cell_xml(cell_ref, value, style):
+    """
+    Return the xml of one written cell. Strings are written inline so sharedStrings is left as it is,
+    strings starting with = are written as formulas.
+    """
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, bool):
+        return f'<c r="{cell_ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{cell_ref}"{style_attr} t="n"><v>{value}</v></c>'
+    if isinstance(value, str) and value.startswith("=") and len(value) > 1:
+        # read back as formulas, as openpyxl returns them
+        return f'<c r="{cell_ref}"{style_attr}><f>{escape(value[1:])}</f></c>'
+    return f'<c r="{cell_ref}"{style_attr} t="inlineStr">' \
+           f'<is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def replace_sheet_columns(workbook_path, sheet_title, first_column, header, rows):
+    """
+    This function replaces the data of a block of columns of one sheet in a single streamed write.
+    Row 1 gets the header and the rows follow from row 2, with no limit on their number; cells of
+    those columns below the last row are cleared. Other columns, including formulas, styles and
+    the other sheets, are copied as they are. The workbook is replaced atomically.
+    :param workbook_path: xlsx workbook to update
+    :param sheet_title: sheet to write
+    :param first_column: 1-based number of the first written column
+    :param header: list of the column titles, which sets the number of written columns
+    :param rows: iterable of row tuples, in column order
+    :return: number of rows written below the header
+    """
+    written_columns = set(range(first_column, first_column + len(header)))
+    workbook_tmp = f'{workbook_path}.{os.getpid()}.tmp'
+    written_count = 0
+    try:
+        with zipfile.ZipFile(workbook_path) as workbook_in, \
+                zipfile.ZipFile(workbook_tmp, "w", zipfile.ZIP_DEFLATED) as workbook_out:
+            sheet_name = sheet_member(workbook_in, sheet_title)
+            for member in workbook_in.infolist():
+                if member.filename != sheet_name:
+                    with workbook_in.open(member) as member_in, workbook_out.open(member, "w") as member_out:
+                        shutil.copyfileobj(member_in, member_out)
+                    continue
+                sheet_xml = workbook_in.read(member)
+                # a bare ZipInfo is stored uncompressed, the rewritten sheet is deflated like the workbook
+                sheet_info = zipfile.ZipInfo(member.filename, member.date_time)
+                sheet_info.compress_type = zipfile.ZIP_DEFLATED
+                with workbook_out.open(sheet_info, "w") as sheet_out:
+                    written_count = write_sheet(sheet_xml, sheet_out, first_column, written_columns,
+                                                [header], rows)
+        os.replace(workbook_tmp, workbook_path)
+    finally:
+        if os.path.exists(workbook_tmp):
+            os.remove(workbook_tmp)
+    return written_count
+
+
+def write_sheet(sheet_xml, sheet_out, first_column, written_columns, header_rows, rows):
+    """
+    This function merges the existing rows of a sheet with the rows being written, in row order.
+    The dimension element is optional and left out, the row count is not known until the end.
+    :return: number of data rows written
+    """
+    sheet_data_start = sheet_xml.find(b'<sheetData')
+    sheet_data_open_end = sheet_xml.find(b'>', sheet_data_start) + 1
+    if sheet_xml[sheet_data_open_end - 2:sheet_data_open_end] == b'/>':
+        sheet_prefix = sheet_xml[:sheet_data_open_end - 2] + b'>'
+        existing_rows = b''
+        sheet_suffix = b'</sheetData>' + sheet_xml[sheet_data_open_end:]
+    else:
+        sheet_data_end = sheet_xml.find(b'</sheetData>', sheet_data_open_end)
+        sheet_prefix = sheet_xml[:sheet_data_open_end]
+        existing_rows = sheet_xml[sheet_data_open_end:sheet_data_end]
+        sheet_suffix = sheet_xml[sheet_data_end:]
+
+    new_rows = enumerate(itertools.chain(header_rows, rows), start=1)
+    next_new = next(new_rows, None)
+    written_rows = 0
+    output_rows = []
+
+    sheet_out.write(DIMENSION_PATTERN.sub(b'', sheet_prefix, count=1))
+    row_number = 0
+    for row_match in ROW_PATTERN.finditer(existing_rows):
+        row_attrs, row_body = row_match.group(1), row_match.group(2) or b''
+        # r is optional, a row without it follows the previous one
+        row_number_match = ROW_NUMBER_PATTERN.search(row_attrs)
+        row_number = int(row_number_match.group(1)) if row_number_match else row_number + 1
+        if not row_number_match:
+            row_attrs = f' r="{row_number}"'.encode() + row_attrs
+        while next_new is not None and next_new[0] < row_number:
+            output_rows.append(row_xml(next_new[0], first_column, next_new[1]))
+            written_rows += 1
+            next_new = next(new_rows, None)
+
+        kept_cells = []
+        cell_styles = {}
+        cell_column = 0
+        for cell_match in CELL_PATTERN.finditer(row_body):
+            cell_ref_match = CELL_REF_PATTERN.search(cell_match.group(1))
+            cell_column = column_number(cell_ref_match.group(1).decode()) if cell_ref_match else cell_column + 1
+            if cell_column in written_columns:
+                style_match = CELL_STYLE_PATTERN.search(cell_match.group(1))
+                if style_match:
+                    cell_styles[cell_column] = style_match.group(1).decode()
+            else:
+                kept_cells.append((cell_column, cell_match.group(0).decode("utf-8")))
+        row_values = None
+        if next_new is not None and next_new[0] == row_number:
+            row_values = next_new[1]
+            written_rows += 1
+            next_new = next(new_rows, None)
+        # rows left with no cells were only holding stale values of the written columns
+        if kept_cells or cell_styles or row_values is not None:
+            output_rows.append(row_xml(row_number, first_column, row_values, cell_styles,
+                                       SPANS_PATTERN.sub(b'', row_attrs).decode("utf-8"), kept_cells))
+        if len(output_rows) >= WRITE_BATCH:
+            sheet_out.write("".join(output_rows).encode("utf-8"))
+            output_rows.clear()
+
+    while next_new is not None:
+        output_rows.append(row_xml(next_new[0], first_column, next_new[1]))
+        written_rows += 1
+        next_new = next(new_rows, None)
+        if len(output_rows) >= WRITE_BATCH:
+            sheet_out.write("".join(output_rows).encode("utf-8"))
+            output_rows.clear()
+    sheet_out.write("".join(output_rows).encode("utf-8"))
+    sheet_out.write(sheet_suffix)
+    return written_rows - len(header_rows)
+
+
+def row_xml(row_number, first_column, row_values, cell_styles=None, row_attrs=None, kept_cells=()):
+    """ Return the xml of one row, its kept cells and written cells in column order """
+    row_cells = list(kept_cells)
+    cleared_styles = dict(cell_styles or {})
+    if row_values is not None:
+        for column_offset, value in enumerate(row_values):
+            cell_column = first_column + column_offset
+            if value is not None:
+                row_cells.append((cell_column, cell_xml(f'{column_letter(cell_column)}{row_number}', value,
+                                                        cleared_styles.pop(cell_column, None))))
+    # cleared cells keep their formatting, as they would in Calc
+    for cell_column, style in cleared_styles.items():
+        row_cells.append((cell_column, f'<c r="{column_letter(cell_column)}{row_number}" s="{style}"/>'))
+    row_cells.sort(key=lambda row_cell: row_cell[0])
+    if row_attrs is None:
+        row_attrs = f' r="{row_number}"'
+    return f'<row{row_attrs}>{"".join(cell for _, cell in row_cells)}</row>'